@@ -1,11 +1,56 @@
 # ----------------------------------------------- Relevant Librarires -----------------------------------------------
 
+import uuid
+
 import streamlit as st
-import plistlib
-import pandas as pd
-from bs4 import BeautifulSoup
 
-from utils import divider_color, remove_emojis, order_processor, display_order, display_split
+# Heavy parsing dependencies (BeautifulSoup, lxml, numpy) are only imported by
+# utils once a file is uploaded
+from utils import (
+    divider_color,
+    remove_emojis,
+    dedupe_items,
+    display_order,
+    display_split,
+    LRUCache,
+    ParseCache,
+    receipt_hash,
+    receipts_hash,
+    merge_orders,
+    source_labels,
+    is_receipt,
+    load_receipt,
+    ReceiptFormatError,
+    allocation_widgets,
+    PARSE_CACHE_MAX_ENTRIES,
+    PARSE_CACHE_TTL,
+    EXPORT_CACHE_MAX_ENTRIES,
+    EXPORT_CACHE_TTL,
+    ParsePool,
+    PARSE_WORKERS,
+    PARSE_BACKGROUND_MIN_BYTES,
+    CANCELLED_PARSE_KEY,
+    display_parse_progress,
+    display_parse_cancelled,
+    ThumbnailCache,
+    THUMBNAIL_SIZE,
+    THUMBNAIL_CACHE_DIR,
+    THUMBNAIL_CACHE_MAX_BYTES,
+    THUMBNAIL_IMAGE_HOSTS,
+    IMAGE_HOSTS,
+    AllocationStore,
+    autosave_key,
+    AUTOSAVE_PATH,
+    AUTOSAVE_MAX_AGE,
+    AssignmentHistory,
+    HISTORY_PATH,
+    HISTORY_FUZZY_THRESHOLD,
+    STORES,
+    start_timeline,
+    span,
+    debug_enabled,
+    display_timings,
+)
 
 st.set_page_config(
     page_title="Grocery Splitter",
@@ -14,6 +59,13 @@ st.set_page_config(
     initial_sidebar_state="collapsed",
 )
 
+# Time every stage of this rerun
+st.session_state["run_count"] = st.session_state.get("run_count", 0) + 1
+timeline = start_timeline(run_id=st.session_state["run_count"])
+
+# Identifies this browser session to the shared parse worker pool
+session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+
 # Remove whitespace from the top of the page and sidebar
 st.markdown(
     """
@@ -111,6 +163,52 @@ st.markdown(
 )
 
 
+# ----------------------------------------------- Shared Resources -----------------------------------------------
+
+
+@st.cache_resource
+def get_parse_cache() -> ParseCache:
+    """Parsed receipts shared by every session, keyed by content hash."""
+    return ParseCache(max_entries=PARSE_CACHE_MAX_ENTRIES, ttl=PARSE_CACHE_TTL)
+
+
+@st.cache_resource
+def get_export_cache() -> LRUCache:
+    """CSV and PDF exports of splits shared by every session, keyed by allocation state."""
+    return LRUCache(max_entries=EXPORT_CACHE_MAX_ENTRIES, ttl=EXPORT_CACHE_TTL)
+
+
+@st.cache_resource
+def get_parse_pool() -> ParsePool:
+    """Worker processes parsing large receipts for every session; started on first use."""
+    return ParsePool(max_workers=PARSE_WORKERS)
+
+
+@st.cache_resource
+def get_thumbnail_cache() -> ThumbnailCache:
+    """Product image thumbnails shared by every session, stored on disk."""
+    return ThumbnailCache(
+        THUMBNAIL_CACHE_DIR,
+        max_bytes=THUMBNAIL_CACHE_MAX_BYTES,
+        size=THUMBNAIL_SIZE,
+        allowed_hosts=THUMBNAIL_IMAGE_HOSTS or IMAGE_HOSTS,
+    )
+
+
+@st.cache_resource
+def get_autosave() -> AllocationStore:
+    """In-progress splits shared by every session, saved in SQLite."""
+    store = AllocationStore(AUTOSAVE_PATH)
+    store.prune(AUTOSAVE_MAX_AGE)
+    return store
+
+
+@st.cache_resource
+def get_history() -> AssignmentHistory:
+    """Buyers remembered from past splits, used to pre-fill new ones."""
+    return AssignmentHistory(HISTORY_PATH, fuzzy_threshold=HISTORY_FUZZY_THRESHOLD)
+
+
 # ----------------------------------------------- Main Page -----------------------------------------------
 
 
@@ -154,23 +252,18 @@ if raw_names:
     elif len(names) > 0:
         st.markdown("<br/><br/>", unsafe_allow_html=True)
 
-        stores = [
-            "&nbsp; ![Asda Logo](https://upload.wikimedia.org/wikipedia/commons/thumb/9/91/Asda_logo.svg/250px-Asda_logo.svg.png) &nbsp; &nbsp;",
-            "&nbsp; ![Tesco Logo](https://upload.wikimedia.org/wikipedia/commons/2/23/Tesco_logo.png) &nbsp; &nbsp;",
-        ]
+        # The store is detected from the uploaded file itself
+        st.write("Supported stores:")
+        st.markdown(" ".join(STORES))
 
-        store_choice = st.radio(
-            "Select the store to upload your order",
-            stores,
-            horizontal=True,
-        )
-        
         st.markdown("<br/>", unsafe_allow_html=True)
 
-        # File uploader
-        uploaded_file = st.file_uploader(
-            "Upload your file containing the orders from ASDA here",
-            type=["html", "webarchive"],
+        # File uploader; several deliveries, even from different stores, are split together.
+        # Receipt files downloaded from a previous split load without parsing any HTML
+        uploaded_files = st.file_uploader(
+            "Upload your files containing the orders from ASDA or Tesco here",
+            type=["html", "webarchive", "json"],
+            accept_multiple_files=True,
         )
 
         st.markdown("<br/>", unsafe_allow_html=True)
@@ -178,7 +271,7 @@ if raw_names:
         # Steps inside a toggle
         with st.expander("&nbsp; &nbsp; How to Download Your Order List", icon=":material/download:"):
             st.divider()
-            st.write("Follow the steps below to download your order list from ASDA:")
+            st.write("Follow the steps below to download your order list from your store:")
             steps = [
                 "Go to the stores website and log in to your account.",
                 "Navigate to the 'Orders' section.",
@@ -191,34 +284,145 @@ if raw_names:
             for i, step in enumerate(steps, start=1):
                 st.markdown(f"&nbsp; &nbsp; &nbsp; **Step {i}:** &nbsp; {step}")
 
-        if uploaded_file:
-            with st.spinner("Processing the uploaded file..."):
-                # if the file is a webarchive file
-                if uploaded_file.type == "application/x-webarchive":
-                    webarchive = plistlib.load(uploaded_file)
-                    data = webarchive.get("WebMainResource", {}).get("WebResourceData")
-
-                    # Decode and print
-                    html = data.decode("utf-8", errors="replace")
-                    soup = BeautifulSoup(html, "html.parser")
-
-                else:
-                    soup = BeautifulSoup(uploaded_file, "html.parser")
-                
-                items = order_processor(store_choice, soup, stores)
-                
+        if uploaded_files:
+            with span("upload", files=len(uploaded_files), bytes=sum(f.size for f in uploaded_files)):
+                receipts = {}
+                for source, uploaded_file in zip(source_labels([f.name for f in uploaded_files]), uploaded_files):
+                    # A view of the upload buffer; nothing is copied until parsing
+                    data = uploaded_file.getbuffer()
+                    key = receipt_hash(data)
+                    if key in receipts:
+                        st.warning(
+                            f"&nbsp; {uploaded_file.name} is the same order as {receipts[key][0]}; it is only counted once.",
+                            icon=":material/warning:",
+                        )
+                        continue
+                    receipts[key] = (source, data, uploaded_file.type == "application/x-webarchive")
+
+            # Receipt files saved from the app hold the items already
+            with span("load", files=len(receipts)) as load_span:
+                saved = {}
+                for key, (source, data, _) in receipts.items():
+                    if is_receipt(data):
+                        try:
+                            saved[key] = get_parse_cache().get_or_parse(("receipt", key), lambda: load_receipt(data))
+                        except ReceiptFormatError as e:
+                            st.error(f"&nbsp; {source}: {e}", icon=":material/error:")
+                            saved[key] = None
+                load_span["receipts"] = len(saved)
+
+            # Reruns and repeated uploads reuse the already extracted items
+            with span("parse", files=len(receipts) - len(saved)) as parse_span:
+                parsed = {key: receipt.items for key, receipt in saved.items() if receipt is not None}
+                cancelled = st.session_state.get(CANCELLED_PARSE_KEY, set())
+                for key in receipts:
+                    if key not in cancelled and key not in saved:
+                        parsed[key] = get_parse_cache().get(key)
+
+                misses = [key for key, items in parsed.items() if items is None]
+                parse_span["misses"] = len(misses)
+
+                # Large receipts are queued on the shared worker pool first, so they
+                # parse side by side with each other and with the small ones read here.
+                # Web archives are read in place and only their HTML goes to the worker.
+                jobs = {
+                    key: get_parse_pool().submit(key, receipts[key][1], receipts[key][2], waiter=session_id)
+                    for key in misses
+                    if len(receipts[key][1]) >= PARSE_BACKGROUND_MIN_BYTES
+                }
+                inline = [key for key in misses if key not in jobs]
+                if inline:
+                    with st.spinner("Processing the uploaded files..."):
+                        from utils import parse_receipt
+
+                        for key in inline:
+                            parsed[key] = parse_receipt(receipts[key][1], receipts[key][2])
+                            get_parse_cache().put(key, parsed[key])
+
+                if jobs:
+                    results = display_parse_progress({receipts[key][0]: job for key, job in jobs.items()}, session_id)
+                    for key in jobs:
+                        parsed[key] = results[receipts[key][0]]
+                        if parsed[key] is not None:
+                            get_parse_cache().put(key, parsed[key])
+
+                # Cancelled receipts are left out of the split until they are read after all
+                for key, (source, _, _) in receipts.items():
+                    if parsed.get(key) is None and key in st.session_state.get(CANCELLED_PARSE_KEY, set()):
+                        if display_parse_cancelled(key, source if len(receipts) > 1 else ""):
+                            st.rerun()
+
+                orders = [(receipts[key][0], items) for key, items in parsed.items() if items is not None]
+                if len(orders) > 1:
+                    for source, order_items in orders:
+                        if not order_items:
+                            st.warning(f"&nbsp; No items found in {source}.", icon=":material/warning:")
+                parse_span["items"] = sum(len(items) for _, items in orders)
+
+            items = None
+            if orders:
+                with span("dedupe") as dedupe_span:
+                    # Items are tagged with their order, and duplicates are only dropped within an order
+                    items = dedupe_items(merge_orders(orders))
+                    dedupe_span["items"] = len(items)
 
             if items:
-                items = pd.DataFrame(items)
-                # ignore duplicate items
-                items = items.drop_duplicates(subset=["name", "weight"], keep="first").reset_index(drop=True)
-                
-                st.markdown("<br/><br/>", unsafe_allow_html=True)
-                split = display_order(items, names)
-                display_split(split, items)
+                # The same orders uploaded together, in the same order, are the same split
+                receipt_key = receipts_hash([key for key, items in parsed.items() if items is not None])
+
+                # Store of each order, kept in the receipt file the split can be downloaded as
+                split_orders = []
+                for key, order_items in parsed.items():
+                    if order_items is None:
+                        continue
+                    source = receipts[key][0]
+                    if saved.get(key) is not None:
+                        stores = {order["store"] for order in saved[key].orders}
+                        if len(orders) == 1:
+                            split_orders = [(order["source"], order["store"]) for order in saved[key].orders]
+                            continue
+                        split_orders.append((source, stores.pop() if len(stores) == 1 else ""))
+                    else:
+                        from utils import detect_store
+
+                        store = get_parse_cache().get_or_parse(
+                            ("store", key), lambda: detect_store(receipts[key][1], receipts[key][2])
+                        )
+                        split_orders.append((source, store))
+
+                # A single receipt file brings back who bought what, where autosave has nothing newer
+                preset = None
+                order_keys = [key for key, order_items in parsed.items() if order_items is not None]
+                if len(order_keys) == 1 and saved.get(order_keys[0]) is not None:
+                    preset = allocation_widgets(saved[order_keys[0]].allocations, items, names)
 
-            else:
+                st.markdown("<br/><br/>", unsafe_allow_html=True)
+                # Allocations are saved per receipt and group of people, and
+                # restored when the same receipt is split by them again; other
+                # splits start pre-filled with who bought each item last time
+                with span("render_order", items=len(items), people=len(names), orders=len(orders)):
+                    display_order(
+                        items,
+                        names,
+                        autosave_key(receipt_key, names),
+                        get_thumbnail_cache(),
+                        get_autosave(),
+                        get_history(),
+                        preset,
+                    )
+                with span("render_split"):
+                    display_split(items, names, get_history(), get_export_cache(), split_orders)
+
+            # Nothing to show when every receipt was cancelled
+            elif orders:
                 st.info(
                     "&nbsp; No items found. Please upload a valid order receipt.",
                     icon=":material/info:",
-                )
\ No newline at end of file
+                )
+
+
+# ----------------------------------------------- Debug Panel -----------------------------------------------
+
+
+if debug_enabled():
+    display_timings(timeline)
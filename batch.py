@@ -0,0 +1,240 @@
+# ----------------------------------------------- Relevant Librarires -----------------------------------------------
+
+import os
+import sys
+import csv
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+
+from utils import (
+    STORE_KEYS,
+    parse_receipt,
+    detect_store,
+    load_receipt,
+    dump_receipt,
+    ReceiptFormatError,
+    RECEIPT_EXTENSION,
+    dedupe_items,
+    mapped_file,
+    load_rules,
+    apply_rules,
+    RuleMatcher,
+    compute_split,
+    settle_orders,
+    Transfer,
+    OrderItem,
+    MetricsRegistry,
+    collecting,
+    export_metrics,
+)
+
+# Other JSON files (rules, metrics...) often sit next to the receipts, so
+# directories only contribute saved receipts by their own suffix
+RECEIPT_EXTENSIONS = (".html", ".htm", ".webarchive", RECEIPT_EXTENSION)
+
+
+# ----------------------------------------------- Parsing -----------------------------------------------
+
+
+def quiet_logs() -> None:
+    """Keep per-file info logging from flooding stderr (also used as the worker initializer)"""
+    logging.getLogger("utils").setLevel(logging.WARNING)
+    logging.getLogger("grocery_splitter").setLevel(logging.WARNING)
+
+
+def parse_file(
+    path: str,
+    store: Optional[str] = None,
+) -> Tuple[str, List[OrderItem], str, Dict[int, Dict[str, float]], Dict[str, List[Any]]]:
+    """
+    Parse a single receipt file (runs inside a worker process)
+
+    Receipt files saved by the app or by --save-receipts are loaded as they
+    are, with the allocations they hold, without parsing any HTML.
+
+    Args:
+        path: Path to an .html, .webarchive or .json receipt
+        store: Store key, one of STORE_KEYS (None to auto-detect)
+
+    Returns:
+        Tuple of (path, de-duplicated order items, store key, saved allocations,
+        snapshot of the parse metrics). A .json file that is not a receipt
+        gives None instead of items, with the reason in place of the store key.
+    """
+    with collecting() as metrics:
+        if path.endswith(".json"):
+            try:
+                with open(path, "rb") as f:
+                    receipt = load_receipt(f.read())
+            except ReceiptFormatError as e:
+                return path, None, str(e), {}, {}
+            stores = {order["store"] for order in receipt.orders}
+            return path, receipt.items, stores.pop() if len(stores) == 1 else "", receipt.allocations, {}
+
+        is_webarchive = path.endswith(".webarchive")
+        with mapped_file(path) as data:
+            items = parse_receipt(data, is_webarchive, store)
+            detected = detect_store(data, is_webarchive) if items else ""
+    return path, dedupe_items(items), detected, {}, metrics.snapshot()
+
+
+def collect_receipts(paths: List[str]) -> List[str]:
+    """Expand directories into the receipt files they contain, in a stable order"""
+    receipts = []
+    for path in paths:
+        if os.path.isdir(path):
+            for entry in sorted(os.listdir(path)):
+                if entry.lower().endswith(RECEIPT_EXTENSIONS):
+                    receipts.append(os.path.join(path, entry))
+        else:
+            receipts.append(path)
+    return receipts
+
+
+# ----------------------------------------------- Output -----------------------------------------------
+
+
+def write_csv(out, orders: Dict[str, Dict[str, Any]], total: Dict[str, float], transfers: List[Transfer]) -> None:
+    """Write one row per order and person, followed by the aggregate rows and the transfers settling up"""
+    writer = csv.writer(out)
+    writer.writerow(["order", "person", "amount"])
+    for order, result in orders.items():
+        for person, amount in result["split"].items():
+            writer.writerow([order, person, f"{amount:.2f}"])
+        writer.writerow([order, "(unassigned)", f"{result['unassigned']:.2f}"])
+    for person, amount in total.items():
+        writer.writerow(["TOTAL", person, f"{amount:.2f}"])
+    for transfer in transfers:
+        writer.writerow(["SETTLE", f"{transfer.sender} -> {transfer.recipient}", f"{transfer.amount:.2f}"])
+
+
+def write_json(out, orders: Dict[str, Dict[str, Any]], total: Dict[str, float], transfers: List[Transfer]) -> None:
+    """Write every per-order split, the aggregate split and the transfers settling up as one JSON document"""
+    settlement = [
+        {"from": transfer.sender, "to": transfer.recipient, "amount": transfer.amount}
+        for transfer in transfers
+    ]
+    json.dump({"orders": orders, "total": total, "transfers": settlement}, out, indent=2)
+    out.write("\n")
+
+
+# ----------------------------------------------- Main -----------------------------------------------
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Parse grocery receipts in parallel and split them using an assignment rules file.",
+    )
+    parser.add_argument("receipts", nargs="+", help="Receipt files (.html / .webarchive / .json) or directories")
+    parser.add_argument("--store", choices=STORE_KEYS, help="Only accept receipts from this store (auto-detected by default)")
+    parser.add_argument("--rules", required=True, help="JSON rules file with names, rules and default buyers")
+    parser.add_argument("--format", choices=["csv", "json"], default="csv", help="Output format")
+    parser.add_argument("--output", "-o", help="Output file (defaults to stdout)")
+    parser.add_argument("--payer", help="Who paid for receipts the rules file lists no payer for")
+    parser.add_argument(
+        "--save-receipts",
+        metavar="DIR",
+        help="Also save each order, with its allocations, as a receipt file that loads without parsing",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="FILE",
+        help="Write parse metrics (rows seen and skipped, items, latency per parser) to a Prometheus text file",
+    )
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count(), help="Number of parser processes")
+    args = parser.parse_args(argv)
+
+    quiet_logs()
+
+    ruleset = load_rules(args.rules)
+    names = ruleset["names"]
+    if not names:
+        parser.error("the rules file must list the people to split between under 'names'")
+
+    receipts = collect_receipts(args.receipts)
+    if not receipts:
+        parser.error("no receipt files found")
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=quiet_logs) as pool:
+        parsed = list(pool.map(parse_file, receipts, [args.store] * len(receipts)))
+    elapsed = time.perf_counter() - start
+
+    # Compile the rules once for every order
+    matcher = RuleMatcher(ruleset["rules"])
+
+    orders = {}
+    total: Dict[str, float] = {name: 0.0 for name in names}
+    metrics = MetricsRegistry()
+    saved_names = set()
+    for path, items, store, saved, snapshot in parsed:
+        metrics.merge(snapshot)
+        if items is None:
+            print(f"Skipped {path}: {store}", file=sys.stderr)
+            continue
+        allocations = apply_rules(items, matcher, names, ruleset["default"])
+        # Allocations saved in a receipt file win over the rules
+        for idx, allocation in saved.items():
+            allocation = {person: quantity for person, quantity in allocation.items() if person in names}
+            if allocation and idx < len(allocations):
+                allocations[idx] = allocation
+        split = compute_split((item.price for item in items), allocations, names)
+        unassigned = sum(item.price for item, allocation in zip(items, allocations) if not allocation)
+
+        payer = ruleset["payers"].get(os.path.basename(path), args.payer)
+        orders[path] = {
+            "payer": payer,
+            "items": len(items),
+            "total": round(sum(item.price for item in items), 2),
+            "split": split,
+            "unassigned": round(float(unassigned), 2),
+        }
+        for person, amount in split.items():
+            total[person] = round(total[person] + amount, 2)
+
+        if args.save_receipts:
+            os.makedirs(args.save_receipts, exist_ok=True)
+            # The whole file name, so order.html and order.webarchive do not overwrite each other
+            source = os.path.basename(path)
+            if source.endswith(RECEIPT_EXTENSION):
+                source = source[:-len(RECEIPT_EXTENSION)]
+            name, n = source, 1
+            while name in saved_names:
+                n += 1
+                name = f"{source}-{n}"
+            saved_names.add(name)
+            with open(os.path.join(args.save_receipts, name + RECEIPT_EXTENSION), "wb") as f:
+                f.write(dump_receipt(items, [(name, store)], names, dict(enumerate(allocations))))
+
+    if args.metrics and not export_metrics(args.metrics, metrics):
+        print(f"Could not write metrics to {args.metrics}", file=sys.stderr)
+
+    # Net every order against who paid for it, over all the receipts
+    transfers = settle_orders(
+        (result["payer"], result["split"]) for result in orders.values() if result["payer"]
+    )
+
+    out = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+    try:
+        if args.format == "csv":
+            write_csv(out, orders, total, transfers)
+        else:
+            write_json(out, orders, total, transfers)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(
+        f"Parsed {len(receipts)} files in {elapsed:.2f}s "
+        f"({len(receipts) / elapsed:.1f} files/s, {args.jobs} workers)",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
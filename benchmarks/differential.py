@@ -0,0 +1,89 @@
+"""
+Check that the streaming extractor finds the same items as the tree parsers.
+
+Synthetic receipts of every format, as HTML and web archives, are parsed
+with each installed tree engine and with the "stream" engine over a range of
+sizes and seeds; receipt files given on the command line are checked too.
+The exit status is 1 when any engine disagrees.
+
+Usage:
+    python -m benchmarks.differential
+    python -m benchmarks.differential --sizes 10 1000 --seeds 5 order.html order.webarchive
+"""
+
+import sys
+import logging
+import argparse
+import importlib.util
+from typing import List
+
+from utils import OrderItem, parse_receipt
+from .synthetic import FORMATS, generate_receipt
+
+DEFAULT_SIZES = [0, 1, 10, 100, 1000]
+DEFAULT_SEEDS = 3
+
+
+def tree_engines() -> List[str]:
+    """Tree engines available here; lxml is optional"""
+    engines = ["html.parser"]
+    if importlib.util.find_spec("lxml") is not None:
+        engines.append("lxml")
+    return engines
+
+
+def first_difference(expected: List[OrderItem], actual: List[OrderItem]) -> str:
+    """Describe where two item lists first differ"""
+    for idx, (a, b) in enumerate(zip(expected, actual)):
+        if a != b:
+            return f"item {idx}: {a} != {b}"
+    return f"{len(expected)} items != {len(actual)} items"
+
+
+def check(name: str, data: bytes, webarchive: bool, engines: List[str]) -> bool:
+    """Parse data with every engine and report whether all agree with the stream"""
+    streamed = parse_receipt(data, webarchive, engine="stream")
+    agree = True
+    for engine in engines:
+        expected = parse_receipt(data, webarchive, engine=engine)
+        if expected != streamed:
+            print(f"MISMATCH {name} ({engine} vs stream): {first_difference(expected, streamed)}", file=sys.stderr)
+            agree = False
+    print(f"{'ok' if agree else 'FAIL':4}  {name}  {len(streamed)} items")
+    return agree
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare the streaming extractor with the tree parsers.")
+    parser.add_argument("files", nargs="*", help="Receipt files (.html or .webarchive) to check as well")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Items per synthetic receipt")
+    parser.add_argument("--seeds", type=int, default=DEFAULT_SEEDS, help="Synthetic receipts per format and size")
+    args = parser.parse_args()
+
+    # Stage timings and unrecognised empty receipts would drown the report
+    logging.getLogger("utils").setLevel(logging.ERROR)
+    logging.getLogger("grocery_splitter").setLevel(logging.ERROR)
+    engines = tree_engines()
+
+    failures = 0
+    for fmt in FORMATS:
+        for size in args.sizes:
+            for seed in range(args.seeds):
+                for webarchive in (False, True):
+                    data = generate_receipt(fmt, size, seed=seed, webarchive=webarchive)
+                    kind = "webarchive" if webarchive else "html"
+                    failures += not check(f"{fmt}/{kind}/{size}/seed{seed}", data, webarchive, engines)
+
+    for path in args.files:
+        with open(path, "rb") as f:
+            data = f.read()
+        failures += not check(path, data, path.endswith(".webarchive"), engines)
+
+    if failures:
+        print(f"\n{failures} receipt(s) parsed differently by the streaming extractor", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,374 @@
+"""
+Load test the app with many concurrent sessions on one server process.
+
+Simulated users run the real app script through Streamlit's app testing
+utilities (AppTest), one thread each, all sharing the process, the
+cache_resource singletons and the GIL just like sessions on a deployed
+server. Each user enters names, uploads their own synthetic receipt and then
+clicks through item allocations with a short think time in between.
+
+Every concurrency level runs in a fresh subprocess, so its memory readings
+do not include what earlier levels left behind. For each level the harness
+reports rerun latency percentiles, reruns per second, peak RSS and the RSS
+added per session, and finally the level at which throughput collapses
+(stops growing and falls below the best level by more than the tolerance,
+or reruns start failing). Memory of the background parse worker processes
+is not included; keep receipts below GROCERY_SPLITTER_PARSE_BACKGROUND_MIN_BYTES
+(the default) to measure parsing inside the server process.
+
+Usage:
+    python -m benchmarks.load                           # 1, 2, 4 and 8 users
+    python -m benchmarks.load --users 1 4 16 32 --clicks 20
+    python -m benchmarks.load --memory-budget 1024      # sessions fitting in 1 GiB
+"""
+
+import io
+import os
+import sys
+import json
+import math
+import time
+import random
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from typing import Any, Dict, List, Optional
+
+from .synthetic import FORMATS, generate_items, render_receipt, to_webarchive
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+DEFAULT_USERS = [1, 2, 4, 8]
+NAMES = "Alice, Bob, Carol, Dan"
+
+# Session state key telling the simulated uploader which user's receipt to return
+LOAD_USER_KEY = "load_test_user"
+
+# Distinct product images shared by all receipts, served from local files by
+# an injected fetcher instead of the network
+IMAGE_VARIANTS = 32
+IMAGE_URL = "https://images.load-test.invalid/product-{}.png"
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0-100) of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes (Linux only)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss() -> Optional[int]:
+    """Peak resident set size of this process in bytes, if the platform reports it"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def write_images(directory: str) -> Dict[str, str]:
+    """Write small product images and return the path of each image URL"""
+    from PIL import Image
+
+    paths = {}
+    for i in range(IMAGE_VARIANTS):
+        path = os.path.join(directory, f"product-{i}.png")
+        Image.new("RGB", (300, 300), ((i * 37) % 256, (i * 91) % 256, (i * 53) % 256)).save(path)
+        paths[IMAGE_URL.format(i)] = path
+    return paths
+
+
+def install_fetcher(paths: Dict[str, str]) -> None:
+    """Make the app's thumbnail cache read the product images from disk"""
+    from utils import thumbnails
+
+    def fetcher(url: str, **kwargs: Any) -> bytes:
+        with open(paths[url], "rb") as f:
+            return f.read()
+
+    thumbnails.http_fetcher = fetcher
+
+
+def generate_upload(user: int, args: argparse.Namespace, images: List[str]) -> bytes:
+    """Generate the receipt a user uploads; every user orders different items"""
+    items = generate_items(args.items, seed=user)
+    for i, item in enumerate(items):
+        item["image"] = images[i % len(images)]
+    html = render_receipt(args.format, items, seed=user)
+    return to_webarchive(html) if args.webarchive else html
+
+
+class SyntheticUpload(io.BytesIO):
+    """Stands in for Streamlit's UploadedFile"""
+
+    def __init__(self, data: bytes, name: str, mime: str):
+        super().__init__(data)
+        self.name = name
+        self.type = mime
+        self.size = len(data)
+
+
+def install_uploader(uploads: Dict[int, bytes], webarchive: bool) -> None:
+    """
+    Replace st.file_uploader with one returning each session's own receipt
+
+    AppTest cannot upload files, so the app receives the receipt of the user
+    named in its session state instead.
+    """
+    import streamlit as st
+
+    name = "order.webarchive" if webarchive else "order.html"
+    mime = "application/x-webarchive" if webarchive else "text/html"
+
+    def file_uploader(*args: Any, **kwargs: Any) -> Any:
+        data = uploads.get(st.session_state.get(LOAD_USER_KEY))
+        if data is None:
+            return [] if kwargs.get("accept_multiple_files") else None
+        upload = SyntheticUpload(data, name, mime)
+        return [upload] if kwargs.get("accept_multiple_files") else upload
+
+    st.file_uploader = file_uploader
+
+
+def share_runtime() -> None:
+    """
+    Let AppTest sessions run side by side in one process
+
+    AppTest installs a mock Runtime singleton for each run and removes it when
+    the run ends, which would pull it from under the other sessions still
+    running. Install one shared mock instead, and point AppTest at a subclass
+    so its per-run swaps no longer touch the real singleton.
+    """
+    from unittest.mock import MagicMock
+
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.testing.v1 import app_test
+
+    class PerRunRuntime(Runtime):
+        """Receives AppTest's per-run runtime, leaving Runtime._instance alone"""
+
+    app_test.Runtime = PerRunRuntime
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+    # AppTest patches this option per run; set it for good so overlapping runs agree
+    config.set_option("global.appTest", True)
+
+
+def simulate_user(user: int, args: argparse.Namespace, latencies: List[float], errors: List[str]) -> None:
+    """Run one user's session: open the page, upload, then click allocations"""
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(user)
+    at = AppTest.from_file(APP_PATH, default_timeout=args.timeout)
+    at.session_state[LOAD_USER_KEY] = user
+
+    def rerun(action) -> bool:
+        start = time.perf_counter()
+        try:
+            action().run()
+        except Exception as e:
+            errors.append(f"user {user}: {type(e).__name__}: {e}")
+            return False
+        latencies.append(time.perf_counter() - start)
+        if at.exception:
+            errors.append(f"user {user}: {at.exception[0].message}")
+            return False
+        return True
+
+    if not rerun(lambda: at) or not rerun(lambda: at.text_input[0].input(NAMES)):
+        return
+
+    for _ in range(args.clicks):
+        time.sleep(rng.expovariate(1 / args.think) if args.think > 0 else 0)
+        pills = at.button_group
+        if not pills:
+            errors.append(f"user {user}: no items to allocate")
+            return
+        row = pills[rng.randrange(len(pills))]
+        buyers = rng.sample([option.content for option in row.options], rng.randint(1, 2))
+        if not rerun(lambda: row.set_value(buyers)):
+            return
+
+
+def run_level(args: argparse.Namespace) -> Dict[str, Any]:
+    """Run args.level concurrent users in this process and return the measurements"""
+    import streamlit.logger
+
+    images = write_images(os.environ["GROCERY_SPLITTER_LOAD_DIR"])
+    install_fetcher(images)
+    # User -1 is the warm-up session
+    uploads = {user: generate_upload(user, args, list(images)) for user in range(-1, args.level)}
+    install_uploader(uploads, args.webarchive)
+    share_runtime()
+
+    logging.getLogger("utils").setLevel(logging.ERROR)
+    logging.getLogger("grocery_splitter").setLevel(logging.ERROR)
+    # Threads outside a script run warn on every st call they make (set after
+    # share_runtime, as changing config options re-applies the configured level)
+    streamlit.logger.set_log_level("error")
+
+    # One session end to end first, so module imports and first-use setup
+    # (SQLite stores, thumbnails, parser modules) are not counted as session memory
+    warm_up: List[str] = []
+    simulate_user(-1, argparse.Namespace(**{**vars(args), "clicks": 1, "think": 0}), [], warm_up)
+    if warm_up:
+        raise RuntimeError(f"Warm-up session failed: {warm_up[0]}")
+    baseline = current_rss()
+
+    latencies: List[float] = []
+    errors: List[str] = []
+    threads = [
+        threading.Thread(target=simulate_user, args=(user, args, latencies, errors), daemon=True)
+        for user in range(args.level)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    peak = peak_rss()
+    return {
+        "users": args.level,
+        "reruns": len(latencies),
+        "errors": errors,
+        "seconds": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50) if latencies else None,
+        "p95": percentile(latencies, 95) if latencies else None,
+        "p99": percentile(latencies, 99) if latencies else None,
+        "max": max(latencies) if latencies else None,
+        "upload_bytes": len(uploads[-1]),
+        "baseline_rss": baseline,
+        "peak_rss": peak,
+        "rss_per_session": (peak - baseline) / args.level if peak and baseline else None,
+    }
+
+
+def spawn_level(users: int, argv: List[str]) -> Dict[str, Any]:
+    """Run one concurrency level in a fresh interpreter with its own state directory"""
+    with tempfile.TemporaryDirectory(prefix="grocery-splitter-load-") as directory:
+        env = dict(
+            os.environ,
+            GROCERY_SPLITTER_LOAD_DIR=directory,
+            GROCERY_SPLITTER_AUTOSAVE_PATH=os.path.join(directory, "autosave.sqlite3"),
+            GROCERY_SPLITTER_HISTORY_PATH=os.path.join(directory, "history.sqlite3"),
+            GROCERY_SPLITTER_THUMBNAIL_DIR=os.path.join(directory, "thumbnails"),
+        )
+        process = subprocess.run(
+            [sys.executable, "-m", "benchmarks.load", *argv, "--level", str(users)],
+            cwd=os.path.dirname(APP_PATH),
+            env=env,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+    if process.returncode != 0:
+        return {"users": users, "reruns": 0, "errors": [f"level exited with status {process.returncode}"]}
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def find_collapse(results: List[Dict[str, Any]], tolerance: float) -> Optional[Dict[str, Any]]:
+    """First level whose reruns fail or whose throughput falls below the best so far by more than tolerance"""
+    best = 0.0
+    for result in results:
+        if result["errors"] or result.get("throughput", 0.0) < best * (1 - tolerance):
+            return result
+        best = max(best, result["throughput"])
+    return None
+
+
+def _ms(seconds: Optional[float]) -> str:
+    return f"{seconds * 1000:.0f}" if seconds is not None else "-"
+
+
+def _mib(size: Optional[float]) -> str:
+    return f"{size / 2 ** 20:.1f}" if size is not None else "-"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load test the app with concurrent simulated sessions.")
+    parser.add_argument("--users", type=int, nargs="+", default=DEFAULT_USERS, help="Concurrent sessions per level")
+    parser.add_argument("--clicks", type=int, default=10, help="Allocation clicks per user")
+    parser.add_argument("--think", type=float, default=0.5, help="Mean seconds between a user's clicks")
+    parser.add_argument("--items", type=int, default=100, help="Items per receipt")
+    parser.add_argument("--format", choices=FORMATS, default="tesco")
+    parser.add_argument("--webarchive", action="store_true", help="Upload web archives instead of HTML")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds before a rerun counts as failed")
+    parser.add_argument("--collapse-tolerance", type=float, default=0.2, help="Allowed drop below the best throughput")
+    parser.add_argument("--memory-budget", type=float, help="Server memory in MiB to estimate the session capacity of")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    parser.add_argument("--level", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.level is not None:
+        print(json.dumps(run_level(args)))
+        return 0
+
+    argv = sys.argv[1:]
+    print(
+        f"{'users':>5} {'reruns':>7} {'errors':>6} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} "
+        f"{'reruns/s':>8} {'peak MiB':>9} {'MiB/session':>11}"
+    )
+    results = []
+    for users in sorted(set(args.users)):
+        result = spawn_level(users, argv)
+        results.append(result)
+        print(
+            f"{users:>5} {result['reruns']:>7} {len(result['errors']):>6} {_ms(result.get('p50')):>7} "
+            f"{_ms(result.get('p95')):>7} {_ms(result.get('p99')):>7} {result.get('throughput', 0.0):>8.2f} "
+            f"{_mib(result.get('peak_rss')):>9} {_mib(result.get('rss_per_session')):>11}",
+            flush=True,
+        )
+        for error in result["errors"][:3]:
+            print(f"      {error}", file=sys.stderr)
+
+    best = max(results, key=lambda result: result.get("throughput", 0.0))
+    print(f"\nBest throughput: {best.get('throughput', 0.0):.2f} reruns/s with {best['users']} users")
+    collapse = find_collapse(results, args.collapse_tolerance)
+    if collapse is not None:
+        reason = "reruns failed" if collapse["errors"] else "throughput dropped"
+        print(f"Throughput collapses at {collapse['users']} users ({reason})")
+    else:
+        print(f"No collapse up to {results[-1]['users']} users")
+
+    measured = [result for result in results if result.get("rss_per_session")]
+    if args.memory_budget and measured:
+        # The largest level gives the steadiest per-session estimate
+        largest = measured[-1]
+        budget = args.memory_budget * 2 ** 20 - largest["baseline_rss"]
+        sessions = int(budget // largest["rss_per_session"]) if budget > 0 else 0
+        print(
+            f"Memory budget {args.memory_budget:.0f} MiB: about {sessions} sessions "
+            f"({_mib(largest['rss_per_session'])} MiB each over a {_mib(largest['baseline_rss'])} MiB server)"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+    return 1 if collapse is not None and collapse["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+Benchmark the parse, dedupe, split and settlement stages on synthetic receipts.
+
+Parsing is timed with the default engine and with the streaming extractor.
+
+Each case reports the best wall time over a few repeats and the peak traced
+memory of one extra run, then compares both with benchmarks/baselines.json.
+Baseline times are scaled by a calibration workload timed next to each case,
+so a slower or busier machine does not show up as a regression. The exit status is 1 when any case
+regressed past the allowed tolerance.
+
+Usage:
+    python -m benchmarks.run                      # compare against baselines
+    python -m benchmarks.run --sizes 10 100       # only small orders
+    python -m benchmarks.run --update-baselines   # record new baselines
+"""
+
+import os
+import sys
+import gc
+import json
+import math
+import time
+import random
+import logging
+import argparse
+import tracemalloc
+from typing import Callable, Dict, Iterator, List, Any, Tuple
+
+from utils import OrderItem, parse_receipt, compute_split, dedupe_items, settle_orders
+from .synthetic import FORMATS, generate_receipt
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+SPLIT_PEOPLE = ["Alice", "Bob", "Carol", "Dan"]
+
+# (people, orders) of the settlement cases: the largest group solved exactly,
+# and a large group solved greedily
+SETTLE_CASES = [("exact", 12, 60), ("greedy", 500, 5000)]
+
+# Fast cases run repeatedly for at least this long (seconds)
+MIN_MEASURE_TIME = 0.5
+MAX_REPEAT = 50
+CALIBRATION_REPEAT = 5
+
+# Differences smaller than these never count as regressions (timer and allocator noise)
+MIN_TIME_SLACK = 0.005  # seconds
+MIN_MEMORY_SLACK = 64 * 1024  # bytes
+
+
+def measure(func: Callable[[], Any], repeat: int) -> Tuple[float, int]:
+    """
+    Return (best wall time in seconds, peak traced memory in bytes) of func
+
+    Fast cases are repeated until they have run for at least MIN_MEASURE_TIME
+    (up to MAX_REPEAT times) so that the best time is not a noisy outlier.
+    """
+    # Warm up caches and the allocator so the first case is not penalised
+    start = time.perf_counter()
+    func()
+    warmup = time.perf_counter() - start
+    gc.collect()
+
+    runs = min(MAX_REPEAT, max(repeat, math.ceil(MIN_MEASURE_TIME / max(warmup, 1e-6))))
+
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def calibration_workload() -> None:
+    """Fixed pure-Python work (objects, dicts, strings) used to gauge machine speed"""
+    rows = [{"name": f"item {i}", "price": i * 0.01} for i in range(20000)]
+    index = {row["name"]: row for row in rows}
+    " ".join(sorted(index)).split()
+
+
+def calibrate() -> float:
+    """Best time of the calibration workload; baseline times are scaled by its ratio"""
+    best = float("inf")
+    for _ in range(CALIBRATION_REPEAT):
+        start = time.perf_counter()
+        calibration_workload()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def random_allocations(items: List[OrderItem], seed: int = 0) -> List[Dict[str, float]]:
+    """Assign every item to a random subset of SPLIT_PEOPLE"""
+    rng = random.Random(seed)
+    allocations = []
+    for item in items:
+        buyers = rng.sample(SPLIT_PEOPLE, rng.randint(1, len(SPLIT_PEOPLE)))
+        allocations.append({person: rng.randint(1, 3) for person in buyers})
+    return allocations
+
+
+def random_orders(n_people: int, n_orders: int, seed: int = 0) -> List[Tuple[str, Dict[str, float]]]:
+    """Orders with a random payer, each split between a few random people"""
+    rng = random.Random(seed)
+    people = [f"Person {i}" for i in range(n_people)]
+    orders = []
+    for _ in range(n_orders):
+        split = {person: rng.randint(50, 4000) / 100 for person in rng.sample(people, rng.randint(2, min(8, n_people)))}
+        orders.append((rng.choice(people), split))
+    return orders
+
+
+def iter_cases(sizes: List[int]) -> Iterator[Tuple[str, Callable[[], Any]]]:
+    """
+    Yield (case name, zero-argument callable) pairs
+
+    Inputs are generated right before each case runs, so results do not
+    depend on which other sizes were selected.
+    """
+    for size in sizes:
+        for fmt in FORMATS:
+            for webarchive in (False, True):
+                data = generate_receipt(fmt, size, webarchive=webarchive)
+                kind = "webarchive" if webarchive else "html"
+                yield f"parse/{fmt}/{kind}/{size}", lambda: parse_receipt(data, webarchive)
+                yield f"parse-stream/{fmt}/{kind}/{size}", lambda: parse_receipt(data, webarchive, engine="stream")
+
+        items = parse_receipt(generate_receipt("asda-table", size), False)
+        prices = [item.price for item in items]
+        allocations = random_allocations(items)
+        yield f"dedupe/{size}", lambda: dedupe_items(items)
+        yield f"split/{size}", lambda: compute_split(prices, allocations, SPLIT_PEOPLE)
+
+    for solver, n_people, n_orders in SETTLE_CASES:
+        orders = random_orders(n_people, n_orders)
+        yield f"settle/{solver}/{n_people}x{n_orders}", lambda: settle_orders(orders)
+
+
+def is_regression(value: float, baseline: float, tolerance: float, slack: float) -> bool:
+    """Whether value is worse than baseline by more than the tolerance and the noise slack"""
+    return value > max(baseline * (1 + tolerance), baseline + slack)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark parsing, de-duplication and splitting.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Items per receipt")
+    parser.add_argument("--repeat", type=int, default=3, help="Minimum timed runs per case (best is kept)")
+    parser.add_argument("--time-tolerance", type=float, default=0.5, help="Allowed relative slowdown")
+    parser.add_argument("--memory-tolerance", type=float, default=0.25, help="Allowed relative memory growth")
+    parser.add_argument("--baselines", default=BASELINES_PATH, help="Baselines JSON file")
+    parser.add_argument("--update-baselines", action="store_true", help="Store the results as the new baselines")
+    args = parser.parse_args()
+
+    logging.getLogger("utils").setLevel(logging.WARNING)
+    logging.getLogger("grocery_splitter").setLevel(logging.WARNING)
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines, encoding="utf-8") as f:
+            baselines = json.load(f)
+
+    results = {}
+    regressions = []
+    print(f"{'case':<36} {'time (ms)':>12} {'peak (KiB)':>12}  status")
+
+    for name, func in iter_cases(args.sizes):
+        # Calibrating next to every case cancels out drift in machine speed during the run
+        calibration = calibrate()
+        seconds, peak = measure(func, args.repeat)
+        results[name] = {"seconds": seconds, "peak_bytes": peak, "calibration_seconds": calibration}
+
+        status = "new"
+        baseline = baselines.get(name)
+        if baseline:
+            expected = baseline["seconds"] * calibration / baseline["calibration_seconds"]
+            slow = is_regression(seconds, expected, args.time_tolerance, MIN_TIME_SLACK)
+            heavy = is_regression(peak, baseline["peak_bytes"], args.memory_tolerance, MIN_MEMORY_SLACK)
+            status = ", ".join(
+                label for label, failed in (("SLOWER", slow), ("MORE MEMORY", heavy)) if failed
+            ) or f"ok ({seconds / expected:.2f}x expected time)"
+            if slow or heavy:
+                regressions.append(name)
+
+        print(f"{name:<36} {seconds * 1000:>12.2f} {peak / 1024:>12.1f}  {status}")
+
+    if args.update_baselines:
+        baselines.update(results)
+        with open(args.baselines, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaselines written to {args.baselines}")
+        return 0
+
+    if regressions:
+        print(f"\n{len(regressions)} case(s) regressed past the baselines:", file=sys.stderr)
+        for name in regressions:
+            print(f"  {name}", file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""
+Synthetic grocery receipts for benchmarks and load tests.
+
+Receipts mimic the markup the store parsers read (ASDA table rows, ASDA div
+containers and Tesco styled blocks), wrapped in a realistically heavy page:
+a large <head>, navigation, unavailable and substituted rows, repeated items
+and, for web archives, image subresources.
+
+Usage:
+    python -m benchmarks.synthetic --format tesco --items 500 --webarchive -o order.webarchive
+"""
+
+import random
+import argparse
+import plistlib
+from html import escape
+from typing import List, Dict, Any
+
+FORMATS = ("asda-table", "asda-container", "tesco")
+
+BRANDS = ["ASDA", "ASDA Extra Special", "Heinz", "Warburtons", "Cathedral City", "Yeo Valley", "Hovis", "Kellogg's"]
+PRODUCTS = [
+    "Semi Skimmed Milk", "Free Range Eggs", "Mature Cheddar", "Baked Beans", "Wholemeal Bread",
+    "Greek Style Yogurt", "Bananas", "Gala Apples", "Basmati Rice", "Penne Pasta", "Chopped Tomatoes",
+    "Chicken Breast Fillets", "Salted Butter", "Orange Juice", "Cornflakes", "Frozen Peas",
+    "Washing Up Liquid", "Toilet Tissue", "Ground Coffee", "Dark Chocolate",
+]
+WEIGHTS = ["500g", "1kg", "2.27L", "400g", "800g", "6 pack", "12 x 9", "250ml", "1.5kg", "4 x 125g"]
+
+
+def generate_items(n_items: int, seed: int = 0, duplicate_ratio: float = 0.05) -> List[Dict[str, Any]]:
+    """
+    Generate item records for a synthetic order
+
+    Args:
+        n_items: Number of items (before unavailable/substituted rows are added)
+        seed: Random seed, the same seed always produces the same order
+        duplicate_ratio: Share of items that repeat an earlier name and weight
+
+    Returns:
+        List of item dicts with name, quantity, weight, price and image
+    """
+    rng = random.Random(seed)
+    items = []
+    for i in range(n_items):
+        if items and rng.random() < duplicate_ratio:
+            items.append(dict(rng.choice(items)))
+            continue
+
+        quantity = rng.choice([1, 1, 1, 2, 3, 4])
+        items.append({
+            "name": f"{rng.choice(BRANDS)} {rng.choice(PRODUCTS)} {i}",
+            "quantity": quantity,
+            "weight": rng.choice(WEIGHTS),
+            "price": round(quantity * rng.randint(25, 1500) / 100, 2),
+            "image": f"https://images.example.com/products/{i}.jpg",
+        })
+    return items
+
+
+def _page(body: str, title: str, head_rules: int = 400) -> str:
+    """Wrap order markup in a page with a heavy head and navigation"""
+    styles = "".join(f".c{i}{{margin:{i % 7}px;padding:{i % 5}px}}" for i in range(head_rules))
+    scripts = "<script>window.__STATE__ = {" + ",".join(f'"k{i}": {i}' for i in range(head_rules)) + "};</script>"
+    navigation = "<nav><ul>" + "".join(
+        f'<li class="nav__item"><a href="/aisle/{i}"><span>Aisle {i}</span></a></li>' for i in range(120)
+    ) + "</ul></nav>"
+    return (
+        "<!DOCTYPE html><html><head>"
+        '<meta charset="utf-8">'
+        f"<title>{title}</title><style>{styles}</style>{scripts}"
+        f"</head><body>{navigation}<main>{body}</main><footer>Thanks for shopping</footer></body></html>"
+    )
+
+
+def _asda_table(items: List[Dict[str, Any]], rng: random.Random) -> str:
+    rows = []
+    for i, item in enumerate(items):
+        # Sprinkle in rows the parser has to skip
+        if rng.random() < 0.05:
+            state = rng.choice(["item-row__content--unavailable", "item-row__content--subs-original"])
+            rows.append(
+                f'<tr class="item-row__content {state}"><td><h4 class="item-title__label">1 x Missing {i}</h4></td>'
+                '<td><p class="item-price__label">£0.00</p></td></tr>'
+            )
+
+        rows.append(
+            '<tr class="item-row__content">'
+            f'<td class="item-row__image"><img class="item-image__image" src="{item["image"]}" alt="{escape(item["name"])}"></td>'
+            '<td class="item-row__title"><div class="item-title">'
+            f'<h4 class="item-title__label">{item["quantity"]} x {escape(item["name"])}</h4>'
+            f'<span class="item-title__weight">{item["weight"]}</span></div></td>'
+            f'<td class="item-row__price"><p class="item-price__label">£{item["price"]:.2f}</p></td>'
+            "</tr>"
+        )
+    return '<table class="order-items"><tbody>' + "".join(rows) + "</tbody></table>"
+
+
+def _asda_container(items: List[Dict[str, Any]], rng: random.Random) -> str:
+    blocks = []
+    for i, item in enumerate(items):
+        blocks.append(
+            f'<div data-testid="container-{i}" class="css-1k2x3"><div class="css-img"><img src="{item["image"]}"></div>'
+            f'<div class="css-details"><p class="chakra-text css-0">{item["quantity"]} x {escape(item["name"])}</p>'
+            f'<p class="chakra-text css-0">{item["weight"]}</p></div>'
+            f'<p data-testid="totalCost-{i}" class="chakra-text css-9v1">£{item["price"]:.2f}</p></div>'
+        )
+    return '<div class="order-list">' + "".join(blocks) + "</div>"
+
+
+def _tesco(items: List[Dict[str, Any]], rng: random.Random) -> str:
+    blocks = []
+    for item in items:
+        blocks.append(
+            '<div class="styled__ProductContentWrapper-mfe-orders__sc-1hj3has-7">'
+            f'<img data-testid="product-image" alt="{escape(item["name"])} {item["weight"]}" src="{item["image"]}">'
+            f'<div data-testid="product-title"><a href="/products/1">{escape(item["name"])}</a></div>'
+            f'<div class="styled__SmallOnlyText-mfe-orders__sc-1hj3has-9">Quantity: {item["quantity"]}</div>'
+            f'<h4 data-testid="receipt-total-price">£{item["price"]:.2f}</h4></div>'
+        )
+    unavailable = '<article><h3>Unavailable items</h3><div class="styled__ProductContentWrapper-mfe-orders__sc-1hj3has-7"></div></article>'
+    return unavailable + "<article><h3>Rest of your items</h3>" + "".join(blocks) + "</article>"
+
+
+RENDERERS = {
+    "asda-table": _asda_table,
+    "asda-container": _asda_container,
+    "tesco": _tesco,
+}
+
+
+def render_receipt(fmt: str, items: List[Dict[str, Any]], seed: int = 0) -> bytes:
+    """
+    Render items as an order page in the given store format
+
+    Args:
+        fmt: One of FORMATS
+        items: Item records, e.g. from generate_items
+        seed: Seed for the skipped rows sprinkled into the page
+
+    Returns:
+        UTF-8 encoded HTML
+    """
+    body = RENDERERS[fmt](items, random.Random(seed))
+    return _page(body, f"Your order ({fmt})").encode("utf-8")
+
+
+def to_webarchive(html: bytes, subresources: int = 20, subresource_size: int = 64 * 1024) -> bytes:
+    """Wrap HTML in a binary Safari web archive with image-sized subresources"""
+    archive = {
+        "WebMainResource": {
+            "WebResourceData": html,
+            "WebResourceMIMEType": "text/html",
+            "WebResourceTextEncodingName": "UTF-8",
+            "WebResourceURL": "https://groceries.example.com/order",
+            "WebResourceFrameName": "",
+        },
+        "WebSubresources": [
+            {
+                "WebResourceData": bytes([i % 256]) * subresource_size,
+                "WebResourceMIMEType": "image/jpeg",
+                "WebResourceURL": f"https://images.example.com/products/{i}.jpg",
+            }
+            for i in range(subresources)
+        ],
+    }
+    return plistlib.dumps(archive, fmt=plistlib.FMT_BINARY)
+
+
+def generate_receipt(fmt: str, n_items: int, seed: int = 0, webarchive: bool = False) -> bytes:
+    """Generate a complete synthetic receipt, as HTML or as a web archive"""
+    html = render_receipt(fmt, generate_items(n_items, seed), seed)
+    return to_webarchive(html) if webarchive else html
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic grocery receipt.")
+    parser.add_argument("--format", choices=FORMATS, default="asda-table")
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--webarchive", action="store_true", help="Wrap the page in a Safari web archive")
+    parser.add_argument("--output", "-o", required=True)
+    args = parser.parse_args()
+
+    with open(args.output, "wb") as f:
+        f.write(generate_receipt(args.format, args.items, args.seed, args.webarchive))
+
+
+if __name__ == "__main__":
+    main()
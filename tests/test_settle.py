@@ -0,0 +1,81 @@
+import random
+from typing import Dict, List, Mapping
+
+import pytest
+
+from benchmarks.run import random_orders
+from utils.settle import EXACT_MAX_PEOPLE, Transfer, net_balances, settle, settle_orders
+
+
+def residual(balances: Mapping[str, int], transfers: List[Transfer]) -> Dict[str, int]:
+    """Balances left after the transfers; all zero if they settle everyone"""
+    left = dict(balances)
+    for transfer in transfers:
+        assert transfer.pence > 0
+        left[transfer.sender] += transfer.pence
+        left[transfer.recipient] -= transfer.pence
+    return left
+
+
+def brute_force_minimum(balances: Mapping[str, int]) -> int:
+    """Fewest transfers settling the balances, by trying every way of clearing each debt in turn"""
+    debts = [balance for balance in balances.values() if balance]
+
+    def search(start: int) -> int:
+        while start < len(debts) and debts[start] == 0:
+            start += 1
+        if start == len(debts):
+            return 0
+        best = len(debts)
+        for i in range(start + 1, len(debts)):
+            if debts[i] * debts[start] < 0:
+                debts[i] += debts[start]
+                best = min(best, 1 + search(start + 1))
+                debts[i] -= debts[start]
+        return best
+
+    return search(0)
+
+
+def grouped_balances(rng: random.Random, n_people: int) -> Dict[str, int]:
+    """Balances adding up to zero, made of smaller zero-sum groups the exact solver should find"""
+    amounts = []
+    while len(amounts) < n_people:
+        # A last group of one is a settled person
+        size = min(rng.randint(2, 4), n_people - len(amounts))
+        group = [rng.randint(-5000, 5000) for _ in range(size - 1)]
+        amounts.extend(group + [-sum(group)])
+    rng.shuffle(amounts)
+    return {f"Person {i}": amount for i, amount in enumerate(amounts)}
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_exact_matches_brute_force(seed):
+    """Small groups get exactly the fewest transfers, and they clear every balance"""
+    rng = random.Random(seed)
+    n_people = rng.randint(2, 9)
+    if seed % 2:
+        balances = net_balances(random_orders(n_people, rng.randint(1, 6), seed=seed))
+    else:
+        balances = grouped_balances(rng, n_people)
+
+    transfers = settle(balances)
+    assert not any(residual(balances, transfers).values())
+    assert len(transfers) == brute_force_minimum(balances)
+
+
+def test_greedy_settles_large_groups():
+    """500 people over 5,000 orders: every balance is cleared in at most one transfer fewer than the people owed or owing"""
+    orders = random_orders(500, 5000)
+    balances = net_balances(orders)
+    outstanding = sum(1 for balance in balances.values() if balance)
+    assert outstanding > EXACT_MAX_PEOPLE
+
+    transfers = settle_orders(orders)
+    assert not any(residual(balances, transfers).values())
+    assert len(transfers) <= outstanding - 1
+
+
+def test_unbalanced_raises():
+    with pytest.raises(ValueError):
+        settle({"Alice": 100, "Bob": -99})
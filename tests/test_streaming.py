@@ -0,0 +1,32 @@
+import plistlib
+
+import pytest
+
+from benchmarks.synthetic import FORMATS, generate_items, render_receipt
+from utils.parsers import parse_receipt
+
+
+def web_archive(html: bytes, encoding: str) -> bytes:
+    """Wrap HTML in a binary web archive declaring the given text encoding"""
+    archive = {
+        "WebMainResource": {
+            "WebResourceData": html,
+            "WebResourceMIMEType": "text/html",
+            "WebResourceTextEncodingName": encoding,
+            "WebResourceURL": "https://groceries.example.com/order",
+        },
+    }
+    return plistlib.dumps(archive, fmt=plistlib.FMT_BINARY)
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+@pytest.mark.parametrize("encoding", ["x-mac-roman", "bogus-enc"])
+def test_unknown_archive_encoding(fmt, encoding):
+    """An encoding name Python does not know falls back to the page's charset, as with the tree engines"""
+    html = render_receipt(fmt, generate_items(30, seed=1), seed=1)
+    archive = web_archive(html, encoding)
+
+    expected = parse_receipt(html, False, engine="html.parser")
+    assert expected
+    assert parse_receipt(archive, True, engine="stream") == expected
+    assert parse_receipt(archive, True, engine="html.parser") == expected
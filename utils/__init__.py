@@ -1,21 +1,173 @@
 # Re-export all public functions and constants for backward compatibility
 # This allows: from utils import divider_color, remove_emojis, ...
+#
+# Submodules are imported on first access (PEP 562), so importing a display
+# helper does not also load BeautifulSoup, numpy or pandas.
 
-from .constants import divider_color, DEFAULT_IMAGE
-from .text import remove_emojis
-from .display import display_item, display_order, display_split
-from .parsers import order_processor
+import importlib
 
-__all__ = [
+# Public name -> submodule that defines it
+_EXPORTS = {
     # Constants
-    "divider_color",
-    "DEFAULT_IMAGE",
+    "divider_color": ".constants",
+    "DEFAULT_IMAGE": ".constants",
+    "PARSE_CACHE_MAX_ENTRIES": ".constants",
+    "PARSE_CACHE_TTL": ".constants",
+    "EXPORT_CACHE_MAX_ENTRIES": ".constants",
+    "EXPORT_CACHE_TTL": ".constants",
+    "PARSE_WORKERS": ".constants",
+    "PARSE_BACKGROUND_MIN_BYTES": ".constants",
+    "CANCELLED_PARSE_KEY": ".constants",
+    "STORES": ".constants",
+    "STORE_KEYS": ".constants",
+    "THUMBNAIL_SIZE": ".constants",
+    "THUMBNAIL_CACHE_DIR": ".constants",
+    "THUMBNAIL_CACHE_MAX_BYTES": ".constants",
+    "THUMBNAIL_IMAGE_HOSTS": ".constants",
+    "AUTOSAVE_PATH": ".constants",
+    "AUTOSAVE_MAX_AGE": ".constants",
+    "HISTORY_PATH": ".constants",
+    "HISTORY_FUZZY_THRESHOLD": ".constants",
+    "LEDGER_VERIFY": ".constants",
+    "GRID_MODE_MIN_ITEMS": ".constants",
+    "GRID_MODE_MIN_PEOPLE": ".constants",
     # Text utilities
-    "remove_emojis",
+    "remove_emojis": ".text",
     # Display functions
-    "display_item",
-    "display_order",
-    "display_split",
+    "display_item": ".display",
+    "display_item_row": ".display",
+    "display_item_grid": ".display",
+    "display_order": ".display",
+    "display_split": ".display",
+    "display_exports": ".display",
+    "display_settlement": ".display",
+    "get_allocations": ".display",
+    "restore_split": ".display",
+    "prefill_buyers": ".display",
+    "remember_split": ".display",
+    "display_bulk_assign": ".display",
+    "apply_bulk_rules": ".display",
+    "display_parse_progress": ".display",
+    "display_parse_cancelled": ".display",
+    "current_split": ".display",
+    "get_ledger": ".display",
+    "debug_enabled": ".display",
+    "display_timings": ".display",
     # Parsers
-    "order_processor",
-]
+    "StoreParser": ".parsers",
+    "PARSERS": ".parsers",
+    "register_parser": ".parsers",
+    "get_parser": ".parsers",
+    "detect_parsers": ".parsers",
+    "order_processor": ".parsers",
+    "parse_receipt": ".parsers",
+    "detect_store": ".parsers",
+    "ItemStream": ".streaming",
+    "STREAMS": ".streaming",
+    "register_stream": ".streaming",
+    "stream_items": ".streaming",
+    # Items
+    "OrderItem": ".items",
+    "dedupe_items": ".items",
+    "order_total": ".items",
+    "merge_orders": ".items",
+    "source_totals": ".items",
+    "source_labels": ".items",
+    # Assignment rules
+    "Rule": ".rules",
+    "allocate": ".rules",
+    "apply_rules": ".rules",
+    "load_rules": ".rules",
+    "RuleMatcher": ".rules",
+    "match_buyers": ".rules",
+    "category_rules": ".rules",
+    "parse_rules": ".rules",
+    "SPECIAL_ALL": ".rules",
+    # Split engine
+    "to_pence": ".split",
+    "allocation_matrix": ".split",
+    "split_shares": ".split",
+    "compute_split": ".split",
+    # Assignment grid
+    "grid_rows": ".grid",
+    "grid_allocations": ".grid",
+    "default_quantities": ".grid",
+    "allocation_widgets": ".grid",
+    # Settlement
+    "Transfer": ".settle",
+    "net_balances": ".settle",
+    "settle": ".settle",
+    "settle_orders": ".settle",
+    # Split ledger
+    "SplitLedger": ".ledger",
+    "item_shares": ".ledger",
+    # Web archives
+    "WebArchiveError": ".webarchive",
+    "read_main_resource": ".webarchive",
+    "mapped_file": ".webarchive",
+    # Caching
+    "LRUCache": ".cache",
+    "ParseCache": ".cache",
+    "receipt_hash": ".cache",
+    "receipts_hash": ".cache",
+    # Export
+    "export_key": ".export",
+    "split_breakdown": ".export",
+    "split_csv": ".export",
+    "split_pdf": ".export",
+    "PdfDocument": ".export",
+    # Receipt files
+    "Receipt": ".receipt",
+    "ReceiptFormatError": ".receipt",
+    "RECEIPT_VERSION": ".receipt",
+    "RECEIPT_EXTENSION": ".receipt",
+    "dump_receipt": ".receipt",
+    "load_receipt": ".receipt",
+    "is_receipt": ".receipt",
+    # Autosave
+    "AllocationStore": ".autosave",
+    "autosave_key": ".autosave",
+    # Assignment history
+    "AssignmentHistory": ".history",
+    "normalise_name": ".history",
+    # Background parsing
+    "ParsePool": ".workers",
+    "ParseJob": ".workers",
+    "ParseCancelled": ".progress",
+    "reporting": ".progress",
+    "track": ".progress",
+    # Thumbnails
+    "ThumbnailCache": ".thumbnails",
+    "http_fetcher": ".thumbnails",
+    "check_image_url": ".thumbnails",
+    "ImageURLError": ".thumbnails",
+    "IMAGE_HOSTS": ".thumbnails",
+    "PLACEHOLDER_IMAGE": ".thumbnails",
+    # Timing
+    "Timeline": ".timing",
+    "start_timeline": ".timing",
+    "current_timeline": ".timing",
+    "span": ".timing",
+    # Metrics
+    "MetricsRegistry": ".metrics",
+    "REGISTRY": ".metrics",
+    "collecting": ".metrics",
+    "merge_metrics": ".metrics",
+    "export_metrics": ".metrics",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
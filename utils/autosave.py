@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS widget_state (
+    split_key TEXT NOT NULL,
+    widget TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (split_key, widget)
+)
+"""
+
+
+def autosave_key(receipt_key: str, names: List[str]) -> str:
+    """
+    Return the key a split is saved under.
+
+    The same receipt split between different people is a different split, so
+    the names (in order, as they drive the default quantities) are part of it.
+
+    Args:
+        receipt_key: Content hash of the uploaded receipt
+        names: People taking part in the split
+    """
+    return hashlib.sha256("\x1f".join([receipt_key, *names]).encode("utf-8")).hexdigest()
+
+
+class AllocationStore:
+    """
+    SQLite store of in-progress splits, one row per widget value.
+
+    Rows are written as widgets change, so saving a single edit costs one
+    small upsert no matter how large the order is. A single instance is
+    shared by every Streamlit session.
+
+    Args:
+        path: SQLite database file (its folder is created if missing)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(SCHEMA)
+
+    def load(self, split_key: str) -> Dict[str, Any]:
+        """Return the saved widget values of a split ({widget key: value})."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT widget, value FROM widget_state WHERE split_key = ?", (split_key,)
+            ).fetchall()
+        return {widget: json.loads(value) for widget, value in rows}
+
+    def save(self, split_key: str, changes: Dict[str, Any], removed: Iterable[str] = ()) -> None:
+        """
+        Record changed widget values of a split.
+
+        Args:
+            split_key: Key from autosave_key
+            changes: Widget values that were added or changed
+            removed: Widget keys that no longer exist (e.g. a deselected person's quantity)
+        """
+        now = time.time()
+        removed = list(removed)
+        with self._lock, self._conn:
+            if changes:
+                self._conn.executemany(
+                    "INSERT INTO widget_state (split_key, widget, value, updated) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (split_key, widget) DO UPDATE SET value = excluded.value, updated = excluded.updated",
+                    [(split_key, widget, json.dumps(value), now) for widget, value in changes.items()],
+                )
+            if removed:
+                self._conn.executemany(
+                    "DELETE FROM widget_state WHERE split_key = ? AND widget = ?",
+                    [(split_key, widget) for widget in removed],
+                )
+
+    def forget(self, split_key: str) -> None:
+        """Delete everything saved for a split."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM widget_state WHERE split_key = ?", (split_key,))
+
+    def prune(self, max_age: Optional[float]) -> int:
+        """
+        Delete splits that have not been touched for max_age seconds.
+
+        Returns:
+            Number of widget rows removed
+        """
+        if max_age is None:
+            return 0
+
+        cutoff = time.time() - max_age
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM widget_state WHERE split_key IN "
+                "(SELECT split_key FROM widget_state GROUP BY split_key HAVING MAX(updated) < ?)",
+                (cutoff,),
+            )
+        if cursor.rowcount:
+            logger.info(f"Pruned {cursor.rowcount} saved widget values older than {max_age:.0f}s")
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,142 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def receipt_hash(data: bytes) -> str:
+    """Return a stable content hash for the raw bytes of an uploaded receipt."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def receipts_hash(keys: Sequence[str]) -> str:
+    """
+    Return the key of several receipts split together.
+
+    The keys are combined in upload order, as the order decides the item
+    indexes. A single receipt keeps its own hash, so its saved splits stay valid.
+
+    Args:
+        keys: receipt_hash of each receipt
+    """
+    if len(keys) == 1:
+        return keys[0]
+    return hashlib.sha256("\x1f".join(keys).encode("ascii")).hexdigest()
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with time-based expiry.
+
+    Each instance keeps its own hit/miss counters, so caches of different
+    things (parsed receipts, generated exports) are reported apart.
+
+    Args:
+        max_entries: Maximum number of receipts kept before the least recently
+            used one is evicted
+        ttl: Seconds an entry stays valid after it was stored (None disables expiry)
+    """
+
+    def __init__(self, max_entries: int = 32, ttl: Optional[float] = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for key, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            stored_at, value = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store value under key, evicting the least recently used entries if full."""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Return the cached value for key, computing and storing it on a miss.
+
+        Args:
+            key: Cache key
+            compute: Zero-argument callable producing the value on a miss
+
+        Returns:
+            The cached or freshly computed value
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        """Drop every entry (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Return the hit/miss/eviction counters and current size."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "size": len(self._entries),
+            }
+
+
+class ParseCache(LRUCache):
+    """
+    LRU cache for parsed receipts with time-based expiry.
+
+    A single instance is shared by every Streamlit session, so reruns caused by
+    widget changes (and other users uploading the same receipt) skip decoding,
+    HTML parsing and item extraction entirely.
+    """
+
+    def get_or_parse(self, key: Hashable, parse: Callable[[], Any]) -> Any:
+        """
+        Return the cached value for key, parsing and storing it on a miss.
+
+        Args:
+            key: Cache key, usually (content hash, store choice)
+            parse: Zero-argument callable producing the value on a miss
+
+        Returns:
+            The cached or freshly parsed value
+        """
+        return self.get_or_compute(key, parse)
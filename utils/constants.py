@@ -1,5 +1,104 @@
+import os
+
 # UI Constants
 divider_color = "red"
 
+# Supported stores: command-line key and the logo shown in the store picker
+STORE_KEYS = ["asda", "tesco"]
+STORES = [
+    "&nbsp; ![Asda Logo](https://upload.wikimedia.org/wikipedia/commons/thumb/9/91/Asda_logo.svg/250px-Asda_logo.svg.png) &nbsp; &nbsp;",
+    "&nbsp; ![Tesco Logo](https://upload.wikimedia.org/wikipedia/commons/2/23/Tesco_logo.png) &nbsp; &nbsp;",
+]
+
 # Default fallback image for items without images
 DEFAULT_IMAGE = "https://cdn-icons-png.freepik.com/256/13701/13701566.png?semt=ais_hybrid"
+
+# Session state keys holding the per-item allocations of the current order
+ALLOCATIONS_KEY = "allocations"
+ALLOCATIONS_ORDER_KEY = "allocations_order"
+# Session state key of the running split totals, and whether every read checks
+# them against a full recompute (logged as an error when they disagree)
+LEDGER_KEY = "split_ledger"
+LEDGER_VERIFY = os.environ.get("GROCERY_SPLITTER_VERIFY_LEDGER", "").lower() in ("1", "true", "yes")
+
+# Quotas are rounded to this many decimals before flooring so that equal
+# shares (e.g. thirds) tie exactly and the split tie-break stays deterministic;
+# shared by the vectorised split and the ledger, so both agree to the penny
+QUOTA_DECIMALS = 6
+
+# Set while a full run has yet to draw the split summary, and the placeholders
+# of the last summary drawn, which item rows rerunning on their own redraw the
+# totals in when they change them
+SPLIT_PENDING_KEY = "split_pending"
+SPLIT_VIEW_KEY = "split_view"
+
+# Parsed receipts shared across sessions
+PARSE_CACHE_MAX_ENTRIES = 32
+PARSE_CACHE_TTL = 60 * 60  # seconds
+
+# Generated CSV/PDF exports shared across sessions, keyed by allocation state
+EXPORT_CACHE_MAX_ENTRIES = 64
+EXPORT_CACHE_TTL = 60 * 60  # seconds
+
+# Receipts at least this large are parsed by the background worker pool, with
+# progress and a cancel button; smaller ones parse faster in the script itself
+PARSE_WORKERS = int(os.environ.get("GROCERY_SPLITTER_PARSE_WORKERS", min(2, os.cpu_count() or 1)))
+PARSE_BACKGROUND_MIN_BYTES = int(os.environ.get("GROCERY_SPLITTER_PARSE_BACKGROUND_MIN_BYTES", 256 * 1024))
+PARSE_POLL_INTERVAL = 0.2  # seconds between progress updates in the page
+CANCELLED_PARSE_KEY = "cancelled_parse"  # receipt hashes whose parse was cancelled
+
+# HTML parser engine: "auto" (lxml when installed), "lxml" or "html.parser", or
+# "stream" to extract items from tokenizer events without building a tree
+PARSER_ENGINE = os.environ.get("GROCERY_SPLITTER_PARSER_ENGINE", "auto")
+
+# Parse metrics (Prometheus text format) are written to this file after every
+# parse, e.g. into node_exporter's textfile collector directory; unset to disable
+METRICS_PATH = os.environ.get("GROCERY_SPLITTER_METRICS_PATH") or None
+
+# Timing debug panel, enabled with ?debug=1 or GROCERY_SPLITTER_DEBUG=1
+DEBUG_ENV_VAR = "GROCERY_SPLITTER_DEBUG"
+DEBUG_QUERY_PARAM = "debug"
+TIMINGS_KEY = "timings"
+TIMINGS_HISTORY = 20  # reruns kept per session
+
+# Product thumbnails cached on disk and embedded inline in the item rows
+THUMBNAIL_SIZE = 70  # pixels
+THUMBNAIL_CACHE_DIR = os.environ.get(
+    "GROCERY_SPLITTER_THUMBNAIL_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "grocery-splitter", "thumbnails"),
+)
+THUMBNAIL_CACHE_MAX_BYTES = 64 * 1024 * 1024
+THUMBNAIL_FETCH_WORKERS = 8
+# Hosts product images are fetched from (comma separated, subdomains included;
+# "*" for any host name); unset for the stores' own image hosts
+THUMBNAIL_IMAGE_HOSTS = tuple(
+    host.strip().lower() for host in os.environ.get("GROCERY_SPLITTER_IMAGE_HOSTS", "").split(",") if host.strip()
+)
+
+# In-progress splits saved as widgets change, restored when the same receipt
+# is uploaded again for the same people
+AUTOSAVE_PATH = os.environ.get(
+    "GROCERY_SPLITTER_AUTOSAVE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "grocery-splitter", "autosave.sqlite3"),
+)
+AUTOSAVE_MAX_AGE = 30 * 24 * 60 * 60  # seconds since a split was last changed
+AUTOSAVE_SNAPSHOT_KEY = "autosave_snapshot"
+RESTORED_WIDGETS_KEY = "restored_widgets"
+
+# Items are assigned in one editable grid rather than a row of widgets per
+# item when the order or the group is at least this big (either can switch)
+GRID_MODE_MIN_ITEMS = 200
+GRID_MODE_MIN_PEOPLE = 8
+ASSIGN_MODE_KEY = "assign_mode"
+GRID_ROWS_KEY = "assign_grid_rows"  # grid contents when it was opened; edits are kept by the editor
+GRID_EDITOR_KEY = "assign_grid"
+
+# Result of the last bulk assignment, shown once after the rerun it triggers
+BULK_MESSAGE_KEY = "bulk_message"
+
+# Buyers remembered from past splits, used to pre-fill new ones
+HISTORY_PATH = os.environ.get(
+    "GROCERY_SPLITTER_HISTORY_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "grocery-splitter", "history.sqlite3"),
+)
+HISTORY_FUZZY_THRESHOLD = 0.6  # minimum trigram similarity of a fuzzy name match
@@ -1,12 +1,68 @@
+import os
+import time
+
 import streamlit as st
 import streamlit.components.v1 as components
-from collections import defaultdict
-from typing import List, Dict, Union
+from streamlit.delta_generator import DeltaGenerator
+from typing import Any, Iterable, List, Dict, Hashable, Optional, Sequence, Tuple, Union
 
-from .constants import divider_color
+from .constants import (
+    divider_color,
+    ALLOCATIONS_KEY,
+    ALLOCATIONS_ORDER_KEY,
+    LEDGER_KEY,
+    LEDGER_VERIFY,
+    SPLIT_PENDING_KEY,
+    SPLIT_VIEW_KEY,
+    DEBUG_ENV_VAR,
+    DEBUG_QUERY_PARAM,
+    TIMINGS_KEY,
+    TIMINGS_HISTORY,
+    THUMBNAIL_FETCH_WORKERS,
+    AUTOSAVE_SNAPSHOT_KEY,
+    RESTORED_WIDGETS_KEY,
+    BULK_MESSAGE_KEY,
+    PARSE_POLL_INTERVAL,
+    CANCELLED_PARSE_KEY,
+    GRID_MODE_MIN_ITEMS,
+    GRID_MODE_MIN_PEOPLE,
+    ASSIGN_MODE_KEY,
+    GRID_ROWS_KEY,
+    GRID_EDITOR_KEY,
+)
+from .autosave import AllocationStore
+from .cache import LRUCache
+from .grid import (
+    ITEM_COLUMN,
+    ORDER_COLUMN,
+    QUANTITY_COLUMN,
+    PRICE_COLUMN,
+    EVERYONE_COLUMN,
+    default_quantities,
+    grid_allocations,
+    grid_rows,
+    person_column,
+)
+from .history import AssignmentHistory
+from .items import OrderItem, order_total, source_totals
+from .ledger import SplitLedger
+from .rules import SPECIAL_ALL, category_rules, match_buyers, parse_rules
+from .settle import settle_orders
+from .thumbnails import ThumbnailCache
+from .timing import Timeline, span
+from .workers import ParseJob, QUEUED
 
 
-def display_item(index: int, name: str, weight: str, quantity: int, price: float, image: str, names: List[str]) -> Dict[str, float]:
+def display_item(
+    index: int,
+    name: str,
+    weight: str,
+    quantity: int,
+    price: float,
+    image: str,
+    names: List[str],
+    source: str = "",
+) -> Dict[str, float]:
     """
     Display a single item with buyer selection and quantity allocation.
 
@@ -18,6 +74,7 @@ def display_item(index: int, name: str, weight: str, quantity: int, price: float
         price: Total price for all units
         image: Image URL
         names: List of people to split between
+        source: Order the item came from, shown when several orders are split together
 
     Returns:
         Dict mapping person name to quantity allocated (e.g., {"Alice": 2, "Bob": 1})
@@ -61,6 +118,8 @@ def display_item(index: int, name: str, weight: str, quantity: int, price: float
             """<p style="opacity:70%; padding:0; margin:0; ">""" + weight + "</p>",
             unsafe_allow_html=True,
         )
+        if source:
+            st.markdown(f":gray-background[:material/shopping_bag: {source}]")
 
     with col_quantity:
         st.markdown("<br/>", unsafe_allow_html=True)
@@ -99,11 +158,18 @@ def display_item(index: int, name: str, weight: str, quantity: int, price: float
         # Quantity > 1 and multiple people selected: show quantity allocation UI
         allocation = {}
 
-        for i, person in enumerate(selected):
-            # Default: distribute evenly, giving remainder to first person
-            default_qty = quantity // len(selected)
-            if i < quantity % len(selected):
-                default_qty += 1
+        # Default: distribute evenly, giving remainder to first person
+        defaults = default_quantities(quantity, selected)
+        for person in selected:
+            default_qty = defaults[person]
+
+            # Restored quantities are already in session state; passing a default
+            # as well makes Streamlit warn, and the argument has to stay the same
+            # on later reruns to keep the widget's identity
+            qty_key = f"qty_{index}_{person}"
+            restored = st.session_state.get(RESTORED_WIDGETS_KEY, set())
+            if qty_key in restored and qty_key not in st.session_state:
+                restored.discard(qty_key)
 
             # Each person on their own row: name + number input
             name_col, input_col = st.columns([2, 1])
@@ -117,9 +183,9 @@ def display_item(index: int, name: str, weight: str, quantity: int, price: float
                     f"Qty for {person}",
                     min_value=0,
                     max_value=quantity,
-                    value=default_qty,
+                    value=None if qty_key in restored else default_qty,
                     step=1,
-                    key=f"qty_{index}_{person}",
+                    key=qty_key,
                     label_visibility="collapsed",
                 )
                 allocation[person] = qty
@@ -144,18 +210,442 @@ def display_item(index: int, name: str, weight: str, quantity: int, price: float
     return allocation
 
 
-def display_order(items, names: List[str]) -> Union[Dict[str, float], str]:
+def get_allocations(order_key: Hashable = None) -> Dict[int, Dict[str, float]]:
+    """
+    Return the per-item allocations stored in session state.
+
+    Args:
+        order_key: Identifies the order being split; a different key than the
+            one stored resets the allocations. None returns the current ones.
+
+    Returns:
+        Dict mapping item index to its allocation ({person: quantity})
+    """
+    if order_key is not None and st.session_state.get(ALLOCATIONS_ORDER_KEY) != order_key:
+        st.session_state[ALLOCATIONS_ORDER_KEY] = order_key
+        st.session_state[ALLOCATIONS_KEY] = {}
+        st.session_state.pop(LEDGER_KEY, None)
+    return st.session_state.setdefault(ALLOCATIONS_KEY, {})
+
+
+def get_ledger(names: List[str]) -> SplitLedger:
+    """
+    Return the running split totals stored in session state.
+
+    The ledger is reset together with the allocations when the order changes,
+    and replayed when the people taking part change.
+
+    Args:
+        names: People taking part in the split
+    """
+    ledger = st.session_state.get(LEDGER_KEY)
+    if ledger is None:
+        ledger = st.session_state[LEDGER_KEY] = SplitLedger(names)
+    elif ledger.names != names:
+        ledger = st.session_state[LEDGER_KEY] = ledger.with_names(names)
+    return ledger
+
+
+def current_split(items: List[OrderItem], names: List[str]) -> Dict[str, float]:
+    """
+    Return the split of the allocations currently held in session state.
+
+    Totals are read from the ledger the item rows keep up to date. With
+    GROCERY_SPLITTER_VERIFY_LEDGER set, they are also checked against a full
+    recompute, which wins if the two disagree.
+    """
+    split = get_ledger(names).totals()
+    if LEDGER_VERIFY:
+        expected = get_ledger(names).verify((item.price for item in items), get_allocations())
+        if expected is not None:
+            return expected
+    return split
+
+
+def prefill_buyers(
+    items: List[OrderItem],
+    names: List[str],
+    history: AssignmentHistory,
+    skip: Optional[set] = None,
+) -> Dict[str, List[str]]:
+    """
+    Look up who bought each item in past splits.
+
+    Args:
+        items: Order items
+        names: People taking part in the split; remembered buyers not among
+            them are dropped
+        history: Assignment history to look the items up in
+        skip: Item indexes that already have buyers
+
+    Returns:
+        Dict mapping "buyers_{index}" widget keys to the remembered buyers
+    """
+    indexes = [idx for idx in range(len(items)) if not skip or idx not in skip]
+
+    prefilled = {}
+    for idx, buyers in zip(indexes, history.lookup([items[idx] for idx in indexes])):
+        buyers = pill_options(buyers or [], names)
+        if buyers:
+            prefilled[f"buyers_{idx}"] = buyers
+    return prefilled
+
+
+def pill_options(buyers: List[str], names: List[str]) -> List[str]:
+    """
+    Keep the buyers that are options of the "Bought by" pills.
+
+    "All" is only offered with more than one person, so for a single person it
+    becomes that person. Buyers not taking part in the split are dropped.
+    """
+    if SPECIAL_ALL in buyers and len(names) == 1:
+        buyers = names
+    options = set(names) | ({SPECIAL_ALL} if len(names) > 1 else set())
+    return [person for person in dict.fromkeys(buyers) if person in options]
+
+
+def restore_split(
+    split_key: Hashable,
+    items: List[OrderItem],
+    names: List[str],
+    autosave: Optional[AllocationStore] = None,
+    history: Optional[AssignmentHistory] = None,
+    preset: Optional[Dict[str, Any]] = None,
+) -> None:
+    """
+    Replace the item widgets of the previous order with the saved state of this split.
+
+    Items without saved buyers take the preset ones, and the rest are
+    pre-filled from the assignment history.
+
+    Args:
+        split_key: Key the split is saved under (see autosave_key)
+        items: Order items
+        names: People taking part in the split
+        autosave: Store to restore from; None starts the split from scratch
+        history: Past assignments used to pre-fill the remaining items
+        preset: Widget values of a split loaded from elsewhere (e.g. a receipt file)
+    """
+    for key in [key for key in st.session_state if key.startswith(("buyers_", "qty_"))]:
+        del st.session_state[key]
+    for key in (ASSIGN_MODE_KEY, GRID_ROWS_KEY, GRID_EDITOR_KEY):
+        st.session_state.pop(key, None)
+
+    saved = autosave.load(split_key) if autosave is not None else {}
+
+    if preset:
+        saved_rows = {int(key.split("_")[1]) for key in saved if key.startswith("buyers_")}
+        saved.update({key: value for key, value in preset.items() if int(key.split("_")[1]) not in saved_rows})
+
+    if history is not None:
+        saved_rows = {int(key.split("_")[1]) for key in saved if key.startswith("buyers_")}
+        prefilled = prefill_buyers(items, names, history, skip=saved_rows)
+        # Saved in one go rather than one row at a time as the rows render
+        if autosave is not None and prefilled:
+            autosave.save(split_key, prefilled)
+        saved.update(prefilled)
+
+    for key, value in saved.items():
+        st.session_state[key] = value
+
+    st.session_state[AUTOSAVE_SNAPSHOT_KEY] = dict(saved)
+    st.session_state[RESTORED_WIDGETS_KEY] = {key for key in saved if key.startswith("qty_")}
+
+
+def apply_bulk_rules(items: List[OrderItem], names: List[str], autosave: Optional[AllocationStore] = None) -> None:
+    """
+    Form callback assigning every item matched by the bulk rules at once.
+
+    Runs before the rerun the form submission triggers, so all the item rows
+    render with their new buyers in that single rerun. Quantities of changed
+    rows go back to their defaults.
+    """
+    try:
+        categories = {
+            person: st.session_state.get(f"bulk_category_{person}", "").split(",")
+            for person in [SPECIAL_ALL, *names]
+        }
+        rules = category_rules(categories) + parse_rules(st.session_state.get("bulk_rules", ""))
+    except ValueError as e:
+        st.session_state[BULK_MESSAGE_KEY] = ("error", str(e))
+        return
+
+    default = [SPECIAL_ALL] if st.session_state.get("bulk_rest_all") else None
+    keep_assigned = st.session_state.get("bulk_keep_assigned", True)
+
+    changes = {}
+    removed = []
+    for idx, buyers in enumerate(match_buyers(items, rules, default)):
+        key = f"buyers_{idx}"
+        buyers = pill_options(buyers or [], names)
+        if not buyers or (keep_assigned and st.session_state.get(key)) or st.session_state.get(key) == buyers:
+            continue
+
+        st.session_state[key] = changes[key] = buyers
+        for person in names:
+            qty_key = f"qty_{idx}_{person}"
+            if qty_key in st.session_state:
+                del st.session_state[qty_key]
+                removed.append(qty_key)
+
+    # The grid is rebuilt from the new buyers
+    st.session_state.pop(GRID_ROWS_KEY, None)
+    st.session_state.pop(GRID_EDITOR_KEY, None)
+
+    # Saved in one go rather than one row at a time as the rows render
+    snapshot = st.session_state.setdefault(AUTOSAVE_SNAPSHOT_KEY, {})
+    snapshot.update(changes)
+    for key in removed:
+        snapshot.pop(key, None)
+    if autosave is not None and (changes or removed):
+        autosave.save(st.session_state[ALLOCATIONS_ORDER_KEY], changes, removed)
+
+    st.session_state[BULK_MESSAGE_KEY] = ("success", f"Assigned {len(changes)} of {len(items)} items")
+
+
+def display_bulk_assign(items: List[OrderItem], names: List[str], autosave: Optional[AllocationStore] = None) -> None:
+    """
+    Display a form assigning many items at once from keyword lists and rules.
+
+    Args:
+        items: Order items
+        names: List of people to split between
+        autosave: Store the new buyers are saved to
+    """
+    with st.expander("&nbsp; &nbsp; Assign in bulk", icon=":material/checklist:"):
+        with st.form("bulk_assign", border=False):
+            st.write("Keywords (comma separated) matched against item names:")
+            people = [SPECIAL_ALL, *names] if len(names) > 1 else names
+            for person in people:
+                label = "Shared by everyone" if person == SPECIAL_ALL else f"Bought by {person}"
+                st.text_input(label, key=f"bulk_category_{person}", placeholder="e.g. milk, bread, eggs")
+
+            st.text_area(
+                "More rules, one per line",
+                key="bulk_rules",
+                placeholder="/^asda extra special/ -> Bob\nweight: 6 pack -> Alice, Carol",
+                help="Write `pattern -> buyer, buyer`. Put a pattern in slashes for a regular expression "
+                "and start it with `weight:` to match the weight. The first matching line wins, "
+                "after the keyword lists above.",
+            )
+            st.checkbox(f"Assign everything else to {'everyone' if len(names) > 1 else names[0]}", key="bulk_rest_all")
+            st.checkbox("Keep items that already have buyers", value=True, key="bulk_keep_assigned")
+            st.form_submit_button("Apply", icon=":material/done_all:", on_click=apply_bulk_rules, args=(items, names, autosave))
+
+        message = st.session_state.pop(BULK_MESSAGE_KEY, None)
+        if message is not None:
+            kind, text = message
+            (st.error if kind == "error" else st.success)(text)
+
+
+def remember_split(history: AssignmentHistory, items: List[OrderItem]) -> None:
+    """Button callback storing the buyers currently picked for each item in the history."""
+    buyers = [st.session_state.get(f"buyers_{idx}") for idx in range(len(items))]
+    recorded = history.record(items, buyers)
+    st.toast(f"Remembered who bought {recorded} items", icon=":material/history:")
+
+
+def autosave_row(autosave: AllocationStore, index: int, names: List[str]) -> None:
+    """Save the widget values of one item row that changed since they were last saved."""
+    autosave_widgets(autosave, [f"buyers_{index}"] + [f"qty_{index}_{person}" for person in names])
+
+
+def autosave_widgets(autosave: AllocationStore, keys: Iterable[str]) -> None:
+    """Save the values of item row widgets that changed since they were last saved."""
+    snapshot = st.session_state.setdefault(AUTOSAVE_SNAPSHOT_KEY, {})
+    changes = {}
+    removed = []
+    for key in keys:
+        value = st.session_state.get(key)
+        # Rows nobody was picked for are not saved
+        if value is None or value == []:
+            if snapshot.pop(key, None) is not None:
+                removed.append(key)
+        elif snapshot.get(key) != value:
+            changes[key] = snapshot[key] = value
+
+    if changes or removed:
+        autosave.save(st.session_state[ALLOCATIONS_ORDER_KEY], changes, removed)
+
+
+@st.fragment
+def display_item_row(
+    index: int,
+    name: str,
+    weight: str,
+    quantity: int,
+    price: float,
+    image: str,
+    names: List[str],
+    autosave: Optional[AllocationStore] = None,
+    source: str = "",
+) -> None:
+    """
+    Display one item as an independently rerunnable fragment.
+
+    Changing this item's buyers reruns only this row; the new allocation is
+    written to session state and the split ledger, and the changed widget
+    values are saved to the autosave store. A change to the totals is then
+    drawn into the split summary (see refresh_split).
+    """
+    allocation = display_item(index, name, weight, quantity, price, image, names, source)
+    get_allocations()[index] = allocation
+    changed = get_ledger(names).update(index, allocation, price)
+    if autosave is not None:
+        autosave_row(autosave, index, names)
+
+    st.divider()
+    st.markdown("<br/>", unsafe_allow_html=True)
+    refresh_split(changed)
+
+
+def refresh_split(changed: bool) -> None:
+    """
+    Redraw the split totals after an item row or the grid changed them on its own rerun.
+
+    Only the placeholders of the last split summary are rewritten: the totals,
+    the transfers and, as the files were built for the old allocations, the
+    download buttons, which give way to a note until the summary is refreshed.
+    Nothing is redrawn during a full run, where the summary follows the items.
+    """
+    if not changed or st.session_state.get(SPLIT_PENDING_KEY):
+        return
+
+    view = st.session_state.get(SPLIT_VIEW_KEY)
+    if view is None:
+        # Nothing was assigned when the summary was drawn, so it has no totals to update
+        st.rerun(scope="app")
+
+    display_totals(view["items"], view["names"], view["metrics"], view["people"])
+    if view["transfers"] is not None:
+        display_transfers(view["items"], view["names"], view["transfers"])
+    if view["downloads"] is not None:
+        view["downloads"].caption(":material/sync: &nbsp; Refresh the downloads to include the latest changes")
+
+
+def switch_assign_mode() -> None:
+    """Radio callback carrying the buyers over between the item rows and the grid."""
+    # The grid is rebuilt from the item row widget values the next time it opens
+    st.session_state.pop(GRID_ROWS_KEY, None)
+    st.session_state.pop(GRID_EDITOR_KEY, None)
+    if st.session_state.get(ASSIGN_MODE_KEY) != "grid":
+        # Quantities set in the grid are already in session state; set them
+        # afresh, as if restored, so they are not tied to the inputs last shown
+        restored = st.session_state[RESTORED_WIDGETS_KEY] = set()
+        for key in [key for key in st.session_state if key.startswith("qty_")]:
+            value = st.session_state[key]
+            del st.session_state[key]
+            st.session_state[key] = value
+            restored.add(key)
+
+
+@st.fragment
+def display_item_grid(
+    items: List[OrderItem],
+    names: List[str],
+    autosave: Optional[AllocationStore] = None,
+) -> None:
+    """
+    Display every item in one editable grid of the units each person takes.
+
+    A single widget however many items and people there are, so editing a
+    cell reruns only this fragment and sends one table rather than a row of
+    widgets per item. The edited grid is validated and converted to
+    allocations in one pass; the item row widget values it stands for are
+    kept in session state, so the rows, the history and the autosave store
+    see the same buyers.
+
+    Args:
+        items: Order items
+        names: List of people to split between
+        autosave: Store the changed buyers are saved to
+    """
+    rows = st.session_state.get(GRID_ROWS_KEY)
+    if rows is None:
+        rows = st.session_state[GRID_ROWS_KEY] = grid_rows(items, names, st.session_state)
+
+    column_config = {
+        ITEM_COLUMN: st.column_config.TextColumn("Item", width="large"),
+        ORDER_COLUMN: st.column_config.TextColumn("Order"),
+        QUANTITY_COLUMN: st.column_config.NumberColumn("Qty", format="%d"),
+        PRICE_COLUMN: st.column_config.NumberColumn("Price", format="£ %.2f"),
+        EVERYONE_COLUMN: st.column_config.CheckboxColumn("All", help="Shared by everyone"),
+    }
+    for person in names:
+        column_config[person_column(person)] = st.column_config.NumberColumn(
+            person, min_value=0, step=1, format="%d", help=f"Units {person} takes"
+        )
+
+    edited = st.data_editor(
+        rows,
+        key=GRID_EDITOR_KEY,
+        column_config=column_config,
+        disabled=[ITEM_COLUMN, ORDER_COLUMN, QUANTITY_COLUMN, PRICE_COLUMN],
+        hide_index=True,
+        num_rows="fixed",
+        use_container_width=True,
+    )
+
+    allocations, widgets, problems = grid_allocations(edited, items, names)
+    stored = get_allocations()
+    ledger = get_ledger(names)
+    changed = False
+    for idx, allocation in allocations.items():
+        stored[idx] = allocation
+        changed = ledger.update(idx, allocation, items[idx].price) or changed
+
+    for key, value in widgets.items():
+        if value is not None:
+            st.session_state[key] = value
+        elif key in st.session_state:
+            del st.session_state[key]
+    if autosave is not None:
+        autosave_widgets(autosave, widgets)
+
+    if problems:
+        st.warning(
+            f"{len(problems)} {'item needs' if len(problems) == 1 else 'items need'} a look:  \n" + "  \n".join(problems[:10])
+            + ("  \n..." if len(problems) > 10 else ""),
+            icon=":material/warning:",
+        )
+    refresh_split(changed)
+
+
+def display_order(
+    items: List[OrderItem],
+    names: List[str],
+    order_key: Hashable = None,
+    thumbnails: Optional[ThumbnailCache] = None,
+    autosave: Optional[AllocationStore] = None,
+    history: Optional[AssignmentHistory] = None,
+    preset: Optional[Dict[str, Any]] = None,
+) -> Union[Dict[str, float], str]:
     """
     Display all order items and calculate price split.
 
     Args:
-        items: DataFrame of items with columns: name, weight, quantity, price, image
+        items: Order items (name, weight, quantity, price, image)
         names: List of people to split between
+        order_key: Identifies the split (receipt and names) so allocations reset,
+            or are restored from autosave, when it changes
+        thumbnails: Cache serving item images as inline thumbnails; None links
+            to the remote images directly
+        autosave: Store saving allocation changes and restoring them on a new session
+        history: Past assignments pre-filling the buyers of a new split
+        preset: Item row widget values of a split loaded from a receipt file,
+            used for the items autosave has nothing for
 
     Returns:
         Dict mapping person name to total amount owed, or "no_order" if no items
     """
-    if not items.empty:
+    if items:
+        # The split summary is drawn after the items in this run
+        st.session_state[SPLIT_PENDING_KEY] = True
+        if order_key is not None and st.session_state.get(ALLOCATIONS_ORDER_KEY) != order_key:
+            with span("restore"):
+                restore_split(order_key, items, names, autosave, history, preset)
+        get_allocations(order_key)
+
         col_1, col_2 = st.columns([4, 1])
 
         with col_1:
@@ -165,89 +655,260 @@ def display_order(items, names: List[str]) -> Union[Dict[str, float], str]:
         with col_2:
             st.metric(
                 "Order Total",
-                f"£ {items['price'].sum():.2f}",
+                f"£ {order_total(items):.2f}",
                 delta=None,
                 delta_color="normal",
                 border=True,
                 help="Total amount of the order.",
             )
+            # Orders split together are also totalled one by one, to check against each receipt
+            totals = source_totals(items)
+            if len(totals) > 1:
+                st.caption("  \n".join(f"{source}: £ {total:.2f}" for source, total in totals.items()))
+
+        display_bulk_assign(items, names, autosave)
 
-        # Store who bought what
-        assignments = items.to_dict(orient="records")
+        # Big orders and big groups start in the grid, which stays one widget
+        if ASSIGN_MODE_KEY not in st.session_state:
+            big = len(items) >= GRID_MODE_MIN_ITEMS or len(names) >= GRID_MODE_MIN_PEOPLE
+            st.session_state[ASSIGN_MODE_KEY] = "grid" if big else "rows"
+        st.radio(
+            "Assign items",
+            ["rows", "grid"],
+            format_func={"rows": "One row per item", "grid": "Grid"}.get,
+            key=ASSIGN_MODE_KEY,
+            horizontal=True,
+            on_change=switch_assign_mode,
+            help="The grid shows every item and person in one table, which stays quick with "
+            "long orders and large groups.",
+        )
+        st.markdown("<br/>", unsafe_allow_html=True)
+
+        if st.session_state[ASSIGN_MODE_KEY] == "grid":
+            with span("grid", items=len(items), people=len(names)):
+                display_item_grid(items, names, autosave)
+            return current_split(items, names)
+
+        images = [row.image for row in items]
+        if thumbnails is not None:
+            with span("thumbnails", images=len(images)):
+                thumbnails.prefetch(images, workers=THUMBNAIL_FETCH_WORKERS)
+                images = [thumbnails.data_uri(image) for image in images]
 
-        # read from the row of the dataframe
-        for idx, row in items.iterrows():
-            buyers = display_item(
+        # each row stores who bought it
+        for idx, row in enumerate(items):
+            display_item_row(
                 idx,
-                row["name"],
-                row["weight"],
-                row["quantity"],
-                row["price"],
-                row["image"],
+                row.name,
+                row.weight,
+                row.quantity,
+                row.price,
+                images[idx],
                 names,
+                autosave,
+                row.source,
             )
-            assignments[idx]["bought_by"] = buyers
-        
-            st.divider()
-            st.markdown("<br/>", unsafe_allow_html=True)
 
         # --- Calculate price split based on quantity allocation ---
-        split = defaultdict(float)
+        return current_split(items, names)
 
-        for item in assignments:
-            buyers = item["bought_by"]  # Dict: {person: quantity_allocated}
-            price = item["price"]
+    else:
+        st.info(
+            "&nbsp; No items found. Please upload a valid order receipt.",
+            icon=":material/info:",
+        )
+        return "no_order"
 
-            if buyers:
-                # Calculate total allocated quantity
-                total_allocated = sum(buyers.values())
 
-                if total_allocated > 0:
-                    # Price per unit of allocation
-                    price_per_unit = price / total_allocated
+def display_exports(
+    items: List[OrderItem],
+    names: List[str],
+    exports: LRUCache,
+    orders: Sequence[Tuple[str, str]] = (),
+) -> None:
+    """
+    Display download buttons for the split as CSV and PDF, and for the order as a receipt file.
 
-                    # Assign cost based on quantity allocation
-                    total_assigned = 0.0
-                    buyer_list = list(buyers.items())
+    The files are generated on the server, once per allocation state: they
+    are rebuilt when the split summary is drawn after an allocation changed,
+    and other sessions with the same split share them.
 
-                    for i, (person, qty_allocated) in enumerate(buyer_list):
-                        if i == len(buyer_list) - 1:
-                            # Last person gets remaining amount to avoid rounding errors
-                            split[person] += round(price - total_assigned, 2)
-                        else:
-                            person_cost = round(price_per_unit * qty_allocated, 2)
-                            split[person] += person_cost
-                            total_assigned += person_cost
+    Args:
+        items: Order items
+        names: List of people to split between
+        exports: Cache of generated files, keyed by format and allocation hash
+        orders: (source, store key) of each order split, for the receipt file
+    """
+    # numpy is only needed once there is an order to split
+    from .export import export_key, split_csv, split_pdf
+    from .receipt import RECEIPT_EXTENSION, RECEIPT_MIME, dump_receipt
 
-        return split
+    allocations = get_allocations()
+    key = export_key(st.session_state.get(ALLOCATIONS_ORDER_KEY), names, allocations, items)
 
-    else:
-        st.info(
-            "&nbsp; No items found. Please upload a valid order receipt.",
-            icon=":material/info:",
+    csv_col, pdf_col = st.columns(2)
+    csv_col.download_button(
+        "CSV",
+        exports.get_or_compute(("csv", key), lambda: split_csv(items, allocations, names)),
+        file_name="grocery-split.csv",
+        mime="text/csv",
+        icon=":material/table:",
+        use_container_width=True,
+    )
+    pdf_col.download_button(
+        "PDF",
+        exports.get_or_compute(("pdf", key), lambda: split_pdf(items, allocations, names)),
+        file_name="grocery-split.pdf",
+        mime="application/pdf",
+        icon=":material/picture_as_pdf:",
+        use_container_width=True,
+    )
+    st.download_button(
+        "Receipt",
+        exports.get_or_compute(("receipt", key), lambda: dump_receipt(items, orders, names, allocations)),
+        file_name="grocery-split" + RECEIPT_EXTENSION,
+        mime=RECEIPT_MIME,
+        icon=":material/data_object:",
+        help="The items and who bought them, to upload again later without the original receipt.",
+        use_container_width=True,
+    )
+
+
+def display_settlement(items: List[OrderItem], names: List[str]) -> DeltaGenerator:
+    """
+    Display who paid for each order and the fewest transfers that settle everyone up.
+
+    Each order (each uploaded receipt) can have a different payer; orders
+    without one are left out. Only assigned items are settled.
+
+    Args:
+        items: Order items, tagged by order when several receipts are split together
+        names: List of people to split between
+
+    Returns:
+        Placeholder holding the transfers, redrawn when the totals change
+    """
+    st.write(":material/payments: &nbsp; Settle up")
+    for source in dict.fromkeys(item.source for item in items):
+        st.selectbox(
+            f"Who paid for {source}?" if source else "Who paid?",
+            names,
+            index=None,
+            key=f"payer_{source}",
+            placeholder="Pick who paid",
         )
-        return "no_order"
+    transfers = st.empty()
+    display_transfers(items, names, transfers)
+    return transfers
 
 
-def display_split(split: Union[Dict[str, float], str], items) -> None:
+def display_transfers(items: List[OrderItem], names: List[str], placeholder: DeltaGenerator) -> None:
+    """Draw the transfers settling the orders whose payer is picked into placeholder."""
+    payers = {source: st.session_state.get(f"payer_{source}") for source in dict.fromkeys(item.source for item in items)}
+    if not any(payers.values()):
+        placeholder.empty()
+        return
+
+    by_order = get_ledger(names).totals_by([item.source for item in items])
+    transfers = settle_orders([(payer, by_order.get(source, {})) for source, payer in payers.items() if payer])
+    with placeholder.container():
+        for transfer in transfers:
+            st.write(f":material/arrow_forward: &nbsp; {transfer.sender} pays {transfer.recipient} &nbsp; **£ {transfer.amount:.2f}**")
+        if not transfers:
+            st.write(":material/check: &nbsp; Everyone is settled up")
+        if not all(payers.values()):
+            st.caption("Orders nobody is marked as having paid for are left out.")
+
+
+def display_totals(
+    items: List[OrderItem],
+    names: List[str],
+    metrics: DeltaGenerator,
+    people: DeltaGenerator,
+) -> None:
+    """
+    Draw the split totals into the placeholders of the split summary.
+
+    Args:
+        items: Order items for calculating totals
+        names: List of people to split between
+        metrics: Placeholder of the total, assigned and remaining amounts
+        people: Placeholder of the amount each person owes
+    """
+    split = current_split(items, names)
+    total = sum(split.values())
+
+    with metrics.container():
+        sub_col1, sub_col2, sub_col3 = st.columns(3)
+        sub_col1.metric(
+            label="Total Amount",
+            value="£{:.2f}".format(order_total(items)),
+        )
+        sub_col2.metric(
+            label="Total Assigned",
+            value="£{:.2f}".format(total),
+        )
+        sub_col3.metric(
+            label="Total Remaining",
+            value="£{:.2f}".format(order_total(items) - total),
+        )
+
+    with people.container():
+        for person, amount in split.items():
+            name, price, share = st.columns([2, 1, 1])
+
+            with name:
+                st.write(f":material/person: &nbsp; {person}")
+
+            with price:
+                st.write(f"&nbsp; £ {amount:.2f}")
+
+            with share:
+                if total > 0:
+                    st.write(f"&nbsp; {amount/total:.2%}")
+                else:
+                    st.write("&nbsp; 0.00%")
+
+            st.divider()
+
+
+@st.fragment
+def display_split(
+    items: List[OrderItem],
+    names: List[str],
+    history: Optional[AssignmentHistory] = None,
+    exports: Optional[LRUCache] = None,
+    orders: Sequence[Tuple[str, str]] = (),
+) -> None:
     """
     Display the split summary showing how much each person owes.
 
+    Runs as a fragment drawn from the split ledger after the item rows. The
+    totals are drawn into placeholders kept in session state, so an item row
+    or the grid rerunning on its own redraws them without rerunning the app
+    (see refresh_split).
+
     Args:
-        split: Dict mapping person name to amount, or "no_order"
-        items: DataFrame of items for calculating totals
+        items: Order items for calculating totals
+        names: List of people to split between
+        history: Assignment history the "remember" button stores the buyers in
+        exports: Cache of the generated CSV/PDF/receipt downloads; None hides them
+        orders: (source, store key) of each order split, saved in the receipt file
     """
+    st.session_state.pop(SPLIT_PENDING_KEY, None)
+    st.session_state.pop(SPLIT_VIEW_KEY, None)
     st.markdown("<br/>", unsafe_allow_html=True)
 
-    if split == "no_order":
+    if not items:
         return
 
-    if split:
+    if current_split(items, names):
         col1, col2 = st.columns([4, 1])
         with col1:
             st.subheader(":material/receipt_long: &nbsp; Split Summary", divider=divider_color)
             st.markdown("<br/>", unsafe_allow_html=True)
         
+        downloads = None
         with col2:
             components.html(
                 """
@@ -272,44 +933,49 @@ def display_split(split: Union[Dict[str, float], str], items) -> None:
                 """,
                 height=50,
             )
+            if exports is not None:
+                downloads = st.empty()
+                with downloads.container():
+                    display_exports(items, names, exports, orders)
+                # Rerunning the summary rebuilds the files after the rows changed the split
+                st.button(
+                    "Refresh downloads",
+                    icon=":material/refresh:",
+                    type="tertiary",
+                    help="Rebuild the downloads with the latest changes.",
+                )
             
         st.markdown("<br/>", unsafe_allow_html=True)
 
         metric_col, split_col = st.columns(2)
 
         with metric_col:
-            sub_col1, sub_col2, sub_col3 = metric_col.columns(3)
-            sub_col1.metric(
-                label="Total Amount",
-                value="£{:.2f}".format(items.price.sum()),
-            )
-            sub_col2.metric(
-                label="Total Assigned",
-                value="£{:.2f}".format(sum(split.values())),
-            )
-            sub_col3.metric(
-                label="Total Remaining",
-                value="£{:.2f}".format((items.price.sum()) - sum(split.values())),
-            )
+            metrics = st.empty()
 
         with split_col:
-            total = sum(split.values())
-            for person, amount in split.items():
-                name, price, share = split_col.columns([2, 1, 1])
-
-                with name:
-                    st.write(f":material/person: &nbsp; {person}")
+            people = st.empty()
+            transfers = None
+            if len(names) > 1:
+                transfers = display_settlement(items, names)
 
-                with price:
-                    st.write(f"&nbsp; £ {amount:.2f}")
-
-                with share:
-                    if total > 0:
-                        st.write(f"&nbsp; {amount/total:.2%}")
-                    else:
-                        st.write("&nbsp; 0.00%")
+            if history is not None:
+                st.button(
+                    "Remember who bought what",
+                    icon=":material/history:",
+                    on_click=remember_split,
+                    args=(history, items),
+                    help="Pre-fill these buyers the next time the same items are ordered.",
+                )
 
-                split_col.divider()
+        display_totals(items, names, metrics, people)
+        st.session_state[SPLIT_VIEW_KEY] = {
+            "items": items,
+            "names": names,
+            "metrics": metrics,
+            "people": people,
+            "transfers": transfers,
+            "downloads": downloads,
+        }
 
     else:
         st.info(
@@ -318,3 +984,142 @@ def display_split(split: Union[Dict[str, float], str], items) -> None:
         )
 
     st.markdown("<br/>", unsafe_allow_html=True)
+
+
+# Share of the progress bar reached when each parse stage starts; extract fills the rest
+PARSE_STAGE_PROGRESS = {
+    QUEUED: (0.0, "Waiting for a free worker"),
+    "webarchive": (0.05, "Reading the web archive"),
+    "sniff": (0.1, "Detecting the store"),
+    "soup": (0.15, "Reading the page"),
+    "extract": (0.4, "Finding items"),
+    "stream": (0.15, "Reading the page"),
+}
+
+
+def display_parse_progress(jobs: Dict[str, ParseJob], waiter: Hashable = None) -> Dict[str, Optional[List[OrderItem]]]:
+    """
+    Show the progress of background parses until they finish, each with a cancel button.
+
+    All jobs are already queued, so they run side by side while this waits.
+    Clicking cancel reruns the script, which stops this wait; the rerun then
+    cancels that job (unless other sessions still wait for it) and remembers
+    the receipt so it is not parsed again until the user retries.
+
+    Args:
+        jobs: Job parsing each uploaded receipt, by order name
+        waiter: Identifies this session to the pool
+
+    Returns:
+        The parsed items of each order, or None for the ones that were cancelled
+        (a receipt whose worker process died has no items and an error is shown)
+    """
+    results: Dict[str, Optional[List[OrderItem]]] = {}
+    failed: Dict[str, str] = {}
+    bars = {}
+    # Both the bars and the buttons are cleared once the items are in
+    placeholder = st.empty()
+    with placeholder.container():
+        for source, job in jobs.items():
+            bar_col, button_col = st.columns([5, 1], vertical_alignment="bottom")
+            if button_col.button("Cancel", key=f"cancel_parse_{job.key}", icon=":material/close:"):
+                job.cancel(waiter)
+                st.session_state.setdefault(CANCELLED_PARSE_KEY, set()).add(job.key)
+                results[source] = None
+                continue
+            bars[source] = bar_col.progress(0.0, text=PARSE_STAGE_PROGRESS[QUEUED][1])
+
+    label = len(jobs) > 1
+    waiting = {source: jobs[source] for source in bars}
+    while waiting:
+        for source, job in list(waiting.items()):
+            if job.done():
+                results[source] = job.result()
+                if job.error:
+                    failed[source] = job.error
+                bars[source].progress(1.0, text=f"{source}: done" if label else "Done")
+                del waiting[source]
+                continue
+
+            stage, done, total = job.progress()
+            start, text = PARSE_STAGE_PROGRESS.get(stage, (0.0, stage))
+            if stage == QUEUED:
+                ahead = job.pool.queued_ahead(job)
+                text = f"{text} ({ahead} receipt{'s' if ahead != 1 else ''} ahead)" if ahead else text
+            elif stage == "extract" and total:
+                start += (1 - start) * done / total
+                text = f"{text}: {done} / {total} rows"
+            elif stage == "stream" and total:
+                start += (1 - start) * done / total
+                text = f"{text}: {done // 1024} / {total // 1024} KB"
+            bars[source].progress(min(start, 1.0), text=f"{source}: {text}" if label else text)
+        if waiting:
+            time.sleep(PARSE_POLL_INTERVAL)
+
+    placeholder.empty()
+    for source, error in failed.items():
+        st.error(f"&nbsp; {f'{source}: ' if label else ''}{error}.", icon=":material/error:")
+    return {source: results[source] for source in jobs}
+
+
+def display_parse_cancelled(key: str, source: str = "") -> bool:
+    """
+    Show that parsing a receipt was cancelled, with a button to parse it after all.
+
+    Args:
+        key: Hash of the receipt
+        source: Order name shown when several receipts are uploaded
+
+    Returns:
+        True if the user asked to retry (the cancellation is forgotten)
+    """
+    receipt = f"**{source}**" if source else "the receipt"
+    st.info(f"&nbsp; Reading {receipt} was cancelled.", icon=":material/info:")
+    if st.button("Read it anyway", key=f"retry_parse_{key}", icon=":material/refresh:"):
+        st.session_state.get(CANCELLED_PARSE_KEY, set()).discard(key)
+        return True
+    return False
+
+
+def debug_enabled() -> bool:
+    """Whether the debug panel was requested through the query string or the environment"""
+    if os.environ.get(DEBUG_ENV_VAR, "").lower() in ("1", "true", "yes"):
+        return True
+    return st.query_params.get(DEBUG_QUERY_PARAM, "").lower() in ("1", "true", "yes")
+
+
+def display_timings(timeline: Timeline) -> None:
+    """
+    Display a collapsible breakdown of where the time went in this rerun.
+
+    The current run's spans are kept in session state so the panel also shows
+    totals for the previous reruns of the session.
+
+    Args:
+        timeline: Timeline collected during the current script run
+    """
+    history = st.session_state.setdefault(TIMINGS_KEY, [])
+    history.append({
+        "run": timeline.run_id,
+        "total ms": round(timeline.total_ms(), 1),
+        "spans": len(timeline.spans),
+        "parse ms": sum(s["ms"] for s in timeline.spans if s["stage"] == "parse"),
+    })
+    del history[:-TIMINGS_HISTORY]
+
+    with st.expander("&nbsp; &nbsp; Timings", icon=":material/timer:"):
+        st.write(f"Run {timeline.run_id}: {timeline.total_ms():.1f} ms so far")
+        st.table([
+            {
+                "stage": ("↳ " if "parent" in record else "") + record["stage"],
+                "ms": record["ms"],
+                "details": ", ".join(
+                    f"{key}={value}" for key, value in record.items()
+                    if key not in ("stage", "ms", "run", "parent")
+                ),
+            }
+            for record in timeline.spans
+        ])
+
+        st.write("Recent reruns:")
+        st.table(history[::-1])
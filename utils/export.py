@@ -0,0 +1,333 @@
+import io
+import csv
+import json
+import zlib
+import hashlib
+from typing import Dict, Hashable, List, Mapping, Optional, Tuple
+
+from .items import OrderItem
+from .split import allocation_matrix, split_shares, to_pence
+
+# (item, quantity allocated to the person, pence they owe for it)
+BreakdownRow = Tuple[OrderItem, float, int]
+
+CSV_COLUMNS = ["person", "order", "item", "weight", "quantity", "amount"]
+
+# A4 in points
+PAGE_WIDTH = 595.28
+PAGE_HEIGHT = 841.89
+MARGIN = 48
+FONT_SIZE = 10
+LINE_HEIGHT = 16
+
+# Helvetica glyph widths (1/1000 em) for printable ASCII, from the standard
+# AFM metrics; anything else is counted as a digit
+HELVETICA_WIDTHS = dict(zip(
+    map(chr, range(32, 127)),
+    [
+        278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+        556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+        1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+        667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+        333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+        556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+    ],
+))
+# Helvetica-Bold is slightly wider on average
+BOLD_WIDTH_FACTOR = 1.07
+
+
+def export_key(
+    order_key: Hashable,
+    names: List[str],
+    allocations: Mapping[int, Mapping[str, float]],
+    items: Optional[List[OrderItem]] = None,
+) -> str:
+    """
+    Return a hash of the allocation state an export is generated from.
+
+    Args:
+        order_key: Identifies the receipts and people being split (see autosave_key)
+        names: People taking part in the split
+        allocations: Per-item allocations ({index: {person: quantity}})
+        items: Order items; only hashed when there is no order_key
+    """
+    state = {
+        "order": str(order_key) if order_key is not None else None,
+        "names": names,
+        "allocations": sorted((idx, sorted(allocation.items())) for idx, allocation in allocations.items() if allocation),
+    }
+    if order_key is None and items is not None:
+        state["items"] = [[item.source, item.name, item.weight, item.quantity, item.price] for item in items]
+    return hashlib.sha256(json.dumps(state, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def split_breakdown(
+    items: List[OrderItem],
+    allocations: Mapping[int, Mapping[str, float]],
+    names: List[str],
+) -> Dict[str, List[BreakdownRow]]:
+    """
+    Return the items each person pays for, with their quantity and share in pence.
+
+    Shares come from the same split as the summary, so they add up exactly to
+    each person's total.
+
+    Args:
+        items: Order items
+        allocations: Per-item allocations ({index: {person: quantity}})
+        names: People taking part in the split
+
+    Returns:
+        Dict mapping each person with at least one item to their rows, in item order
+    """
+    matrix = allocation_matrix([allocations.get(idx, {}) for idx in range(len(items))], names)
+    shares = split_shares(to_pence(item.price for item in items), matrix)
+
+    breakdown = {}
+    for j, person in enumerate(names):
+        rows = [(items[i], float(matrix[i, j]), int(shares[i, j])) for i in matrix[:, j].nonzero()[0]]
+        if rows:
+            breakdown[person] = rows
+    return breakdown
+
+
+def format_quantity(quantity: float) -> str:
+    """Whole units as integers, equal shares of a unit to two decimals"""
+    return str(int(quantity)) if float(quantity).is_integer() else f"{quantity:.2f}"
+
+
+def split_csv(items: List[OrderItem], allocations: Mapping[int, Mapping[str, float]], names: List[str]) -> bytes:
+    """
+    Export the split as CSV: one row per person and item, then a total row per person.
+
+    Returns:
+        UTF-8 CSV with a byte order mark, so spreadsheet apps read the £ and accents
+    """
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(CSV_COLUMNS)
+    for person, rows in split_breakdown(items, allocations, names).items():
+        for item, quantity, pence in rows:
+            writer.writerow([person, item.source, item.name, item.weight, format_quantity(quantity), f"{pence / 100:.2f}"])
+        writer.writerow([person, "", "Total", "", "", f"{sum(pence for *_, pence in rows) / 100:.2f}"])
+    return out.getvalue().encode("utf-8-sig")
+
+
+def text_width(text: str, size: float, bold: bool = False) -> float:
+    """Width of text set in Helvetica at size points"""
+    width = sum(HELVETICA_WIDTHS.get(char, 556) for char in text) * size / 1000
+    return width * BOLD_WIDTH_FACTOR if bold else width
+
+
+def fit_text(text: str, width: float, size: float, bold: bool = False) -> str:
+    """Shorten text with an ellipsis until it fits width"""
+    if text_width(text, size, bold) <= width:
+        return text
+    while text and text_width(text + "...", size, bold) > width:
+        text = text[:-1]
+    return text.rstrip() + "..."
+
+
+def _pdf_string(text: str) -> bytes:
+    """Encode text as a PDF literal string in the fonts' WinAnsi encoding"""
+    data = text.encode("cp1252", errors="replace")
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+class PdfDocument:
+    """
+    Minimal PDF writer for text reports on A4 pages.
+
+    Only draws text in the standard Helvetica fonts (which every PDF viewer
+    has, so nothing is embedded) and thin rules, which is all the split
+    export needs and keeps it free of any PDF library.
+
+    Args:
+        title: Document title shown by PDF viewers
+    """
+
+    def __init__(self, title: str = ""):
+        self.title = title
+        self.pages: List[List[bytes]] = []
+        self.y = 0.0
+        self.new_page()
+
+    def new_page(self) -> None:
+        self.pages.append([])
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def ensure(self, height: float) -> bool:
+        """Start a new page unless height still fits above the bottom margin; True if it did"""
+        if self.y - height < MARGIN:
+            self.new_page()
+            return True
+        return False
+
+    def text(
+        self,
+        x: float,
+        text: str,
+        size: float = FONT_SIZE,
+        bold: bool = False,
+        align: str = "left",
+        gray: float = 0.0,
+        y: Optional[float] = None,
+    ) -> None:
+        """
+        Draw a line of text on the current page
+
+        Args:
+            x: Left edge, or right edge when align is "right"
+            text: Text to draw
+            size: Font size in points
+            bold: Use Helvetica-Bold
+            align: "left" or "right"
+            gray: Text color from 0 (black) to 1 (white)
+            y: Baseline (defaults to the current line)
+        """
+        if align == "right":
+            x -= text_width(text, size, bold)
+        font = b"/F2" if bold else b"/F1"
+        self.pages[-1].append(
+            b"%.2f g BT %s %.1f Tf %.2f %.2f Td %s Tj ET"
+            % (gray, font, size, x, self.y if y is None else y, _pdf_string(text))
+        )
+
+    def rule(self, gray: float = 0.8) -> None:
+        """Draw a horizontal line across the page just below the current line"""
+        y = self.y - LINE_HEIGHT / 3
+        self.pages[-1].append(b"%.2f G 0.5 w %.2f %.2f m %.2f %.2f l S" % (gray, MARGIN, y, PAGE_WIDTH - MARGIN, y))
+
+    def newline(self, height: float = LINE_HEIGHT) -> None:
+        self.y -= height
+
+    def to_bytes(self) -> bytes:
+        """Serialise the document, numbering the pages in their footers"""
+        objects = [
+            b"<< /Type /Catalog /Pages 2 0 R >>",
+            None,  # page tree, once the page objects are known
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+            b"<< /Title %s /Producer (grocery-splitter) >>" % _pdf_string(self.title),
+        ]
+
+        page_ids = []
+        for number, operations in enumerate(self.pages, start=1):
+            footer = f"Page {number} of {len(self.pages)}"
+            x = PAGE_WIDTH - MARGIN - text_width(footer, 8)
+            stream = zlib.compress(b"\n".join([
+                *operations,
+                b"0.50 g BT /F1 8.0 Tf %.2f %.2f Td %s Tj ET" % (x, MARGIN / 2, _pdf_string(footer)),
+            ]))
+            objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream" % (len(stream), stream))
+            objects.append(
+                b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] "
+                b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>"
+                % (PAGE_WIDTH, PAGE_HEIGHT, len(objects))
+            )
+            page_ids.append(len(objects))
+
+        objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            b" ".join(b"%d 0 R" % page_id for page_id in page_ids), len(page_ids)
+        )
+
+        out = io.BytesIO()
+        out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(out.tell())
+            out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+
+        xref = out.tell()
+        out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        out.writelines(b"%010d 00000 n \n" % offset for offset in offsets)
+        out.write(b"trailer\n<< /Size %d /Root 1 0 R /Info 5 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+        return out.getvalue()
+
+
+def split_pdf(
+    items: List[OrderItem],
+    allocations: Mapping[int, Mapping[str, float]],
+    names: List[str],
+    title: str = "Grocery split",
+) -> bytes:
+    """
+    Export the split as a PDF: the summary, then the items each person pays for.
+
+    Args:
+        items: Order items
+        allocations: Per-item allocations ({index: {person: quantity}})
+        names: People taking part in the split
+        title: Heading of the first page
+
+    Returns:
+        PDF file contents
+    """
+    breakdown = split_breakdown(items, allocations, names)
+    totals = {person: sum(pence for *_, pence in rows) for person, rows in breakdown.items()}
+    total = int(to_pence(item.price for item in items).sum())
+    assigned = sum(totals.values())
+    right = PAGE_WIDTH - MARGIN
+    with_source = any(item.source for item in items)
+
+    pdf = PdfDocument(title)
+    pdf.text(MARGIN, title, size=18, bold=True)
+    pdf.newline(LINE_HEIGHT * 1.4)
+    orders = len({item.source for item in items})
+    pdf.text(MARGIN, f"{len(items)} items" + (f" from {orders} orders" if with_source else ""), gray=0.4)
+    pdf.newline(LINE_HEIGHT * 2)
+
+    for label, pence in [("Total amount", total), ("Total assigned", assigned), ("Total remaining", total - assigned)]:
+        pdf.text(MARGIN, label)
+        pdf.text(MARGIN + 180, f"£ {pence / 100:.2f}", align="right", bold=True)
+        pdf.newline()
+    pdf.newline()
+
+    pdf.text(MARGIN, "Person", bold=True)
+    pdf.text(right - 80, "Amount", bold=True, align="right")
+    pdf.text(right, "Share", bold=True, align="right")
+    pdf.rule()
+    pdf.newline()
+    for person, pence in totals.items():
+        pdf.ensure(LINE_HEIGHT)
+        pdf.text(MARGIN, fit_text(person, right - 160 - MARGIN, FONT_SIZE))
+        pdf.text(right - 80, f"£ {pence / 100:.2f}", align="right")
+        pdf.text(right, f"{pence / assigned:.2%}" if assigned else "0.00%", align="right")
+        pdf.newline()
+
+    # Column layout of the per-person tables
+    quantity_x = right - 80
+    source_x = quantity_x - 150
+    item_width = (source_x if with_source else quantity_x - 50) - MARGIN - 10
+
+    def table_header() -> None:
+        pdf.text(MARGIN, "Item", bold=True)
+        if with_source:
+            pdf.text(source_x, "Order", bold=True)
+        pdf.text(quantity_x, "Qty", bold=True, align="right")
+        pdf.text(right, "Amount", bold=True, align="right")
+        pdf.rule()
+        pdf.newline()
+
+    for person, rows in breakdown.items():
+        pdf.newline(LINE_HEIGHT)
+        # Keep a heading together with the first rows of its table
+        pdf.ensure(LINE_HEIGHT * 5)
+        pdf.text(MARGIN, fit_text(person, right - MARGIN - 100, 13, bold=True), size=13, bold=True)
+        pdf.text(right, f"£ {totals[person] / 100:.2f}", size=13, bold=True, align="right")
+        pdf.newline(LINE_HEIGHT * 1.5)
+        table_header()
+
+        for item, quantity, pence in rows:
+            if pdf.ensure(LINE_HEIGHT):
+                table_header()
+            name = f"{item.name}, {item.weight}" if item.weight else item.name
+            pdf.text(MARGIN, fit_text(name, item_width, FONT_SIZE))
+            if with_source:
+                pdf.text(source_x, fit_text(item.source, quantity_x - source_x - 40, FONT_SIZE), gray=0.4)
+            pdf.text(quantity_x, f"{format_quantity(quantity)} / {item.quantity}", align="right")
+            pdf.text(right, f"£ {pence / 100:.2f}", align="right")
+            pdf.newline()
+
+    return pdf.to_bytes()
@@ -0,0 +1,192 @@
+from typing import Any, Dict, List, Mapping, Tuple
+
+from .items import OrderItem
+from .rules import SPECIAL_ALL
+
+# Columns of the assignment grid; each person gets a quantity column of their own
+ITEM_COLUMN = "item"
+ORDER_COLUMN = "order"
+QUANTITY_COLUMN = "quantity"
+PRICE_COLUMN = "price"
+EVERYONE_COLUMN = "everyone"
+PERSON_COLUMN_PREFIX = "person:"
+
+
+def person_column(person: str) -> str:
+    """Grid column holding one person's quantities (prefixed, so a person named "item" cannot clash)"""
+    return PERSON_COLUMN_PREFIX + person
+
+
+def default_quantities(quantity: int, people: List[str]) -> Dict[str, int]:
+    """
+    Spread the units of an item evenly, the remainder going to the first people.
+
+    Args:
+        quantity: Number of units
+        people: People sharing the item, in order
+
+    Returns:
+        Dict mapping each person to their default quantity
+    """
+    share, remainder = divmod(quantity, len(people))
+    return {person: share + (i < remainder) for i, person in enumerate(people)}
+
+
+def grid_rows(items: List[OrderItem], names: List[str], state: Mapping[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Build the rows of the assignment grid from the item row widget values.
+
+    Each person's cell holds the units they take, as the quantity inputs of
+    the item rows would show them; an item shared by everyone ticks the
+    everyone column instead of naming each person.
+
+    Args:
+        items: Order items
+        names: People taking part in the split
+        state: Widget values ("buyers_{index}" and "qty_{index}_{person}" keys,
+            e.g. st.session_state)
+
+    Returns:
+        One dict per item, keyed by column
+    """
+    sources = any(item.source for item in items)
+    rows = []
+    for idx, item in enumerate(items):
+        buyers = state.get(f"buyers_{idx}") or []
+        everyone = SPECIAL_ALL in buyers and len(names) > 1
+        selected = names if everyone else [person for person in names if person in buyers]
+
+        if len(selected) == 1:
+            quantities = {selected[0]: item.quantity}
+        elif item.quantity <= 1:
+            quantities = dict.fromkeys(selected, 1)
+        else:
+            defaults = default_quantities(item.quantity, selected) if selected else {}
+            quantities = {
+                person: state.get(f"qty_{idx}_{person}", default) for person, default in defaults.items()
+            }
+
+        row = {ITEM_COLUMN: f"{item.name} ({item.weight})" if item.weight else item.name}
+        if sources:
+            row[ORDER_COLUMN] = item.source
+        row[QUANTITY_COLUMN] = item.quantity
+        row[PRICE_COLUMN] = item.price
+        if len(names) > 1:
+            row[EVERYONE_COLUMN] = everyone
+        for person in names:
+            row[person_column(person)] = quantities.get(person, 0)
+        rows.append(row)
+    return rows
+
+
+def grid_allocations(
+    rows: List[Mapping[str, Any]],
+    items: List[OrderItem],
+    names: List[str],
+) -> Tuple[Dict[int, Dict[str, float]], Dict[str, Any], List[str]]:
+    """
+    Validate the edited assignment grid and convert it to allocations, in one pass.
+
+    Rows follow the same rules as the item rows: a single buyer takes every
+    unit, an item of one unit (or less) is split equally between its buyers,
+    and the units of a larger item go by each buyer's quantity, with the
+    default spread when it is shared by everyone and no quantities are given.
+    Quantities are whole numbers between 0 and the item's quantity; other
+    values are rounded and clipped into that range and reported.
+
+    Args:
+        rows: Edited grid rows, in item order (as from grid_rows)
+        items: Order items
+        names: People taking part in the split
+
+    Returns:
+        Tuple of:
+            - Per-item allocations ({index: {person: quantity}}, empty if unassigned)
+            - Equivalent item row widget values ("buyers_{index}" and
+              "qty_{index}_{person}" keys, None where the widget has no value)
+            - Problems found, one message per item
+    """
+    allocations = {}
+    widgets = {}
+    problems = []
+    for idx, (row, item) in enumerate(zip(rows, items)):
+        quantity = item.quantity
+        everyone = bool(row.get(EVERYONE_COLUMN)) and len(names) > 1
+
+        values = {}
+        clipped = False
+        for person in names:
+            value = row.get(person_column(person))
+            try:
+                value = float(value or 0)
+            except (TypeError, ValueError):
+                value, clipped = 0.0, True
+            units = min(max(round(value), 0), max(quantity, 1))
+            clipped = clipped or units != value
+            values[person] = units
+        if clipped:
+            problems.append(
+                f"{item.name}: quantities must be whole numbers from 0 to {max(quantity, 1)}, so they were rounded"
+            )
+
+        selected = names if everyone else [person for person in names if values[person] > 0]
+        buyers = [SPECIAL_ALL] if everyone else selected
+        qty = {}
+        if not selected:
+            allocation = {}
+        elif len(selected) == 1:
+            allocation = {selected[0]: quantity}
+        elif quantity <= 1:
+            allocation = {person: 1.0 / len(selected) for person in selected}
+        else:
+            qty = {person: values[person] for person in selected}
+            if everyone and not any(qty.values()):
+                qty = default_quantities(quantity, selected)
+            allocation = {person: units for person, units in qty.items() if units > 0}
+            allocated = sum(qty.values())
+            if allocated != quantity:
+                problems.append(f"{item.name}: {allocated} of {quantity} units allocated")
+
+        allocations[idx] = allocation
+        widgets[f"buyers_{idx}"] = buyers or None
+        for person in names:
+            widgets[f"qty_{idx}_{person}"] = qty.get(person)
+    return allocations, widgets, problems
+
+
+def allocation_widgets(
+    allocations: Mapping[int, Mapping[str, float]],
+    items: List[OrderItem],
+    names: List[str],
+) -> Dict[str, Any]:
+    """
+    Return the item row widget values showing the given allocations.
+
+    Used to bring back allocations saved outside the app (e.g. in a receipt
+    file). People not taking part in the split are dropped, an item shared by
+    everyone is bought by "All", and an item of one unit is split equally.
+
+    Args:
+        allocations: Per-item allocations ({index: {person: quantity}})
+        items: Order items
+        names: People taking part in the split
+
+    Returns:
+        Dict mapping "buyers_{index}" and "qty_{index}_{person}" keys to values
+    """
+    widgets = {}
+    for idx, allocation in allocations.items():
+        if not 0 <= idx < len(items):
+            continue
+        selected = [person for person in names if allocation.get(person, 0) > 0]
+        if not selected:
+            continue
+
+        quantity = items[idx].quantity
+        everyone = len(names) > 1 and len(selected) == len(names)
+        widgets[f"buyers_{idx}"] = [SPECIAL_ALL] if everyone else selected
+        # Fractions of units cannot be entered; those items keep the default spread
+        if len(selected) > 1 and quantity > 1 and all(float(allocation[person]).is_integer() for person in selected):
+            for person in selected:
+                widgets[f"qty_{idx}_{person}"] = min(max(round(allocation[person]), 0), quantity)
+    return widgets
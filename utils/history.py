@@ -0,0 +1,217 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence, Set
+
+from .items import OrderItem
+
+logger = logging.getLogger(__name__)
+
+NON_ALPHANUMERIC_PATTERN = re.compile(r"[^a-z0-9]+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assignments (
+    item_key TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    weight TEXT NOT NULL,
+    buyers TEXT NOT NULL,
+    uses INTEGER NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS trigrams (
+    gram TEXT NOT NULL,
+    item_key TEXT NOT NULL,
+    PRIMARY KEY (gram, item_key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS gram_counts (
+    gram TEXT PRIMARY KEY,
+    items INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Fuzzy candidates are found through the rarest trigrams of a name only, as
+# common ones ("  a", "ilk") are shared by a large part of the history
+FUZZY_PROBE_GRAMS = 6
+# Candidates sharing the most probe trigrams that are scored exactly
+FUZZY_CANDIDATES = 20
+
+
+def normalise_name(name: str) -> str:
+    """Lower-case an item name and reduce punctuation and spacing to single spaces."""
+    return NON_ALPHANUMERIC_PATTERN.sub(" ", name.lower().replace("&", " and ")).strip()
+
+
+def normalise_weight(weight: str) -> str:
+    """Lower-case a weight and drop its spacing ("500 G" and "500g" are the same)."""
+    return NON_ALPHANUMERIC_PATTERN.sub("", weight.lower())
+
+
+def item_key(name: str, weight: str) -> str:
+    """Hash of the normalised name and weight identifying an item across orders."""
+    return hashlib.sha1(f"{normalise_name(name)}\x1f{normalise_weight(weight)}".encode("utf-8")).hexdigest()
+
+
+def trigrams(text: str) -> Set[str]:
+    """Character trigrams of each word, padded so short words still produce some."""
+    return {
+        padded[i:i + 3]
+        for word in text.split()
+        for padded in (f"  {word} ",)
+        for i in range(len(padded) - 2)
+    }
+
+
+class AssignmentHistory:
+    """
+    On-disk index of who bought which item in past splits.
+
+    Items are looked up by a hash of their normalised name and weight. Items
+    not seen before fall back to the most similar past item name (trigram
+    Dice similarity), so small changes such as a new pack size or a reworded
+    product title still match. Everything lives in SQLite with indexes on the
+    hash and on the trigrams, and fuzzy candidates come from a name's rarest
+    trigrams, so lookup time stays flat as the history grows and nothing is
+    loaded when the page opens.
+
+    Args:
+        path: SQLite database file (its folder is created if missing)
+        fuzzy_threshold: Minimum similarity (0-1) for a fuzzy match
+    """
+
+    def __init__(self, path: str, fuzzy_threshold: float = 0.6):
+        self.path = path
+        self.fuzzy_threshold = fuzzy_threshold
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM assignments").fetchone()[0]
+
+    def record(self, items: Sequence[OrderItem], buyers: Sequence[Optional[List[str]]]) -> int:
+        """
+        Remember the buyers chosen for the items of a completed split.
+
+        Args:
+            items: Order items
+            buyers: Buyers selected for each item (as picked, may contain "All");
+                items with no buyers are skipped
+
+        Returns:
+            Number of items recorded
+        """
+        now = time.time()
+        rows = {}
+        for item, selected in zip(items, buyers):
+            if selected:
+                key = item_key(item.name, item.weight)
+                rows[key] = (key, normalise_name(item.name), normalise_weight(item.weight), json.dumps(list(selected)))
+
+        with self._lock, self._conn:
+            known = self._existing_keys(list(rows))
+
+            # Only items seen for the first time are added to the trigram index
+            grams = []
+            for key, name, _, _ in rows.values():
+                if key not in known:
+                    grams.extend((gram, key) for gram in trigrams(name))
+
+            self._conn.executemany(
+                "INSERT INTO assignments (item_key, name, weight, buyers, uses, updated) "
+                "VALUES (?, ?, ?, ?, 1, ?) "
+                "ON CONFLICT (item_key) DO UPDATE SET buyers = excluded.buyers, "
+                "uses = uses + 1, updated = excluded.updated",
+                [(*row, now) for row in rows.values()],
+            )
+            self._conn.executemany("INSERT INTO trigrams (gram, item_key) VALUES (?, ?)", grams)
+            self._conn.executemany(
+                "INSERT INTO gram_counts (gram, items) VALUES (?, 1) "
+                "ON CONFLICT (gram) DO UPDATE SET items = items + 1",
+                [(gram,) for gram, _ in grams],
+            )
+
+        logger.info(f"Recorded buyers for {len(rows)} items")
+        return len(rows)
+
+    def _select_in(self, query: str, values: List[str]) -> List[tuple]:
+        """Run a query with an "IN ({})" clause over values, in chunks (lock held)."""
+        rows = []
+        # Stay well below SQLite's bound parameter limit
+        for start in range(0, len(values), 500):
+            chunk = values[start:start + 500]
+            rows.extend(self._conn.execute(query.format(",".join("?" * len(chunk))), chunk).fetchall())
+        return rows
+
+    def _existing_keys(self, keys: List[str]) -> Set[str]:
+        """Return which of the item keys are already in the history (lock held)."""
+        return {key for key, in self._select_in("SELECT item_key FROM assignments WHERE item_key IN ({})", keys)}
+
+    def _fuzzy_match(self, name: str) -> Optional[List[str]]:
+        """Return the buyers of the most similar past item name (lock held)."""
+        name_grams = trigrams(name)
+        if not name_grams:
+            return None
+
+        counts = dict(self._select_in("SELECT gram, items FROM gram_counts WHERE gram IN ({})", list(name_grams)))
+        probe = sorted((gram for gram in name_grams if gram in counts), key=counts.get)[:FUZZY_PROBE_GRAMS]
+        if not probe:
+            return None
+
+        candidates = self._conn.execute(
+            f"SELECT a.name, a.buyers FROM assignments a JOIN ("
+            f"SELECT item_key, COUNT(*) AS shared FROM trigrams WHERE gram IN ({','.join('?' * len(probe))}) "
+            "GROUP BY item_key ORDER BY shared DESC LIMIT ?"
+            ") c ON c.item_key = a.item_key ORDER BY a.updated DESC",
+            (*probe, FUZZY_CANDIDATES),
+        ).fetchall()
+
+        best, best_score = None, self.fuzzy_threshold
+        for candidate, buyers in candidates:
+            candidate_grams = trigrams(candidate)
+            score = 2 * len(name_grams & candidate_grams) / (len(name_grams) + len(candidate_grams))
+            if score > best_score or (best is None and score == best_score):
+                best, best_score = buyers, score
+        return json.loads(best) if best is not None else None
+
+    def lookup(self, items: Sequence[OrderItem], fuzzy: bool = True) -> List[Optional[List[str]]]:
+        """
+        Return the remembered buyers of each item.
+
+        Args:
+            items: Order items
+            fuzzy: Fall back to the most similar past item when there is no exact match
+
+        Returns:
+            Buyers for each item, in item order (None when nothing matched)
+        """
+        keys = [item_key(item.name, item.weight) for item in items]
+        with self._lock:
+            exact: Dict[str, str] = dict(self._select_in(
+                "SELECT item_key, buyers FROM assignments WHERE item_key IN ({})", list(dict.fromkeys(keys))
+            ))
+
+            found = []
+            for item, key in zip(items, keys):
+                if key in exact:
+                    found.append(json.loads(exact[key]))
+                elif fuzzy:
+                    found.append(self._fuzzy_match(normalise_name(item.name)))
+                else:
+                    found.append(None)
+        return found
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
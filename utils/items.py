@@ -0,0 +1,123 @@
+import sys
+from typing import List, Dict, Any, Tuple
+
+# Order items flow from the parsers through the cache, the display and the
+# split as OrderItem records, so no dict or DataFrame conversions are needed
+# on a rerun and neither pandas nor numpy has to be loaded.
+
+
+class OrderItem:
+    """
+    A single line of an order receipt.
+
+    Uses __slots__ instead of a per-item dict, and interns names and weights
+    so repeated values (the same product across reruns, sessions and orders,
+    or common weights like "500g") share a single string.
+
+    Args:
+        name: Product name
+        quantity: Number of units
+        weight: Weight/size description (may be empty)
+        price: Total price for all units, in pounds
+        image: Image URL
+        source: Order the item came from when several receipts are split
+            together (empty for a single receipt)
+    """
+
+    __slots__ = ("name", "quantity", "weight", "price", "image", "source")
+
+    def __init__(self, name: str, quantity: int, weight: str, price: float, image: str, source: str = ""):
+        self.name = sys.intern(name)
+        self.quantity = quantity
+        self.weight = sys.intern(weight)
+        self.price = price
+        self.image = image
+        self.source = sys.intern(source)
+
+    def __repr__(self) -> str:
+        return (
+            f"OrderItem(name={self.name!r}, quantity={self.quantity!r}, weight={self.weight!r}, "
+            f"price={self.price!r}, image={self.image!r}, source={self.source!r})"
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, OrderItem):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __reduce__(self):
+        # Rebuild through __init__ so items parsed in a worker process are interned here too
+        return (OrderItem, (self.name, self.quantity, self.weight, self.price, self.image, self.source))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the item as a plain dict (for JSON/CSV export)"""
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "OrderItem":
+        """Build an item from a dict with the same keys as to_dict"""
+        return cls(data["name"], data["quantity"], data["weight"], data["price"], data["image"], data.get("source", ""))
+
+    def with_source(self, source: str) -> "OrderItem":
+        """Return a copy of the item tagged with the order it came from"""
+        return OrderItem(self.name, self.quantity, self.weight, self.price, self.image, source)
+
+
+def dedupe_items(items: List[OrderItem]) -> List[OrderItem]:
+    """
+    Drop repeated items with the same name and weight, keeping the first
+
+    Items from different orders are never duplicates of each other: the same
+    product bought in two deliveries was paid for twice.
+    """
+    seen = set()
+    unique = []
+    for item in items:
+        key = (item.source, item.name, item.weight)
+        if key not in seen:
+            seen.add(key)
+            unique.append(item)
+    return unique
+
+
+def order_total(items: List[OrderItem]) -> float:
+    """Sum of the prices of all items"""
+    return sum(item.price for item in items)
+
+
+def merge_orders(orders: List[Tuple[str, List[OrderItem]]]) -> List[OrderItem]:
+    """
+    Combine the items of several orders into one list, tagged by order
+
+    Args:
+        orders: (source, items) for each order, in upload order
+
+    Returns:
+        All items, order by order; a single order is returned untagged
+    """
+    if len(orders) == 1:
+        return list(orders[0][1])
+    return [item.with_source(source) for source, items in orders for item in items]
+
+
+def source_totals(items: List[OrderItem]) -> Dict[str, float]:
+    """Sum of the prices of the items of each order, in order of first appearance"""
+    totals: Dict[str, float] = {}
+    for item in items:
+        totals[item.source] = totals.get(item.source, 0.0) + item.price
+    return totals
+
+
+def source_labels(file_names: List[str]) -> List[str]:
+    """
+    Name each uploaded order after its file, without the extension
+
+    Files with the same name get a running number ("order", "order (2)").
+    """
+    labels = []
+    seen: Dict[str, int] = {}
+    for file_name in file_names:
+        label = file_name.rsplit(".", 1)[0] if "." in file_name else file_name
+        seen[label] = seen.get(label, 0) + 1
+        labels.append(label if seen[label] == 1 else f"{label} ({seen[label]})")
+    return labels
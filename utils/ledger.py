@@ -0,0 +1,153 @@
+import math
+import logging
+from typing import Dict, Hashable, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from .constants import QUOTA_DECIMALS
+
+logger = logging.getLogger(__name__)
+
+
+def item_shares(price_pence: int, allocation: Mapping[str, float], names: List[str]) -> Dict[str, int]:
+    """
+    Split one item's price between the people it is allocated to.
+
+    Pure-Python equivalent of one row of split.split_shares (largest-remainder
+    method, leftover pennies to the largest fractional parts, ties broken by
+    the order of names), without loading numpy.
+
+    Args:
+        price_pence: Item price in pence
+        allocation: Quantity allocated to each person
+        names: People taking part in the split, in column order
+
+    Returns:
+        Pence owed by each person with a positive quantity (empty if unassigned)
+    """
+    quantities = [max(float(allocation.get(name, 0)), 0.0) for name in names]
+    total = sum(quantities)
+    if total <= 0:
+        return {}
+
+    scale = 10.0 ** QUOTA_DECIMALS
+    quota = [round(price_pence * quantity / total * scale) / scale for quantity in quantities]
+    base = [math.floor(q) for q in quota]
+    remainder = price_pence - sum(base)
+
+    # sorted() is stable, so equal fractional parts keep the column order
+    ranked = sorted(range(len(names)), key=lambda j: -(quota[j] - base[j]))
+    for j in ranked[:max(remainder, 0)]:
+        base[j] += 1
+
+    return {name: base[j] for j, name in enumerate(names) if quantities[j] > 0}
+
+
+class SplitLedger:
+    """
+    Running totals of a split, updated one item at a time.
+
+    Each item's contribution is kept, so when its allocation changes the old
+    contribution is taken off the totals and the new one added, in time
+    proportional to the number of people rather than the number of items.
+    Reading the totals costs the same.
+
+    Args:
+        names: People taking part in the split, in column order
+    """
+
+    def __init__(self, names: List[str]):
+        self.names = list(names)
+        # item index -> (allocation, price in pence, pence owed per person)
+        self._entries: Dict[int, Tuple[Dict[str, float], int, Dict[str, int]]] = {}
+        self._totals: Dict[str, int] = {}
+        # Number of items each person has a share of; people with none drop out of the totals
+        self._items: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _apply(self, shares: Dict[str, int], sign: int) -> None:
+        for person, pence in shares.items():
+            self._totals[person] = self._totals.get(person, 0) + sign * pence
+            self._items[person] = self._items.get(person, 0) + sign
+            if not self._items[person]:
+                del self._items[person], self._totals[person]
+
+    def update(self, index: int, allocation: Mapping[str, float], price: float) -> bool:
+        """
+        Record the current allocation of an item
+
+        Args:
+            index: Item index
+            allocation: Quantity allocated to each person (empty if unassigned)
+            price: Item price in pounds
+
+        Returns:
+            True if the totals changed
+        """
+        price_pence = round(price * 100)
+        entry = self._entries.get(index)
+        if entry is not None and entry[1] == price_pence and entry[0] == allocation:
+            return False
+        if entry is None and not allocation:
+            return False
+
+        if entry is not None:
+            self._apply(entry[2], -1)
+            del self._entries[index]
+
+        shares = item_shares(price_pence, allocation, self.names)
+        if shares:
+            self._entries[index] = (dict(allocation), price_pence, shares)
+            self._apply(shares, 1)
+        return True
+
+    def totals(self) -> Dict[str, float]:
+        """Amount owed by each person with at least one allocation, in pounds (as compute_split)"""
+        return {name: self._totals[name] / 100 for name in self.names if name in self._items}
+
+    def totals_by(self, groups: Sequence[Hashable]) -> Dict[Hashable, Dict[str, float]]:
+        """
+        Amount owed by each person for each group of items (e.g. per order), in pounds
+
+        Args:
+            groups: Group of each item, by item index
+        """
+        pence: Dict[Hashable, Dict[str, int]] = {}
+        for index, (_, _, shares) in self._entries.items():
+            group = pence.setdefault(groups[index], {})
+            for person, share in shares.items():
+                group[person] = group.get(person, 0) + share
+        return {
+            group: {name: totals[name] / 100 for name in self.names if name in totals}
+            for group, totals in pence.items()
+        }
+
+    def with_names(self, names: List[str]) -> "SplitLedger":
+        """Return a ledger of the same allocations split between other people"""
+        ledger = SplitLedger(names)
+        for index, (allocation, price_pence, _) in self._entries.items():
+            ledger.update(index, allocation, price_pence / 100)
+        return ledger
+
+    def verify(self, prices: Iterable[float], allocations: Mapping[int, Mapping[str, float]]) -> Optional[Dict[str, float]]:
+        """
+        Compare the running totals with a full recompute of the split
+
+        Args:
+            prices: Price of every item, in item order
+            allocations: Per-item allocations ({index: {person: quantity}})
+
+        Returns:
+            None if they agree, otherwise the recomputed totals
+        """
+        # numpy is only needed when verifying
+        from .split import compute_split
+
+        prices = list(prices)
+        expected = compute_split(prices, [allocations.get(idx, {}) for idx in range(len(prices))], self.names)
+        actual = self.totals()
+        if actual == expected:
+            return None
+
+        logger.error(f"Split ledger out of sync with a full recompute: ledger {actual}, recomputed {expected}")
+        return expected
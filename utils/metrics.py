@@ -0,0 +1,248 @@
+import os
+import time
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .constants import METRICS_PATH
+
+logger = logging.getLogger(__name__)
+
+# Parse outcomes, per receipt and per parser branch. Rows are the item
+# rows/containers/blocks a parser looked at; a sudden rise in skipped rows or
+# empty runs for one parser usually means the store changed its markup.
+RECEIPT_SECONDS = "grocery_splitter_receipt_parse_seconds"
+PARSER_RUNS = "grocery_splitter_parser_runs_total"
+PARSER_SECONDS = "grocery_splitter_parser_seconds"
+ROWS_SEEN = "grocery_splitter_rows_seen_total"
+ROWS_SKIPPED = "grocery_splitter_rows_skipped_total"
+ITEMS_EMITTED = "grocery_splitter_items_emitted_total"
+
+# Latency buckets, in seconds (upper bounds; +Inf is added when exporting)
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# name -> (type, help text)
+METRICS: Dict[str, Tuple[str, str]] = {
+    RECEIPT_SECONDS: (
+        "histogram",
+        "Time to parse one receipt, by detected format (first match), engine and outcome; _count counts receipts",
+    ),
+    PARSER_RUNS: ("counter", "Parser branch runs, by outcome (items, empty or error)"),
+    PARSER_SECONDS: ("histogram", "Time a parser branch spent extracting items (excluding tree building)"),
+    ROWS_SEEN: ("counter", "Item rows a parser branch looked at"),
+    ROWS_SKIPPED: ("counter", "Item rows a parser branch skipped, by reason"),
+    ITEMS_EMITTED: ("counter", "Items a parser branch extracted"),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class MetricsRegistry:
+    """
+    In-process counters and histograms, exported in the Prometheus text format.
+
+    Recording is thread-safe. A registry can be turned into a snapshot (plain
+    lists, so it can be pickled back from a worker process) and merged into
+    another one, which adds the counts up.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        # (name, labels) -> [count per bucket (not cumulative, +Inf last), sum]
+        self._histograms: Dict[Tuple[str, Labels], List[Any]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        """Add value to a counter"""
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """Record one observation in a histogram"""
+        key = (name, _labels(labels))
+        bucket = next((i for i, bound in enumerate(SECONDS_BUCKETS) if value <= bound), len(SECONDS_BUCKETS))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(SECONDS_BUCKETS) + 1), 0.0]
+            histogram[0][bucket] += 1
+            histogram[1] += value
+
+    def snapshot(self) -> Dict[str, List[Any]]:
+        """Return the current values, as plain lists"""
+        with self._lock:
+            return {
+                "counters": [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                "histograms": [
+                    [name, list(labels), list(buckets), total]
+                    for (name, labels), (buckets, total) in self._histograms.items()
+                ],
+            }
+
+    def merge(self, snapshot: Dict[str, List[Any]]) -> None:
+        """Add the values of a snapshot (e.g. from a worker process) to this registry"""
+        with self._lock:
+            for name, labels, value in snapshot.get("counters", []):
+                key = (name, tuple(tuple(pair) for pair in labels))
+                self._counters[key] = self._counters.get(key, 0) + value
+            for name, labels, buckets, total in snapshot.get("histograms", []):
+                key = (name, tuple(tuple(pair) for pair in labels))
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = [[0] * (len(SECONDS_BUCKETS) + 1), 0.0]
+                histogram[0] = [a + b for a, b in zip(histogram[0], buckets)]
+                histogram[1] += total
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text exposition format"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(buckets), total) for key, (buckets, total) in self._histograms.items()}
+
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+
+            for (metric, labels), (buckets, total) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(SECONDS_BUCKETS + ("+Inf",), buckets):
+                    cumulative += count
+                    le = bound if isinstance(bound, str) else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels, (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(round(total, 6))}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+# Metrics of this process
+REGISTRY = MetricsRegistry()
+
+# Registry collecting instead of REGISTRY (see collecting)
+_collector: ContextVar[Optional[MetricsRegistry]] = ContextVar("metrics_collector", default=None)
+_export_lock = threading.Lock()
+
+
+def count(name: str, value: float = 1, **labels: Any) -> None:
+    """Add value to a counter of the current registry"""
+    (_collector.get() or REGISTRY).inc(name, value, **labels)
+
+
+def observe(name: str, value: float, **labels: Any) -> None:
+    """Record an observation in a histogram of the current registry"""
+    (_collector.get() or REGISTRY).observe(name, value, **labels)
+
+
+@contextmanager
+def timed(name: str, **labels: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Record the time spent in a block in a histogram
+
+    The yielded dict holds the labels; change them inside the block (e.g. to
+    the outcome) before they are recorded.
+
+    Args:
+        name: Histogram name
+        **labels: Initial labels
+
+    Yields:
+        The labels
+    """
+    start = time.perf_counter()
+    try:
+        yield labels
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+@contextmanager
+def collecting() -> Iterator[MetricsRegistry]:
+    """
+    Record metrics into a fresh registry instead of the process registry
+
+    Used in worker processes: the snapshot of the yielded registry is sent
+    back with the result and merged by the process that exports metrics.
+
+    Yields:
+        The registry metrics are recorded into
+    """
+    registry = MetricsRegistry()
+    token = _collector.set(registry)
+    try:
+        yield registry
+    finally:
+        _collector.reset(token)
+
+
+def merge_metrics(snapshot: Optional[Dict[str, List[Any]]]) -> None:
+    """Add a snapshot recorded elsewhere (e.g. in a worker process) to the process registry and export it"""
+    if snapshot:
+        REGISTRY.merge(snapshot)
+        export_metrics()
+
+
+def export_metrics(path: Optional[str] = METRICS_PATH, registry: Optional[MetricsRegistry] = None) -> bool:
+    """
+    Write the metrics to a Prometheus text file (e.g. for node_exporter's textfile collector)
+
+    The file is replaced atomically, so a scraper never reads it half written.
+    Nothing is written while metrics are being collected for another process.
+
+    Args:
+        path: Output file; None (GROCERY_SPLITTER_METRICS_PATH unset) disables exporting
+        registry: Registry to export (the process registry by default)
+
+    Returns:
+        True if the file was written
+    """
+    if not path or (registry is None and _collector.get() is not None):
+        return False
+
+    text = (registry or REGISTRY).render()
+    directory = os.path.dirname(os.path.abspath(path))
+    with _export_lock:
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metrics-", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(text)
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, path)
+            except OSError:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            logger.warning(f"Could not write metrics to {path}: {e}")
+            return False
+    return True
@@ -1,58 +1,521 @@
 import re
+import time
+import codecs
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Optional, Tuple, Type, Union
 
-from .constants import DEFAULT_IMAGE
+from bs4 import BeautifulSoup, SoupStrainer
+
+from .constants import DEFAULT_IMAGE, PARSER_ENGINE, STORE_KEYS
+from .items import OrderItem
+from .webarchive import Buffer, WebArchiveError, read_main_resource
+from .timing import span
+from .metrics import (
+    ITEMS_EMITTED, PARSER_RUNS, PARSER_SECONDS, RECEIPT_SECONDS, ROWS_SEEN, ROWS_SKIPPED,
+    count, export_metrics, observe, timed,
+)
+from .progress import ParseCancelled, report, track
+
+try:
+    import lxml  # noqa: F401
+
+    HAS_LXML = True
+except ImportError:  # pragma: no cover - depends on the environment
+    HAS_LXML = False
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Precompiled patterns shared by every call
+TITLE_QUANTITY_PATTERN = re.compile(r"(\d+)\s*x\s*(.+)")
+TITLE_WITH_QUANTITY_PATTERN = re.compile(r"\d+\s*x\s+")
+PRICE_CLEANUP_PATTERN = re.compile(r"[^\d.]")
+CONTAINER_TESTID_PATTERN = re.compile(r"^container-")
+TOTAL_COST_TESTID_PATTERN = re.compile(r"^totalCost-")
+META_CHARSET_PATTERN = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_.:-]+)""", re.IGNORECASE)
+
+# Only the first few KB are searched for a <meta charset>
+ENCODING_SNIFF_BYTES = 4096
+
+# Store formats are first detected from this many leading bytes
+SNIFF_BYTES = 16 * 1024
+
+
+def _parse_title_and_quantity(title: str) -> tuple[str, int]:
+    """Parse title to extract name and quantity"""
+    match = TITLE_QUANTITY_PATTERN.match(title)
+    if match:
+        quantity = int(match.group(1))
+        name = match.group(2).strip()
+    else:
+        quantity = 1
+        name = title.strip()
+    return name, quantity
+
+
+def _clean_and_convert_price(price_text: str) -> Optional[float]:
+    """Clean price text and convert to float"""
+    try:
+        cleaned = PRICE_CLEANUP_PATTERN.sub("", price_text)
+        return float(cleaned) if cleaned else None
+    except ValueError:
+        logger.warning(f"Could not parse price: {price_text}")
+        return None
+
+
+def _safe_get_text(element, default: str = "") -> str:
+    """Safely extract text from element"""
+    return element.get_text(strip=True) if element else default
+
+
+def _safe_get_attr(element, attr: str, default: str = "") -> str:
+    """Safely extract attribute from element"""
+    if element and element.has_attr(attr):
+        value = element.get(attr, "")
+        return value if value else default
+    return default
+
+
+def _record_run(key: str, engine: str, seconds: float, items: Optional[int]) -> None:
+    """Count one run of a parser branch and the number of items it extracted (None if it failed)"""
+    outcome = "error" if items is None else "items" if items else "empty"
+    count(PARSER_RUNS, parser=key, engine=engine, outcome=outcome)
+    observe(PARSER_SECONDS, seconds, parser=key, engine=engine)
+    if items:
+        count(ITEMS_EMITTED, items, parser=key)
+
+
+def resolve_engine(engine: str = PARSER_ENGINE) -> str:
+    """
+    Map a parser engine setting to an installed BeautifulSoup tree builder
+
+    Args:
+        engine: "auto", "lxml" or "html.parser"
+
+    Returns:
+        The tree builder name to hand to BeautifulSoup
+    """
+    if engine == "auto":
+        return "lxml" if HAS_LXML else "html.parser"
+    if engine == "lxml" and not HAS_LXML:
+        logger.warning("lxml is not installed, falling back to html.parser")
+        return "html.parser"
+    return engine
+
+
+def sniff_encoding(data: bytes) -> Optional[str]:
+    """Return the charset declared in the document's leading <meta> tag, if any"""
+    match = META_CHARSET_PATTERN.search(data, 0, ENCODING_SNIFF_BYTES)
+    if not match:
+        return None
+    try:
+        return codecs.lookup(match.group(1).decode("ascii")).name
+    except (LookupError, UnicodeDecodeError):
+        return None
+
+
+# ----------------------------------------------- Store parser registry -----------------------------------------------
 
-def order_processor(choice: str, html, store_choices: List[str]) -> List[Dict[str, Any]]:
+
+class StoreParser:
+    """
+    Base class for one store's receipt format
+
+    Subclasses describe how to recognise the format from raw bytes (sniff),
+    which subtrees BeautifulSoup has to build (keep) and how to turn those
+    into item records (extract). Decorate them with @register_parser to make
+    them available to auto-detection.
+    """
+
+    # Unique identifier of the format
+    key: str = ""
+    # Store the format belongs to, one of STORE_KEYS
+    store: str = ""
+    # Byte strings whose presence identifies the format
+    markers: Tuple[bytes, ...] = ()
+
+    def sniff(self, first_bytes: bytes) -> bool:
+        """Cheaply decide from raw bytes whether this parser handles the document"""
+        return any(marker in first_bytes for marker in self.markers)
+
+    def keep(self, name: str, attrs: Dict[str, str]) -> bool:
+        """SoupStrainer filter: whether a top-level tag's subtree is needed by extract"""
+        return True
+
+    def extract(self, html) -> List[OrderItem]:
+        """Extract item records from a (possibly strained) BeautifulSoup tree"""
+        raise NotImplementedError
+
+    def seen(self, rows: int) -> None:
+        """Count the item rows extract looks at (see utils.metrics)"""
+        count(ROWS_SEEN, rows, parser=self.key)
+
+    def skip(self, reason: str) -> None:
+        """Count an item row extract passed over, by reason (see utils.metrics)"""
+        count(ROWS_SKIPPED, parser=self.key, reason=reason)
+
+    def parse(self, html) -> List[OrderItem]:
+        """Run extract, logging instead of raising on unexpected markup"""
+        start = time.perf_counter()
+        try:
+            items = self.extract(html)
+        except ParseCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"Critical error processing order: {str(e)}")
+            _record_run(self.key, "tree", time.perf_counter() - start, None)
+            return []
+
+        _record_run(self.key, "tree", time.perf_counter() - start, len(items))
+        logger.info(f"Successfully processed {len(items)} items with the {self.key} parser")
+        return items
+
+
+# Registered parsers, in detection priority order
+PARSERS: List[StoreParser] = []
+
+
+def register_parser(cls: Type[StoreParser]) -> Type[StoreParser]:
+    """Class decorator adding a StoreParser subclass to the auto-detection registry"""
+    PARSERS.append(cls())
+    return cls
+
+
+@register_parser
+class AsdaTableParser(StoreParser):
+    """ASDA order page with one table row per item (primary format)"""
+
+    key = "asda-table"
+    store = "asda"
+    markers = (b"item-row__content",)
+
+    def keep(self, name: str, attrs: Dict[str, str]) -> bool:
+        return name == "tr" and "item-row__content" in (attrs.get("class") or "").split()
+
+    def extract(self, html) -> List[OrderItem]:
+        items = []
+        product_rows = html.find_all("tr", class_="item-row__content")
+        self.seen(len(product_rows))
+
+        for row in track(product_rows, "extract"):
+            try:
+                # Skip unavailable or substituted items
+                row_classes = row.get("class", [])
+                if "item-row__content--unavailable" in row_classes:
+                    self.skip("unavailable")
+                    continue
+                if "item-row__content--subs-original" in row_classes:
+                    self.skip("substituted")
+                    continue
+
+                # Extract title
+                title_tag = row.find("h4", class_="item-title__label")
+                if not title_tag:
+                    self.skip("no_title")
+                    continue
+
+                title = _safe_get_text(title_tag)
+                name, quantity = _parse_title_and_quantity(title)
+
+                # Skip if quantity is 0
+                if quantity == 0:
+                    self.skip("zero_quantity")
+                    continue
+
+                # Extract weight
+                weight = ""
+                weight_tag = row.find("span", class_="item-title__weight")
+                if weight_tag:
+                    weight = _safe_get_text(weight_tag)
+                else:
+                    # Check for additional quantities
+                    extra_quantities = row.find_all("span", class_="item-title__quantity")
+                    if extra_quantities:
+                        weights = [_safe_get_text(w) for w in extra_quantities]
+                        weight = ", ".join(filter(None, weights))
+
+                # Extract price
+                price_tag = row.find("p", class_="item-price__label")
+                if not price_tag:
+                    self.skip("no_price")
+                    continue
+
+                price_text = _safe_get_text(price_tag)
+                price = _clean_and_convert_price(price_text)
+                if price is None:
+                    self.skip("bad_price")
+                    continue
+
+                # Extract image
+                item_image = row.find("img", class_="item-image__image")
+                image_url = _safe_get_attr(item_image, "src", DEFAULT_IMAGE)
+
+                items.append(OrderItem(name, quantity, weight, price, image_url))
+
+            except Exception as e:
+                logger.warning(f"Error processing primary format row: {str(e)}")
+                self.skip("error")
+                continue
+
+        return items
+
+
+@register_parser
+class AsdaContainerParser(StoreParser):
+    """ASDA order page with one div container per item (alternative format)"""
+
+    key = "asda-container"
+    store = "asda"
+    markers = (b'data-testid="container-', b"data-testid='container-")
+
+    def keep(self, name: str, attrs: Dict[str, str]) -> bool:
+        return name == "div" and (attrs.get("data-testid") or "").startswith("container-")
+
+    def extract(self, html) -> List[OrderItem]:
+        items = []
+        product_rows = html.find_all("div", attrs={"data-testid": CONTAINER_TESTID_PATTERN})
+        self.seen(len(product_rows))
+
+        for row in track(product_rows, "extract"):
+            try:
+                # Extract title and quantity
+                title_tag = row.find("p", string=TITLE_WITH_QUANTITY_PATTERN)
+                if not title_tag:
+                    self.skip("no_title")
+                    continue
+
+                title = _safe_get_text(title_tag)
+                name, quantity = _parse_title_and_quantity(title)
+
+                if quantity == 0:
+                    self.skip("zero_quantity")
+                    continue
+
+                # Extract weight
+                weight = ""
+                detail_tags = row.find_all("p", class_="chakra-text css-0")
+                if len(detail_tags) > 1:
+                    weight = _safe_get_text(detail_tags[1])
+
+                # Extract price
+                price_tag = row.find("p", attrs={"data-testid": TOTAL_COST_TESTID_PATTERN})
+                if not price_tag:
+                    self.skip("no_price")
+                    continue
+
+                price_text = _safe_get_text(price_tag, "£0.00")
+                price = _clean_and_convert_price(price_text)
+
+                if not price or price == 0:
+                    self.skip("bad_price")
+                    continue
+
+                # Extract image
+                item_image = row.find("img")
+                image_url = _safe_get_attr(item_image, "src", DEFAULT_IMAGE)
+
+                items.append(OrderItem(name, quantity, weight, price, image_url))
+
+            except Exception as e:
+                logger.warning(f"Error processing alternative format row: {str(e)}")
+                self.skip("error")
+                continue
+
+        return items
+
+
+@register_parser
+class TescoParser(StoreParser):
+    """Tesco order page listing items under "Rest of your items" """
+
+    key = "tesco"
+    store = "tesco"
+    markers = (b"mfe-orders", b"Rest of your items")
+
+    def keep(self, name: str, attrs: Dict[str, str]) -> bool:
+        # The section heading is only known once the article is parsed, so keep them all
+        return name == "article"
+
+    def extract(self, html) -> List[OrderItem]:
+        items = []
+
+        # Find the "Rest of your items" section
+        rest_of_items_header = html.find("h3", string="Rest of your items")
+        rest_container = rest_of_items_header.find_parent("article") if rest_of_items_header else None
+
+        if not rest_container:
+            logger.warning("No items found in the 'Rest of your items' section")
+            return []
+
+        # Find product content blocks
+        product_blocks = rest_container.find_all(
+            "div", class_="styled__ProductContentWrapper-mfe-orders__sc-1hj3has-7"
+        )
+        self.seen(len(product_blocks))
+
+        for block in track(product_blocks, "extract"):
+            try:
+                # Extract name
+                title_div = block.find("div", {"data-testid": "product-title"})
+                name_tag = title_div.find("a") if title_div else None
+                name = _safe_get_text(name_tag)
+
+                if not name:
+                    self.skip("no_name")
+                    continue
+
+                # Extract quantity
+                quantity = 1
+                quantity_tag = block.find("div", class_="styled__SmallOnlyText-mfe-orders__sc-1hj3has-9")
+                if quantity_tag and "Quantity" in quantity_tag.text:
+                    try:
+                        quantity = int(quantity_tag.text.split(":")[1].strip())
+                    except (IndexError, ValueError):
+                        pass
+
+                # Extract weight from image alt text
+                weight = ""
+                img_tag = block.find("img", {"data-testid": "product-image"})
+                if img_tag and img_tag.has_attr("alt"):
+                    alt_text = img_tag["alt"].strip()
+                    if alt_text:
+                        last_word = alt_text.split()[-1]
+                        if any(char.isdigit() for char in last_word):
+                            weight = last_word
+
+                # Extract price
+                price_tag = block.find("h4", {"data-testid": "receipt-total-price"})
+                if not price_tag:
+                    self.skip("no_price")
+                    continue
+
+                price_text = _safe_get_text(price_tag, "£0.00")
+                price = _clean_and_convert_price(price_text)
+                if price is None:
+                    self.skip("bad_price")
+                    continue
+
+                # Extract image
+                image_url = _safe_get_attr(img_tag, "src", DEFAULT_IMAGE)
+
+                items.append(OrderItem(name, quantity, weight, price, image_url))
+
+            except Exception as e:
+                logger.warning(f"Error processing store2 block: {str(e)}")
+                self.skip("error")
+                continue
+
+        return items
+
+
+def get_parser(key: str) -> StoreParser:
+    """Return the registered parser with the given key"""
+    for parser in PARSERS:
+        if parser.key == key:
+            return parser
+    raise KeyError(f"Unknown parser: {key}")
+
+
+def detect_parsers(data: bytes, store: Optional[str] = None) -> List[StoreParser]:
+    """
+    Pick the parsers for a document without building a DOM
+
+    Only the first SNIFF_BYTES are inspected; when no parser recognises them
+    (e.g. a very long <head>) the whole document is scanned instead.
+
+    Args:
+        data: Raw HTML bytes (bytes, memoryview or mmap)
+        store: Restrict detection to one store key (None for any store)
+
+    Returns:
+        Matching parsers in priority order (empty if the format is unknown)
+    """
+    candidates = [parser for parser in PARSERS if store is None or parser.store == store]
+
+    # Buffers (memoryview, mmap) are searched as bytes
+    matches = [parser for parser in candidates if parser.sniff(bytes(data[:SNIFF_BYTES]))]
+    if not matches and len(data) > SNIFF_BYTES:
+        data = data if isinstance(data, bytes) else bytes(data)
+        matches = [parser for parser in candidates if parser.sniff(data)]
+    return matches
+
+
+def detect_store(data: Buffer, is_webarchive: bool) -> str:
+    """
+    Return the store a receipt comes from, sniffed from its raw bytes without parsing it
+
+    Args:
+        data: Raw receipt bytes
+        is_webarchive: Whether the bytes are a Safari .webarchive plist
+
+    Returns:
+        Store key, one of STORE_KEYS ("" if the format is unknown)
+    """
+    html = data
+    if is_webarchive:
+        try:
+            html, _ = read_main_resource(data)
+        except WebArchiveError:
+            return ""
+        if html is None:
+            return ""
+
+    parsers = detect_parsers(html)
+    return parsers[0].store if parsers else ""
+
+
+# ----------------------------------------------- Parsing entry points -----------------------------------------------
+
+
+def build_soup(
+    data: Union[bytes, str],
+    parsers: List[StoreParser],
+    engine: str = PARSER_ENGINE,
+    encoding: Optional[str] = None,
+) -> BeautifulSoup:
+    """
+    Build a BeautifulSoup tree holding only the subtrees the given parsers read
+
+    Args:
+        data: Raw HTML bytes (or already decoded text)
+        parsers: Parsers that will run over the tree
+        engine: Parser engine, see resolve_engine
+        encoding: Known document encoding; sniffed from <meta> when omitted
+
+    Returns:
+        BeautifulSoup object limited to item rows/containers for the parsers
+    """
+    parse_only = SoupStrainer(lambda name, attrs: any(parser.keep(name, attrs) for parser in parsers))
+
+    from_encoding = None
+    if isinstance(data, bytes):
+        from_encoding = encoding or sniff_encoding(data)
+    return BeautifulSoup(data, resolve_engine(engine), parse_only=parse_only, from_encoding=from_encoding)
+
+
+def run_parsers(parsers: List[StoreParser], html) -> List[OrderItem]:
+    """Return the items of the first parser that finds any, trying them in order"""
+    for parser in parsers:
+        items = parser.parse(html)
+        if items:
+            return items
+    return []
+
+
+def order_processor(choice: str, html, store_choices: List[str]) -> List[OrderItem]:
     """
     Optimized order processor that handles multiple store formats
 
     Args:
         choice: Selected store choice
         html: BeautifulSoup HTML object
-        store_choices: List of available store choices
+        store_choices: List of available store choices, in STORE_KEYS order
 
     Returns:
-        List of order items as dictionaries
+        List of OrderItem records
     """
 
-    def parse_title_and_quantity(title: str) -> tuple[str, int]:
-        """Parse title to extract name and quantity"""
-        match = re.match(r"(\d+)\s*x\s*(.+)", title)
-        if match:
-            quantity = int(match.group(1))
-            name = match.group(2).strip()
-        else:
-            quantity = 1
-            name = title.strip()
-        return name, quantity
-
-    def clean_and_convert_price(price_text: str) -> Optional[float]:
-        """Clean price text and convert to float"""
-        try:
-            cleaned = re.sub(r"[^\d.]", "", price_text)
-            return float(cleaned) if cleaned else None
-        except ValueError:
-            logger.warning(f"Could not parse price: {price_text}")
-            return None
-
-    def safe_get_text(element, default: str = "") -> str:
-        """Safely extract text from element"""
-        return element.get_text(strip=True) if element else default
-
-    def safe_get_attr(element, attr: str, default: str = "") -> str:
-        """Safely extract attribute from element"""
-        if element and element.has_attr(attr):
-            value = element.get(attr, "")
-            return value if value else default
-        return default
-
     # Input validation
     if not html:
         logger.warning("No HTML content provided")
@@ -62,200 +525,129 @@ def order_processor(choice: str, html, store_choices: List[str]) -> List[Dict[st
         logger.error(f"Invalid choice: {choice}")
         return []
 
-    items = []
+    index = store_choices.index(choice)
+    if index >= len(STORE_KEYS):
+        logger.error(f"Unknown store choice: {choice}")
+        return []
+
+    store = STORE_KEYS[index]
+    return run_parsers([parser for parser in PARSERS if parser.store == store], html)
+
+
+def parse_receipt(
+    data: Buffer,
+    is_webarchive: bool,
+    store: Optional[str] = None,
+    engine: str = PARSER_ENGINE,
+    encoding: Optional[str] = None,
+) -> List[OrderItem]:
+    """
+    Decode an uploaded receipt, detect its format and extract its order items
+
+    The time taken and the outcome are recorded in the parse metrics (see
+    utils.metrics), which are then exported if GROCERY_SPLITTER_METRICS_PATH is set.
+
+    Args:
+        data: Raw contents of the uploaded file (bytes, memoryview or mmap)
+        is_webarchive: Whether the bytes are a Safari .webarchive plist
+        store: Restrict detection to one store key (None to auto-detect)
+        engine: Parser engine, see resolve_engine; "stream" extracts the items
+            from tokenizer events instead of a tree (see utils.streaming)
+        encoding: Declared text encoding of HTML data (e.g. the one a web
+            archive gives for its main resource); ignored for web archives
+
+    Returns:
+        List of OrderItem records
 
+    Raises:
+        ParseCancelled: If a progress callback (see utils.progress) cancelled the parse
+    """
+    engine = engine if engine == "stream" else resolve_engine(engine)
     try:
-        # STORE 1 PROCESSING
-        if choice == store_choices[0]:
-            # Try primary format first (table rows)
-            product_rows = html.find_all("tr", class_="item-row__content")
-
-            if product_rows:
-                # PRIMARY FORMAT: Table-based layout
-                for row in product_rows:
-                    try:
-                        # Skip unavailable or substituted items
-                        row_classes = row.get("class", [])
-                        if ("item-row__content--unavailable" in row_classes or
-                            "item-row__content--subs-original" in row_classes):
-                            continue
-
-                        # Extract title
-                        title_tag = row.find("h4", class_="item-title__label")
-                        if not title_tag:
-                            continue
-
-                        title = safe_get_text(title_tag)
-                        name, quantity = parse_title_and_quantity(title)
-
-                        # Skip if quantity is 0
-                        if quantity == 0:
-                            continue
-
-                        # Extract weight
-                        weight = ""
-                        weight_tag = row.find("span", class_="item-title__weight")
-                        if weight_tag:
-                            weight = safe_get_text(weight_tag)
-                        else:
-                            # Check for additional quantities
-                            extra_quantities = row.find_all("span", class_="item-title__quantity")
-                            if extra_quantities:
-                                weights = [safe_get_text(w) for w in extra_quantities]
-                                weight = ", ".join(filter(None, weights))
-
-                        # Extract price
-                        price_tag = row.find("p", class_="item-price__label")
-                        if not price_tag:
-                            continue
-
-                        price_text = safe_get_text(price_tag)
-                        price = clean_and_convert_price(price_text)
-                        if price is None:
-                            continue
-
-                        # Extract image
-                        item_image = row.find("img", class_="item-image__image")
-                        image_url = safe_get_attr(item_image, "src", DEFAULT_IMAGE)
-
-                        items.append({
-                            "name": name,
-                            "quantity": quantity,
-                            "weight": weight,
-                            "price": price,
-                            "image": image_url,
-                        })
-
-                    except Exception as e:
-                        logger.warning(f"Error processing primary format row: {str(e)}")
-                        continue
-
-            else:
-                # ALTERNATIVE FORMAT: Div-based layout
-                product_rows = html.find_all("div", attrs={"data-testid": re.compile(r"^container-")})
-
-                for row in product_rows:
-                    try:
-                        # Extract title and quantity
-                        title_tag = row.find("p", string=re.compile(r"\d+\s*x\s+"))
-                        if not title_tag:
-                            continue
-
-                        title = safe_get_text(title_tag)
-                        name, quantity = parse_title_and_quantity(title)
-
-                        if quantity == 0:
-                            continue
-
-                        # Extract weight
-                        weight = ""
-                        detail_tags = row.find_all("p", class_="chakra-text css-0")
-                        if len(detail_tags) > 1:
-                            weight = safe_get_text(detail_tags[1])
-
-                        # Extract price
-                        price_tag = row.find("p", attrs={"data-testid": re.compile(r"^totalCost-")})
-                        if not price_tag:
-                            continue
-
-                        price_text = safe_get_text(price_tag, "£0.00")
-                        price = clean_and_convert_price(price_text)
-
-                        if not price or price == 0:
-                            continue
-
-                        # Extract image
-                        item_image = row.find("img")
-                        image_url = safe_get_attr(item_image, "src", DEFAULT_IMAGE)
-
-                        items.append({
-                            "name": name,
-                            "quantity": quantity,
-                            "weight": weight,
-                            "price": price,
-                            "image": image_url,
-                        })
-
-                    except Exception as e:
-                        logger.warning(f"Error processing alternative format row: {str(e)}")
-                        continue
-
-        # STORE 2 PROCESSING
-        elif choice == store_choices[1]:
-            # Find the "Rest of your items" section
-            rest_of_items_header = html.find("h3", string="Rest of your items")
-            rest_container = rest_of_items_header.find_parent("article") if rest_of_items_header else None
-
-            if not rest_container:
-                logger.warning("No items found in the 'Rest of your items' section")
+        with timed(RECEIPT_SECONDS, parser="unknown", engine=engine, outcome="error") as labels:
+            try:
+                return _parse_receipt(data, is_webarchive, store, engine, encoding, labels)
+            except ParseCancelled:
+                labels["outcome"] = "cancelled"
+                raise
+    finally:
+        export_metrics()
+
+
+def _parse_receipt(
+    data: Buffer,
+    is_webarchive: bool,
+    store: Optional[str],
+    engine: str,
+    encoding: Optional[str],
+    labels: Dict[str, str],
+) -> List[OrderItem]:
+    """parse_receipt, setting the parser and outcome labels of its metrics on the way"""
+    if is_webarchive:
+        report("webarchive")
+        # Only the main document is pulled out of the archive, as a view
+        with span("webarchive", bytes=len(data)) as record:
+            try:
+                html, encoding = read_main_resource(data)
+            except WebArchiveError as e:
+                logger.error(f"Invalid web archive: {str(e)}")
+                labels["outcome"] = "invalid"
                 return []
+            record["html_bytes"] = len(html) if html is not None else 0
 
-            # Find product content blocks
-            product_blocks = rest_container.find_all(
-                "div", class_="styled__ProductContentWrapper-mfe-orders__sc-1hj3has-7"
-            )
-
-            for block in product_blocks:
-                try:
-                    # Extract name
-                    title_div = block.find("div", {"data-testid": "product-title"})
-                    name_tag = title_div.find("a") if title_div else None
-                    name = safe_get_text(name_tag)
-
-                    if not name:
-                        continue
-
-                    # Extract quantity
-                    quantity = 1
-                    quantity_tag = block.find("div", class_="styled__SmallOnlyText-mfe-orders__sc-1hj3has-9")
-                    if quantity_tag and "Quantity" in quantity_tag.text:
-                        try:
-                            quantity = int(quantity_tag.text.split(":")[1].strip())
-                        except (IndexError, ValueError):
-                            pass
-
-                    # Extract weight from image alt text
-                    weight = ""
-                    img_tag = block.find("img", {"data-testid": "product-image"})
-                    if img_tag and img_tag.has_attr("alt"):
-                        alt_text = img_tag["alt"].strip()
-                        if alt_text:
-                            last_word = alt_text.split()[-1]
-                            if any(char.isdigit() for char in last_word):
-                                weight = last_word
-
-                    # Extract price
-                    price_tag = block.find("h4", {"data-testid": "receipt-total-price"})
-                    if not price_tag:
-                        continue
-
-                    price_text = safe_get_text(price_tag, "£0.00")
-                    price = clean_and_convert_price(price_text)
-                    if price is None:
-                        continue
-
-                    # Extract image
-                    image_url = safe_get_attr(img_tag, "src", DEFAULT_IMAGE)
-
-                    items.append({
-                        "name": name,
-                        "quantity": quantity,
-                        "weight": weight,
-                        "price": price,
-                        "image": image_url,
-                    })
-
-                except Exception as e:
-                    logger.warning(f"Error processing store2 block: {str(e)}")
-                    continue
-
-        else:
-            logger.error(f"Unknown store choice: {choice}")
+        if html is None:
+            logger.warning("Web archive has no main resource")
+            labels["outcome"] = "invalid"
             return []
-
-        logger.info(f"Successfully processed {len(items)} items for {choice}")
+    else:
+        html = data
+
+    report("sniff")
+    with span("sniff") as record:
+        parsers = detect_parsers(html, store)
+        record["parsers"] = [parser.key for parser in parsers]
+
+    # The other formats of the same store are tried before giving up, as the
+    # markers may be missing from a page a parser can still read
+    stores = {parser.store for parser in parsers} if parsers else {store} - {None}
+    fallback = [parser for parser in PARSERS if parser.store in stores and parser not in parsers]
+
+    if not parsers and not fallback:
+        logger.warning("Could not recognise the store format of the receipt")
+        labels["outcome"] = "unrecognised"
+        return []
+    labels["parser"] = (parsers or fallback)[0].key
+
+    if engine != "stream":
+        # The parser decodes the bytes itself, so the HTML is copied only once here
+        html = bytes(html)
+
+    items = _extract_items(html, parsers, engine, encoding) if parsers else []
+    if not items and fallback:
+        if parsers:
+            logger.info(f"No items found by the detected parsers, trying {', '.join(p.key for p in fallback)}")
+        items = _extract_items(html, fallback, engine, encoding)
+    labels["outcome"] = "items" if items else "empty"
+    return items
+
+
+def _extract_items(html: Buffer, parsers: List[StoreParser], engine: str, encoding: Optional[str]) -> List[OrderItem]:
+    """Run the given parsers over the HTML with the given engine, returning the first items found"""
+    if engine == "stream":
+        # Read straight from the buffer, a chunk at a time, without a tree
+        from .streaming import stream_items
+
+        report("stream", 0, len(html))
+        with span("stream", bytes=len(html)) as record:
+            items = list(stream_items(html, parsers, encoding))
+            record["items"] = len(items)
         return items
 
-    except Exception as e:
-        logger.error(f"Critical error processing order: {str(e)}")
-        return []
+    report("soup")
+    with span("soup", engine=engine, bytes=len(html)):
+        soup = build_soup(html, parsers, engine, encoding)
+
+    with span("extract") as record:
+        items = run_parsers(parsers, soup)
+        record["items"] = len(items)
+    return items
@@ -0,0 +1,52 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+# Receives (stage, done, total); may raise ParseCancelled to stop the work
+ProgressCallback = Callable[[str, int, int], None]
+
+
+class ParseCancelled(Exception):
+    """Raised from a progress callback to stop a parse that is no longer wanted"""
+
+
+_current_callback: ContextVar[Optional[ProgressCallback]] = ContextVar("progress_callback", default=None)
+
+
+@contextmanager
+def reporting(callback: ProgressCallback) -> Iterator[None]:
+    """Send the progress reported inside the block (in this thread / context) to callback"""
+    token = _current_callback.set(callback)
+    try:
+        yield
+    finally:
+        _current_callback.reset(token)
+
+
+def report(stage: str, done: int = 0, total: int = 0) -> None:
+    """Report progress of a stage; does nothing unless inside reporting()"""
+    callback = _current_callback.get()
+    if callback is not None:
+        callback(stage, done, total)
+
+
+def track(rows: Sequence[T], stage: str) -> Iterator[T]:
+    """
+    Iterate over rows, reporting how many were processed before each one
+
+    Args:
+        rows: Rows being processed (e.g. the item rows of a receipt)
+        stage: Stage name reported with the counts
+    """
+    callback = _current_callback.get()
+    if callback is None:
+        yield from rows
+        return
+
+    total = len(rows)
+    for done, row in enumerate(rows):
+        callback(stage, done, total)
+        yield row
+    callback(stage, total, total)
@@ -0,0 +1,169 @@
+import json
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from .items import OrderItem
+
+# Canonical receipt files: the items extracted from one or more orders, saved
+# so the same split can be loaded again without the original HTML
+RECEIPT_FORMAT = "grocery-splitter-receipt"
+RECEIPT_VERSION = 1
+RECEIPT_EXTENSION = ".receipt.json"
+RECEIPT_MIME = "application/json"
+
+# Every canonical file starts with these bytes; the loader also accepts
+# reformatted files, which are recognised by parsing them
+RECEIPT_MAGIC = b'{"format":"' + RECEIPT_FORMAT.encode("ascii") + b'"'
+
+# Item columns, stored as one JSON array each
+ITEM_COLUMNS = ("name", "weight", "quantity", "price", "image", "order")
+
+# Allocated quantities are rounded to this many decimals (equal splits of one unit)
+QUANTITY_DECIMALS = 6
+
+
+class ReceiptFormatError(ValueError):
+    """Raised when a file is not a receipt in a format this version can read."""
+
+
+class Receipt(NamedTuple):
+    """
+    Contents of a canonical receipt file.
+
+    Args:
+        items: Order items, tagged with their order when there are several
+        orders: Metadata of each order (source, store, items, total in pence), in upload order
+        names: People the allocations are for (empty without allocations)
+        allocations: Per-item allocations ({index: {person: quantity}})
+    """
+
+    items: List[OrderItem]
+    orders: List[Dict[str, Any]]
+    names: List[str]
+    allocations: Dict[int, Dict[str, float]]
+
+
+def _quantity(value: float) -> Any:
+    """Write whole quantities as integers and round the rest, so equal files are equal bytes"""
+    value = round(float(value), QUANTITY_DECIMALS)
+    return int(value) if value.is_integer() else value
+
+
+def dump_receipt(
+    items: List[OrderItem],
+    orders: Sequence[Tuple[str, str]] = (),
+    names: Optional[List[str]] = None,
+    allocations: Optional[Mapping[int, Mapping[str, float]]] = None,
+) -> bytes:
+    """
+    Write items, and optionally their allocations, as a canonical receipt file.
+
+    The file is compact JSON with the items stored column by column, prices
+    in pence and keys in a fixed order, so the same order always gives the
+    same bytes.
+
+    Args:
+        items: Order items
+        orders: (source, store key) of each order the items came from, in
+            upload order; items are matched to them by source. Empty for a
+            single order from an unknown store.
+        names: People taking part in the split; None leaves allocations out
+        allocations: Per-item allocations ({index: {person: quantity}})
+
+    Returns:
+        UTF-8 encoded JSON
+    """
+    orders = list(orders) or [("", "")]
+    index = {source: i for i, (source, _) in enumerate(orders)}
+    # A single order's items are untagged
+    order_of = [index.get(item.source, 0) for item in items]
+
+    metadata = [{"source": source, "store": store, "items": 0, "total": 0} for source, store in orders]
+    prices = [round(item.price * 100) for item in items]
+    for order, price in zip(order_of, prices):
+        metadata[order]["items"] += 1
+        metadata[order]["total"] += price
+
+    document = {
+        "format": RECEIPT_FORMAT,
+        "version": RECEIPT_VERSION,
+        "currency": "GBP",
+        "orders": metadata,
+        "items": {
+            "name": [item.name for item in items],
+            "weight": [item.weight for item in items],
+            "quantity": [item.quantity for item in items],
+            "price": prices,
+            "image": [item.image for item in items],
+            "order": order_of,
+        },
+    }
+    if names is not None:
+        allocations = allocations or {}
+        document["allocations"] = {
+            "people": list(names),
+            # One row per item, quantities in the order of people; [] if unassigned
+            "quantities": [
+                [_quantity(allocations[idx].get(person, 0)) for person in names] if allocations.get(idx) else []
+                for idx in range(len(items))
+            ],
+        }
+    return json.dumps(document, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def is_receipt(data: bytes) -> bool:
+    """Cheaply tell a canonical receipt file from an HTML or web archive receipt"""
+    head = bytes(data[:256]).lstrip()
+    return head.startswith(RECEIPT_MAGIC) or (head.startswith(b"{") and RECEIPT_FORMAT.encode("ascii") in head)
+
+
+def load_receipt(data: bytes) -> Receipt:
+    """
+    Read a canonical receipt file.
+
+    Args:
+        data: File contents
+
+    Returns:
+        The receipt's items, order metadata and allocations
+
+    Raises:
+        ReceiptFormatError: If the file is not a receipt, was written by a
+            newer version, or is inconsistent
+    """
+    try:
+        document = json.loads(bytes(data).decode("utf-8"))
+    except (UnicodeDecodeError, ValueError) as e:
+        raise ReceiptFormatError(f"Not a receipt file: {e}") from None
+
+    if not isinstance(document, dict) or document.get("format") != RECEIPT_FORMAT:
+        raise ReceiptFormatError("Not a receipt file")
+    version = document.get("version")
+    if not isinstance(version, int) or version > RECEIPT_VERSION:
+        raise ReceiptFormatError(f"Receipt version {version} is newer than this app supports ({RECEIPT_VERSION})")
+
+    try:
+        orders = [dict(order) for order in document["orders"]]
+        columns = [document["items"][column] for column in ITEM_COLUMNS]
+        if len({len(column) for column in columns}) > 1:
+            raise ReceiptFormatError("Item columns have different lengths")
+
+        tagged = len(orders) > 1
+        items = [
+            OrderItem(name, int(quantity), weight, price / 100, image, orders[order]["source"] if tagged else "")
+            for name, weight, quantity, price, image, order in zip(*columns)
+        ]
+
+        names: List[str] = []
+        allocations: Dict[int, Dict[str, float]] = {}
+        if "allocations" in document:
+            names = list(document["allocations"]["people"])
+            for idx, quantities in enumerate(document["allocations"]["quantities"][:len(items)]):
+                allocation = {person: quantity for person, quantity in zip(names, quantities) if quantity > 0}
+                if allocation:
+                    allocations[idx] = allocation
+    except ReceiptFormatError:
+        raise
+    except (KeyError, IndexError, TypeError, ValueError) as e:
+        raise ReceiptFormatError(f"Invalid receipt file: {e!r}") from None
+
+    return Receipt(items, orders, names, allocations)
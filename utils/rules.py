@@ -0,0 +1,325 @@
+import re
+import json
+import logging
+from typing import List, Dict, Any, Optional, Union
+
+from .items import OrderItem
+
+logger = logging.getLogger(__name__)
+
+# Buyer name meaning "split between everyone"
+SPECIAL_ALL = "All"
+
+# Item fields rules can match against
+RULE_FIELDS = ("name", "weight")
+
+# One rule per line in the rules text: "<pattern> -> <buyer>, <buyer>"
+RULE_LINE_SEPARATOR = "->"
+
+
+def allocate(buyers: List[str], quantity: int, names: List[str]) -> Dict[str, float]:
+    """
+    Turn a list of buyers into an allocation, mirroring the defaults of display_item.
+
+    Args:
+        buyers: Selected people, may contain "All"
+        quantity: Number of units of the item
+        names: Everyone taking part in the split
+
+    Returns:
+        Dict mapping person name to quantity allocated
+    """
+    if SPECIAL_ALL in buyers:
+        buyers = names.copy()
+    buyers = [person for person in buyers if person in names]
+
+    if not buyers:
+        return {}
+
+    if len(buyers) == 1:
+        return {buyers[0]: quantity}
+
+    # Single units are shared equally
+    if quantity <= 1:
+        share = 1.0 / len(buyers)
+        return {person: share for person in buyers}
+
+    # Distribute units evenly, giving the remainder to the first people
+    allocation = {}
+    for i, person in enumerate(buyers):
+        qty = quantity // len(buyers)
+        if i < quantity % len(buyers):
+            qty += 1
+        if qty > 0:
+            allocation[person] = qty
+    return allocation
+
+
+class Rule:
+    """
+    Assign items whose name (or weight) matches a pattern to a set of buyers.
+
+    Args:
+        pattern: Keyword (case-insensitive substring) or regular expression
+        buyers: People the matching items are assigned to ("All" for everyone)
+        field: Item field to match against, "name" or "weight"
+        regex: Whether pattern is a regular expression rather than a keyword
+    """
+
+    def __init__(self, pattern: str, buyers: List[str], field: str = "name", regex: bool = False):
+        if field not in RULE_FIELDS:
+            raise ValueError(f"Unsupported rule field: {field}")
+
+        self.pattern = pattern
+        self.buyers = list(buyers)
+        self.field = field
+        self.regex = regex
+        self.source = pattern if regex else re.escape(pattern)
+        self._compiled = re.compile(self.source, re.IGNORECASE)
+
+    def __repr__(self) -> str:
+        return f"Rule(pattern={self.pattern!r}, buyers={self.buyers!r}, field={self.field!r}, regex={self.regex!r})"
+
+    def matches(self, item: OrderItem) -> bool:
+        """Return True if the rule applies to the item"""
+        return bool(self._compiled.search(getattr(item, self.field)))
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Rule":
+        """Build a rule from its rules-file representation"""
+        return cls(
+            pattern=data["pattern"],
+            buyers=data["buyers"],
+            field=data.get("field", "name"),
+            regex=data.get("regex", False),
+        )
+
+
+def _trie_pattern(words: List[str]) -> str:
+    """
+    Build a regular expression matching any of the words, factored as a trie
+
+    Alternatives sharing a prefix share a branch, so at each position the
+    regex engine follows at most one path instead of trying every word, and
+    the longest word starting there is matched.
+    """
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node: Dict[str, Any]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class RuleMatcher:
+    """
+    Find the first rule, in priority order, that matches each item.
+
+    Keyword rules on a field are compiled into one trie-shaped regular
+    expression inside a lookahead, so a single scan finds, at each position,
+    the longest keyword starting there. Every keyword matching at that
+    position is a prefix of it, which a dict lookup turns into rule
+    priorities. Only the (usually few) regular expression rules are searched
+    one at a time, and only while they could still beat the best keyword
+    match. Hundreds of keywords then cost about as much as a handful.
+
+    Args:
+        rules: Rules in priority order
+    """
+
+    def __init__(self, rules: List[Rule]):
+        self.rules = list(rules)
+        # field -> (compiled trie, lower-cased keyword -> best rule index, keyword lengths)
+        self._keywords: Dict[str, Any] = {}
+        # (rule index, rule) searched individually, in priority order
+        self._searched = []
+
+        keywords: Dict[str, Dict[str, int]] = {field: {} for field in RULE_FIELDS}
+        for index, rule in enumerate(self.rules):
+            if rule.regex or not rule.pattern:
+                self._searched.append((index, rule))
+            else:
+                keywords[rule.field].setdefault(rule.pattern.lower(), index)
+
+        for field, index in keywords.items():
+            if index:
+                trie = re.compile(f"(?=({_trie_pattern(list(index))}))")
+                self._keywords[field] = (trie, index, sorted({len(keyword) for keyword in index}))
+
+    def first_match(self, item: OrderItem) -> Optional[Rule]:
+        """Return the highest-priority rule matching the item, or None."""
+        best = len(self.rules)
+        for field, (trie, index, lengths) in self._keywords.items():
+            for match in trie.finditer(getattr(item, field).lower()):
+                longest = match.group(1)
+                for length in lengths:
+                    if length > len(longest):
+                        break
+                    best = min(best, index.get(longest[:length], best))
+
+        for index, rule in self._searched:
+            if index >= best:
+                break
+            if rule.matches(item):
+                best = index
+                break
+
+        return self.rules[best] if best < len(self.rules) else None
+
+
+def category_rules(categories: Dict[str, List[str]]) -> List[Rule]:
+    """
+    Turn per-person keyword lists into rules.
+
+    Args:
+        categories: Dict mapping a buyer (or "All") to keywords, e.g.
+            {"Alice": ["milk", "cheese"], "All": ["toilet"]}
+
+    Returns:
+        One keyword rule per keyword
+    """
+    return [
+        Rule(keyword.strip(), [buyer])
+        for buyer, keywords in categories.items()
+        for keyword in keywords
+        if keyword.strip()
+    ]
+
+
+def parse_rules(text: str) -> List[Rule]:
+    """
+    Parse rules written one per line as "<pattern> -> <buyer>, <buyer>"
+
+    A pattern in slashes (/^asda .*milk/) is a regular expression, otherwise it
+    is a keyword. Prefix the pattern with "weight:" to match the weight instead
+    of the name. Blank lines and lines starting with # are ignored.
+
+    Args:
+        text: Rules text
+
+    Returns:
+        Rules in the order they were written
+
+    Raises:
+        ValueError: If a line is malformed or a regular expression is invalid
+    """
+    rules = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        pattern, separator, buyers = line.rpartition(RULE_LINE_SEPARATOR)
+        buyers = [buyer.strip() for buyer in buyers.split(",") if buyer.strip()]
+        pattern = pattern.strip()
+        if not separator or not pattern or not buyers:
+            raise ValueError(f"Line {number}: expected '<pattern> {RULE_LINE_SEPARATOR} <buyer>, <buyer>'")
+
+        field = "name"
+        if pattern.lower().startswith("weight:"):
+            field, pattern = "weight", pattern[len("weight:"):].strip()
+
+        regex = len(pattern) > 2 and pattern.startswith("/") and pattern.endswith("/")
+        if regex:
+            pattern = pattern[1:-1]
+
+        try:
+            rules.append(Rule(pattern, buyers, field=field, regex=regex))
+        except re.error as e:
+            raise ValueError(f"Line {number}: invalid regular expression: {e}") from e
+    return rules
+
+
+def load_rules(path: str) -> Dict[str, Any]:
+    """
+    Load an assignment rules file
+
+    The file is JSON of the form::
+
+        {
+            "names": ["Alice", "Bob"],
+            "rules": [{"pattern": "milk", "buyers": ["All"]},
+                      {"pattern": "^ASDA Extra Special", "regex": true, "buyers": ["Bob"]}],
+            "categories": {"Alice": ["yogurt", "granola"]},
+            "default": ["All"],
+            "payers": {"2024-05-03.html": "Alice", "2024-05-10.html": "Bob"}
+        }
+
+    "categories" (optional) are per-person keyword lists, tried after "rules".
+    "default" (optional) assigns items no rule matched.
+    "payers" (optional) names who paid for each receipt, by file name.
+
+    Args:
+        path: Path to the rules file
+
+    Returns:
+        Dict with "names", "rules" (list of Rule), "default" (list of buyers or None)
+        and "payers" (receipt file name to payer)
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+
+    return {
+        "names": data.get("names", []),
+        "rules": [Rule.from_dict(rule) for rule in data.get("rules", [])]
+        + category_rules(data.get("categories", {})),
+        "default": data.get("default"),
+        "payers": data.get("payers", {}),
+    }
+
+
+def apply_rules(
+    items: List[OrderItem],
+    rules: Union[List[Rule], RuleMatcher],
+    names: List[str],
+    default: Optional[List[str]] = None,
+) -> List[Dict[str, float]]:
+    """
+    Allocate every item using the first rule that matches it
+
+    Args:
+        items: Order items
+        rules: Rules in priority order, or a RuleMatcher built from them
+        names: Everyone taking part in the split
+        default: Buyers for items no rule matched (None leaves them unassigned)
+
+    Returns:
+        One allocation dict per item, in item order
+    """
+    allocations = []
+    for buyers, item in zip(match_buyers(items, rules, default), items):
+        allocations.append(allocate(buyers, item.quantity, names) if buyers else {})
+    return allocations
+
+
+def match_buyers(
+    items: List[OrderItem],
+    rules: Union[List[Rule], RuleMatcher],
+    default: Optional[List[str]] = None,
+) -> List[Optional[List[str]]]:
+    """
+    Return the buyers of the first rule matching each item
+
+    Args:
+        items: Order items
+        rules: Rules in priority order, or a RuleMatcher built from them
+        default: Buyers for items no rule matched
+
+    Returns:
+        Buyers for each item, in item order (default when no rule matched)
+    """
+    matcher = rules if isinstance(rules, RuleMatcher) else RuleMatcher(rules)
+    buyers = []
+    for item in items:
+        rule = matcher.first_match(item)
+        buyers.append(rule.buyers if rule is not None else default)
+    return buyers
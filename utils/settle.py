@@ -0,0 +1,163 @@
+import heapq
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple
+
+# Up to this many people with a non-zero balance are settled with the fewest
+# possible transfers; the exact search visits every subset of them (2^n)
+EXACT_MAX_PEOPLE = 12
+
+
+class Transfer(NamedTuple):
+    """A bank transfer from someone who owes money to someone who is owed."""
+
+    sender: str
+    recipient: str
+    pence: int
+
+    @property
+    def amount(self) -> float:
+        """Amount in pounds"""
+        return self.pence / 100
+
+
+def net_balances(orders: Iterable[Tuple[str, Mapping[str, float]]]) -> Dict[str, int]:
+    """
+    Net what everyone paid against what they owe, over any number of orders.
+
+    Args:
+        orders: (payer, split) for each order, where split maps each person to
+            the amount they owe for it (as from compute_split)
+
+    Returns:
+        Balance of each person in pence: positive if they are owed money,
+        negative if they owe. The balances add up to zero.
+    """
+    balances: Dict[str, int] = {}
+    for payer, split in orders:
+        balances.setdefault(payer, 0)
+        for person, amount in split.items():
+            pence = round(amount * 100)
+            balances[person] = balances.get(person, 0) - pence
+            balances[payer] += pence
+    return balances
+
+
+def _greedy_transfers(balances: List[Tuple[str, int]]) -> List[Transfer]:
+    """
+    Settle balances adding up to zero with at most n - 1 transfers.
+
+    Debts that exactly match a credit are paid off directly first; the rest
+    goes from the largest debtor to the largest creditor, each transfer
+    clearing at least one of the two. O(n log n).
+    """
+    transfers = []
+    creditors: Dict[int, List[str]] = {}
+    for person, balance in balances:
+        if balance > 0:
+            creditors.setdefault(balance, []).append(person)
+
+    debtors = []
+    for person, balance in balances:
+        if balance < 0:
+            matching = creditors.get(-balance)
+            if matching:
+                transfers.append(Transfer(person, matching.pop(), -balance))
+            else:
+                debtors.append((balance, person))
+
+    heapq.heapify(debtors)
+    owed = [(-balance, person) for balance, persons in creditors.items() for person in persons]
+    heapq.heapify(owed)
+
+    while debtors and owed:
+        debt, sender = heapq.heappop(debtors)
+        credit, recipient = heapq.heappop(owed)
+        pence = min(-debt, -credit)
+        transfers.append(Transfer(sender, recipient, pence))
+        if debt + pence:
+            heapq.heappush(debtors, (debt + pence, sender))
+        if credit + pence:
+            heapq.heappush(owed, (credit + pence, recipient))
+    return transfers
+
+
+def _zero_sum_groups(balances: List[Tuple[str, int]]) -> List[List[Tuple[str, int]]]:
+    """
+    Split balances into as many groups adding up to zero as possible.
+
+    A group of k people settles with k - 1 transfers, so the most groups
+    gives the fewest transfers overall (finding them is NP-hard, hence the
+    subset search is kept to EXACT_MAX_PEOPLE). best[mask] is the most
+    zero-sum groups the people in mask can be split into, built up by
+    removing one person at a time.
+    """
+    n = len(balances)
+    size = 1 << n
+    total = [0] * size
+    best = [0] * size
+    via = [0] * size
+    for mask in range(1, size):
+        low = mask & -mask
+        total[mask] = total[mask ^ low] + balances[low.bit_length() - 1][1]
+
+        most, choice, rest = -1, 0, mask
+        while rest:
+            bit = rest & -rest
+            if best[mask ^ bit] > most:
+                most, choice = best[mask ^ bit], bit
+            rest ^= bit
+        best[mask] = most + (total[mask] == 0)
+        via[mask] = choice
+
+    # Walk back from everyone; each time the remaining people add up to zero,
+    # the people removed since the previous time form a group
+    groups, group, mask = [], [], size - 1
+    while mask:
+        bit = via[mask]
+        group.append(balances[bit.bit_length() - 1])
+        mask ^= bit
+        if total[mask] == 0:
+            groups.append(group)
+            group = []
+    return groups
+
+
+def settle(balances: Mapping[str, int], exact_max_people: int = EXACT_MAX_PEOPLE) -> List[Transfer]:
+    """
+    Find bank transfers that settle everyone's balance.
+
+    Groups of up to exact_max_people with a non-zero balance get the fewest
+    transfers possible; larger groups use the greedy solver, which needs at
+    most one transfer fewer than the number of people.
+
+    Args:
+        balances: Balance of each person in pence (see net_balances)
+        exact_max_people: Largest group solved exactly
+
+    Returns:
+        Transfers, each clearing part of a debt
+
+    Raises:
+        ValueError: If the balances do not add up to zero
+    """
+    if sum(balances.values()) != 0:
+        raise ValueError(f"Balances must add up to zero, not {sum(balances.values())} pence")
+
+    outstanding = [(person, balance) for person, balance in balances.items() if balance]
+    if len(outstanding) > exact_max_people:
+        return _greedy_transfers(outstanding)
+
+    transfers = []
+    for group in _zero_sum_groups(outstanding):
+        transfers.extend(_greedy_transfers(group))
+    return transfers
+
+
+def settle_orders(
+    orders: Iterable[Tuple[str, Mapping[str, float]]],
+    exact_max_people: Optional[int] = None,
+) -> List[Transfer]:
+    """Net the splits of several orders with their payers and settle the balances (see settle)"""
+    balances = net_balances(orders)
+    if exact_max_people is None:
+        return settle(balances)
+    return settle(balances, exact_max_people)
@@ -0,0 +1,91 @@
+from typing import Dict, Iterable, List, Mapping
+
+import numpy as np
+
+from .constants import QUOTA_DECIMALS
+
+
+def to_pence(prices: Iterable[float]) -> np.ndarray:
+    """Convert prices in pounds to integer pence."""
+    return np.rint(np.fromiter(prices, dtype=np.float64) * 100).astype(np.int64)
+
+
+def allocation_matrix(allocations: List[Mapping[str, float]], names: List[str]) -> np.ndarray:
+    """
+    Build an items x people matrix from per-item allocations.
+
+    Args:
+        allocations: One dict per item mapping person name to allocated quantity
+        names: People to split between, in column order
+
+    Returns:
+        Float matrix of shape (len(allocations), len(names))
+    """
+    column = {name: j for j, name in enumerate(names)}
+    matrix = np.zeros((len(allocations), len(names)), dtype=np.float64)
+    for i, allocation in enumerate(allocations):
+        for person, qty in allocation.items():
+            if person in column:
+                matrix[i, column[person]] = qty
+    return matrix
+
+
+def split_shares(prices_pence: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    """
+    Split every item's price between people in one vectorised pass.
+
+    Each item is divided in proportion to its row of the allocation matrix
+    using the largest-remainder method: everyone gets the floor of their exact
+    share, and the leftover pennies go to the largest fractional parts, ties
+    broken by column order. Every assigned row therefore sums exactly to its
+    price, independent of the order buyers were picked in.
+
+    Args:
+        prices_pence: Integer prices, shape (n_items,)
+        matrix: Allocated quantities, shape (n_items, n_people)
+
+    Returns:
+        Integer pence owed per item and person, shape (n_items, n_people).
+        Rows with nothing allocated are all zero.
+    """
+    prices_pence = np.asarray(prices_pence, dtype=np.int64)
+    matrix = np.clip(np.asarray(matrix, dtype=np.float64), 0, None)
+    n_items, n_people = matrix.shape
+
+    row_totals = matrix.sum(axis=1)
+    assigned = row_totals > 0
+
+    quota = np.zeros_like(matrix)
+    np.divide(prices_pence[:, None] * matrix, row_totals[:, None], out=quota, where=assigned[:, None])
+    quota = np.round(quota, QUOTA_DECIMALS)
+
+    base = np.floor(quota).astype(np.int64)
+    remainder = np.where(assigned, prices_pence - base.sum(axis=1), 0)
+
+    # Rank each person within their row by fractional part, largest first
+    order = np.argsort(-(quota - base), axis=1, kind="stable")
+    rank = np.empty_like(order)
+    np.put_along_axis(rank, order, np.broadcast_to(np.arange(n_people), (n_items, n_people)), axis=1)
+
+    return base + (rank < remainder[:, None])
+
+
+def compute_split(prices: Iterable[float], allocations: List[Mapping[str, float]], names: List[str]) -> Dict[str, float]:
+    """
+    Compute how much each person owes for a whole order.
+
+    Args:
+        prices: Item prices in pounds
+        allocations: One dict per item mapping person name to allocated quantity
+        names: People to split between
+
+    Returns:
+        Dict mapping each person with at least one allocation to the amount owed
+        in pounds. The amounts add up exactly to the price of the assigned items.
+    """
+    matrix = allocation_matrix(allocations, names)
+    shares = split_shares(to_pence(prices), matrix)
+
+    totals = shares.sum(axis=0)
+    involved = (matrix > 0).any(axis=0)
+    return {name: int(totals[j]) / 100 for j, name in enumerate(names) if involved[j]}
@@ -0,0 +1,552 @@
+import time
+import codecs
+import logging
+from html.parser import HTMLParser
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type, Union
+
+from .constants import DEFAULT_IMAGE
+from .items import OrderItem
+from .parsers import (
+    ENCODING_SNIFF_BYTES,
+    TITLE_WITH_QUANTITY_PATTERN,
+    StoreParser,
+    _clean_and_convert_price,
+    _parse_title_and_quantity,
+    _record_run,
+    sniff_encoding,
+)
+from .metrics import ROWS_SEEN, ROWS_SKIPPED, count
+from .progress import report
+from .webarchive import Buffer
+
+logger = logging.getLogger(__name__)
+
+# Bytes decoded and fed to the tokenizer at a time; memory use is bounded by
+# this and the largest item, not by the size of the document
+CHUNK_SIZE = 64 * 1024
+
+# Elements that never have a closing tag
+VOID_ELEMENTS = frozenset({
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr",
+})
+
+
+class _Capture:
+    """Text nodes (and the number of child elements) of an element being read"""
+
+    __slots__ = ("field", "nodes", "elements")
+
+    def __init__(self, field: Any):
+        self.field = field
+        self.nodes: List[str] = []
+        self.elements = 0
+
+    def text(self, strip: bool = True) -> str:
+        """Element text, as BeautifulSoup's get_text(strip=True) or .text"""
+        if strip:
+            return "".join(node.strip() for node in self.nodes)
+        return "".join(self.nodes)
+
+    def string(self) -> Optional[str]:
+        """The element's only text node, as BeautifulSoup's .string (None otherwise)"""
+        return self.nodes[0] if len(self.nodes) == 1 and not self.elements else None
+
+
+class ItemStream:
+    """
+    State machine turning the tag events of one store format into items
+
+    Mirrors the extract method of the StoreParser with the same key, but
+    sees the document as a stream of start tags, text and end tags instead
+    of a tree: each item is emitted as soon as the closing tag of its
+    row arrives, and nothing outside the current row is kept.
+
+    Subclasses implement start, close and captured; capture asks for the
+    text of the element that just started, delivered to captured when it
+    closes. Each finished row goes to row, as its item or the reason it was
+    skipped (the reasons of the StoreParser).
+    """
+
+    # Key of the StoreParser this mirrors
+    key: str = ""
+
+    def __init__(self):
+        # Completed items, taken by the reader after every chunk
+        self.items: List[OrderItem] = []
+        self._captures: Dict[int, _Capture] = {}
+        # Rows read and skipped (by reason), recorded in the metrics once the stream ends
+        self.rows = 0
+        self.skipped: Dict[str, int] = {}
+
+    def row(self, outcome: Union[OrderItem, str]) -> None:
+        """Count a finished row: the item it gave, or the reason it was skipped"""
+        self.rows += 1
+        if isinstance(outcome, str):
+            self.skipped[outcome] = self.skipped.get(outcome, 0) + 1
+        else:
+            self.items.append(outcome)
+
+    def record(self) -> None:
+        """Add the rows read to the parse metrics"""
+        count(ROWS_SEEN, self.rows, parser=self.key)
+        for reason, rows in self.skipped.items():
+            count(ROWS_SKIPPED, rows, parser=self.key, reason=reason)
+
+    @property
+    def capturing(self) -> bool:
+        return bool(self._captures)
+
+    def capture(self, depth: int, field: Any) -> None:
+        """Collect the text of the element at depth, until it closes; field tells captured what it is"""
+        self._captures[depth] = _Capture(field)
+
+    def handle_start(self, tag: str, attrs: Dict[str, str], depth: int) -> None:
+        for capture in self._captures.values():
+            capture.elements += 1
+        self.start(tag, attrs, depth)
+
+    def handle_text(self, node: str) -> None:
+        for capture in self._captures.values():
+            capture.nodes.append(node)
+
+    def handle_end(self, tag: str, depth: int) -> None:
+        capture = self._captures.pop(depth, None)
+        if capture is not None:
+            self.captured(capture)
+        self.close(tag, depth)
+
+    def start(self, tag: str, attrs: Dict[str, str], depth: int) -> None:
+        """An element opened at depth (void elements close right after)"""
+
+    def close(self, tag: str, depth: int) -> None:
+        """The element opened at depth closed"""
+
+    def captured(self, capture: _Capture) -> None:
+        """A captured element closed"""
+
+    def finish(self) -> None:
+        """The document ended"""
+
+
+# Parser key -> state machine reading the same format
+STREAMS: Dict[str, Type[ItemStream]] = {}
+
+
+def register_stream(cls: Type[ItemStream]) -> Type[ItemStream]:
+    """Class decorator making an ItemStream available to stream_items"""
+    STREAMS[cls.key] = cls
+    return cls
+
+
+def _classes(attrs: Dict[str, str]) -> List[str]:
+    return (attrs.get("class") or "").split()
+
+
+def _src(attrs: Optional[Dict[str, str]]) -> str:
+    """Image URL of an <img>, as _safe_get_attr(img, "src", DEFAULT_IMAGE)"""
+    return (attrs.get("src") if attrs else None) or DEFAULT_IMAGE
+
+
+@register_stream
+class AsdaTableStream(ItemStream):
+    """Stream of AsdaTableParser: one <tr class="item-row__content"> per item"""
+
+    key = "asda-table"
+
+    def __init__(self):
+        super().__init__()
+        # Depth of the item row while it is open
+        self.depth: Optional[int] = None
+
+    def start(self, tag: str, attrs: Dict[str, str], depth: int) -> None:
+        if self.depth is None:
+            if tag == "tr" and "item-row__content" in _classes(attrs):
+                self.depth = depth
+                classes = _classes(attrs)
+                self.skip = (
+                    "unavailable" if "item-row__content--unavailable" in classes
+                    else "substituted" if "item-row__content--subs-original" in classes
+                    else None
+                )
+                self.fields: Dict[str, str] = {}
+                self.quantities: List[str] = []
+                self.image: Optional[Dict[str, str]] = None
+            return
+
+        classes = _classes(attrs)
+        if tag == "h4" and "item-title__label" in classes and "title" not in self.fields:
+            self.capture(depth, "title")
+        elif tag == "span" and "item-title__weight" in classes and "weight" not in self.fields:
+            self.capture(depth, "weight")
+        elif tag == "span" and "item-title__quantity" in classes:
+            self.capture(depth, "quantity")
+        elif tag == "p" and "item-price__label" in classes and "price" not in self.fields:
+            self.capture(depth, "price")
+        elif tag == "img" and "item-image__image" in classes and self.image is None:
+            self.image = attrs
+
+    def captured(self, capture: _Capture) -> None:
+        if capture.field == "quantity":
+            self.quantities.append(capture.text())
+        else:
+            self.fields.setdefault(capture.field, capture.text())
+
+    def close(self, tag: str, depth: int) -> None:
+        if depth != self.depth:
+            return
+        self.depth = None
+        self.row(self.item())
+
+    def item(self) -> Union[OrderItem, str]:
+        if self.skip:
+            return self.skip
+        if "title" not in self.fields:
+            return "no_title"
+
+        name, quantity = _parse_title_and_quantity(self.fields["title"])
+        if quantity == 0:
+            return "zero_quantity"
+
+        weight = self.fields.get("weight")
+        if weight is None:
+            weight = ", ".join(filter(None, self.quantities))
+
+        if "price" not in self.fields:
+            return "no_price"
+        price = _clean_and_convert_price(self.fields["price"])
+        if price is None:
+            return "bad_price"
+
+        return OrderItem(name, quantity, weight, price, _src(self.image))
+
+
+@register_stream
+class AsdaContainerStream(ItemStream):
+    """Stream of AsdaContainerParser: one <div data-testid="container-..."> per item"""
+
+    key = "asda-container"
+    DETAIL_CLASS = "chakra-text css-0"
+
+    def __init__(self):
+        super().__init__()
+        # Depth of the item row while it is open
+        self.depth: Optional[int] = None
+
+    def start(self, tag: str, attrs: Dict[str, str], depth: int) -> None:
+        if self.depth is None:
+            if tag == "div" and (attrs.get("data-testid") or "").startswith("container-"):
+                self.depth = depth
+                self.title: Optional[str] = None
+                self.details: List[str] = []
+                self.price: Optional[str] = None
+                self.image: Optional[Dict[str, str]] = None
+            return
+
+        if tag == "p":
+            # Any <p> may be the title, one of the detail lines (the second is
+            # the weight) or the price, so each is read with what it may be
+            detail = None
+            if " ".join(_classes(attrs)) == self.DETAIL_CLASS:
+                detail = len(self.details)
+                self.details.append("")
+            total = (attrs.get("data-testid") or "").startswith("totalCost-") and self.price is None
+            self.capture(depth, (detail, total))
+        elif tag == "img" and self.image is None:
+            self.image = attrs
+
+    def captured(self, capture: _Capture) -> None:
+        detail, total = capture.field
+        if detail is not None:
+            self.details[detail] = capture.text()
+        if total and self.price is None:
+            self.price = capture.text()
+        string = capture.string()
+        if self.title is None and string is not None and TITLE_WITH_QUANTITY_PATTERN.search(string):
+            self.title = capture.text()
+
+    def close(self, tag: str, depth: int) -> None:
+        if depth != self.depth:
+            return
+        self.depth = None
+        self.row(self.item())
+
+    def item(self) -> Union[OrderItem, str]:
+        if self.title is None:
+            return "no_title"
+
+        name, quantity = _parse_title_and_quantity(self.title)
+        if quantity == 0:
+            return "zero_quantity"
+
+        weight = self.details[1] if len(self.details) > 1 else ""
+
+        if self.price is None:
+            return "no_price"
+        price = _clean_and_convert_price(self.price)
+        if not price:
+            return "bad_price"
+
+        return OrderItem(name, quantity, weight, price, _src(self.image))
+
+
+@register_stream
+class TescoStream(ItemStream):
+    """
+    Stream of TescoParser: product blocks of the <article> headed "Rest of your items"
+
+    The heading is only known once it is read, so the blocks of each open
+    article are held back until it turns out to be the right one (and are
+    dropped when it closes otherwise); after that, blocks stream straight out.
+    """
+
+    key = "tesco"
+    BLOCK_CLASS = "styled__ProductContentWrapper-mfe-orders__sc-1hj3has-7"
+    QUANTITY_CLASS = "styled__SmallOnlyText-mfe-orders__sc-1hj3has-9"
+
+    def __init__(self):
+        super().__init__()
+        # (depth, rows held back) of each open <article>
+        self.articles: List[Tuple[int, List[Union[OrderItem, str]]]] = []
+        self.found = False
+        # Depth of the "Rest of your items" article while it is open
+        self.rest: Optional[int] = None
+        self.block: Optional[int] = None
+
+    def start(self, tag: str, attrs: Dict[str, str], depth: int) -> None:
+        if tag == "article":
+            self.articles.append((depth, []))
+        elif tag == "h3" and not self.found:
+            self.capture(depth, "heading")
+
+        if self.block is None:
+            # Once the heading is found, only blocks of its article count
+            if tag == "div" and self.BLOCK_CLASS in _classes(attrs) and (self.rest is not None or not self.found and self.articles):
+                self.block = depth
+                # Depth of the first product title while open, -1 once closed
+                self.title: Optional[int] = None
+                self.fields: Dict[str, str] = {}
+                self.image: Optional[Dict[str, str]] = None
+            return
+
+        testid = attrs.get("data-testid")
+        if tag == "div" and testid == "product-title" and self.title is None:
+            self.title = depth
+        elif tag == "a" and self.title is not None and self.title >= 0 and "name" not in self.fields:
+            self.capture(depth, "name")
+        elif tag == "div" and self.QUANTITY_CLASS in _classes(attrs) and "quantity" not in self.fields:
+            self.capture(depth, "quantity")
+        elif tag == "img" and testid == "product-image" and self.image is None:
+            self.image = attrs
+        elif tag == "h4" and testid == "receipt-total-price" and "price" not in self.fields:
+            self.capture(depth, "price")
+
+    def captured(self, capture: _Capture) -> None:
+        if capture.field == "heading":
+            if not self.found and capture.string() == "Rest of your items":
+                self.found = True
+                if self.articles:
+                    # Blocks already read in this article are released now
+                    self.rest = self.articles[-1][0]
+                    for outcome in self.articles[-1][1]:
+                        self.row(outcome)
+                    self.articles[-1][1].clear()
+        elif self.block is not None:
+            # Only the first <a> of the first product title counts, even if empty
+            text = capture.text(strip=capture.field != "quantity")
+            self.fields.setdefault(capture.field, text)
+
+    def close(self, tag: str, depth: int) -> None:
+        if depth == self.block:
+            self.block = None
+            if self.rest is not None:
+                self.row(self.item())
+            else:
+                self.articles[-1][1].append(self.item())
+        elif self.block is not None and depth == self.title:
+            self.title = -1
+        elif tag == "article" and self.articles and depth == self.articles[-1][0]:
+            _, held = self.articles.pop()
+            if depth == self.rest:
+                # Only the first "Rest of your items" article is read
+                self.rest = None
+            elif not self.found and self.articles:
+                # Nested in an article that may still turn out to be the right one
+                self.articles[-1][1].extend(held)
+
+    def item(self) -> Union[OrderItem, str]:
+        name = self.fields.get("name", "")
+        if not name:
+            return "no_name"
+
+        quantity = 1
+        text = self.fields.get("quantity")
+        if text is not None and "Quantity" in text:
+            try:
+                quantity = int(text.split(":")[1].strip())
+            except (IndexError, ValueError):
+                pass
+
+        weight = ""
+        alt = (self.image or {}).get("alt")
+        if alt is not None and alt.strip():
+            last_word = alt.strip().split()[-1]
+            if any(char.isdigit() for char in last_word):
+                weight = last_word
+
+        if "price" not in self.fields:
+            return "no_price"
+        price = _clean_and_convert_price(self.fields["price"])
+        if price is None:
+            return "bad_price"
+
+        return OrderItem(name, quantity, weight, price, _src(self.image))
+
+    def finish(self) -> None:
+        if not self.found:
+            logger.warning("No items found in the 'Rest of your items' section")
+
+
+class _EventReader(HTMLParser):
+    """
+    Tokenizer feeding start tag, text and end tag events to the state machines
+
+    Keeps only the stack of open elements (for the depth of each event) and
+    the text of the current node while a machine is capturing. End tags
+    without a matching start tag are ignored; an end tag closes every
+    element left open inside it.
+    """
+
+    def __init__(self, streams: List[ItemStream]):
+        super().__init__(convert_charrefs=True)
+        self.streams = streams
+        self.winner: Optional[ItemStream] = None
+        self._stack: List[str] = []
+        self._text: List[str] = []
+
+    def _flush(self) -> None:
+        if self._text:
+            node = "".join(self._text)
+            self._text = []
+            for stream in self.streams:
+                stream.handle_text(node)
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        values = {name: value or "" for name, value in attrs}
+        depth = len(self._stack)
+        for stream in self.streams:
+            stream.handle_start(tag, values, depth)
+        if tag in VOID_ELEMENTS:
+            for stream in self.streams:
+                stream.handle_end(tag, depth)
+        else:
+            self._stack.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        self._flush()
+        if tag not in self._stack:
+            return
+        while self._stack:
+            open_tag = self._stack.pop()
+            for stream in self.streams:
+                stream.handle_end(open_tag, len(self._stack))
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if any(stream.capturing for stream in self.streams):
+            self._text.append(data)
+
+    def handle_comment(self, data):
+        # A comment ends a text node, as in the tree
+        self._flush()
+
+    def collect(self) -> List[OrderItem]:
+        """
+        Take the items completed so far
+
+        When several formats were detected, the first machine to complete an
+        item is the one read; the others stop receiving events.
+        """
+        if self.winner is None:
+            self.winner = next((stream for stream in self.streams if stream.items), None)
+            if self.winner is None:
+                return []
+            self.streams = [self.winner]
+        items, self.winner.items = self.winner.items, []
+        return items
+
+    def close(self):
+        super().close()
+        self._flush()
+        while self._stack:
+            open_tag = self._stack.pop()
+            for stream in self.streams:
+                stream.handle_end(open_tag, len(self._stack))
+        for stream in self.streams:
+            stream.finish()
+
+
+def stream_items(data: Buffer, parsers: List[StoreParser], encoding: Optional[str] = None) -> Iterator[OrderItem]:
+    """
+    Extract items from raw HTML without building a document tree
+
+    The bytes are decoded and tokenized a chunk at a time, and each item is
+    yielded as soon as its closing tag is read. Progress is reported as the
+    "stream" stage, in bytes; rows, skips and time go to the parse metrics
+    once the document ends.
+
+    Args:
+        data: Raw HTML bytes (bytes, memoryview or mmap)
+        parsers: Parsers detected for the document, in priority order; those
+            without a streaming state machine are skipped
+        encoding: Known document encoding; sniffed from <meta> when omitted
+            or unknown to Python, then UTF-8
+
+    Yields:
+        OrderItem records, in document order
+    """
+    streams = [STREAMS[parser.key]() for parser in parsers if parser.key in STREAMS]
+    if not streams:
+        return
+
+    # A web archive may declare an encoding Python does not know (e.g. "x-mac-roman");
+    # the page's own <meta> charset is used instead, as when none is declared
+    if encoding:
+        try:
+            encoding = codecs.lookup(encoding).name
+        except LookupError:
+            logger.warning(f"Unknown text encoding {encoding}, reading the page's declared charset instead")
+            encoding = None
+    encoding = encoding or sniff_encoding(bytes(data[:ENCODING_SNIFF_BYTES])) or "utf-8"
+    # A byte order mark is not part of the text
+    decoder = codecs.getincrementaldecoder("utf-8-sig" if encoding == "utf-8" else encoding)(errors="replace")
+    reader = _EventReader(streams)
+    start = time.perf_counter()
+    emitted = 0
+
+    view = memoryview(data)
+    total = len(view)
+    for offset in range(0, total, CHUNK_SIZE):
+        reader.feed(decoder.decode(view[offset:offset + CHUNK_SIZE]))
+        report("stream", min(offset + CHUNK_SIZE, total), total)
+        items = reader.collect()
+        emitted += len(items)
+        yield from items
+
+    reader.feed(decoder.decode(b"", final=True))
+    reader.close()
+    items = reader.collect()
+    emitted += len(items)
+    yield from items
+
+    # Only the machine that was read counts, as only the parser that found items would
+    seconds = time.perf_counter() - start
+    for stream in [reader.winner] if reader.winner is not None else streams:
+        stream.record()
+        _record_run(stream.key, "stream", seconds, emitted if stream is reader.winner else 0)
@@ -0,0 +1,351 @@
+import io
+import os
+import base64
+import ipaddress
+import hashlib
+import logging
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional, Sequence
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Fetches the raw bytes of an image URL, raising on failure
+Fetcher = Callable[[str], bytes]
+
+# Shown for images that could not be fetched (e.g. on an offline kiosk)
+PLACEHOLDER_IMAGE = "data:image/svg+xml;base64," + base64.b64encode(
+    b'<svg xmlns="http://www.w3.org/2000/svg" width="70" height="70" viewBox="0 0 70 70">'
+    b'<rect width="70" height="70" rx="17" fill="#f0f2f6"/>'
+    b'<path d="M20 48l10-13 8 10 6-7 8 10z" fill="#c4c7cf"/><circle cx="45" cy="25" r="5" fill="#c4c7cf"/>'
+    b"</svg>"
+).decode("ascii")
+
+THUMBNAIL_SUFFIX = ".jpg"
+THUMBNAIL_QUALITY = 85
+
+# Image URLs come from uploaded files, so the server only fetches them over
+# HTTP(S) from the stores' image hosts (and their subdomains)
+IMAGE_HOSTS = ("asda.com", "assets-asda.com", "tesco.com", "cdn-icons-png.freepik.com")
+# Larger responses are abandoned rather than read into memory
+MAX_IMAGE_BYTES = 4 * 1024 * 1024
+
+
+class ImageURLError(ValueError):
+    """Raised for image URLs the server refuses to fetch."""
+
+
+def check_image_url(url: str, allowed_hosts: Sequence[str] = IMAGE_HOSTS) -> None:
+    """
+    Refuse image URLs that are not HTTP(S) on one of the allowed hosts.
+
+    Args:
+        url: Image URL
+        allowed_hosts: Host names whose subdomains are allowed too; "*" allows
+            any host name, but never an IP address or localhost
+
+    Raises:
+        ImageURLError: If the URL may not be fetched
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https"):
+        raise ImageURLError(f"Only http and https image URLs are fetched, not {parts.scheme or 'relative'} URLs")
+
+    host = (parts.hostname or "").rstrip(".").lower()
+    if not host:
+        raise ImageURLError("Image URL has no host")
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        # Shorthand IPv4 forms (e.g. 0x7f000001) that the resolver would accept
+        try:
+            socket.inet_aton(host)
+        except OSError:
+            pass
+        else:
+            raise ImageURLError(f"Image host {host} is an IP address")
+    else:
+        raise ImageURLError(f"Image host {host} is an IP address")
+    if host == "localhost" or host.endswith(".localhost"):
+        raise ImageURLError(f"Image host {host} is local")
+
+    if "*" in allowed_hosts:
+        return
+    if not any(host == allowed or host.endswith("." + allowed) for allowed in allowed_hosts):
+        raise ImageURLError(f"Image host {host} is not a known store image host")
+
+
+def http_fetcher(
+    url: str,
+    timeout: float = 5.0,
+    allowed_hosts: Sequence[str] = IMAGE_HOSTS,
+    max_bytes: int = MAX_IMAGE_BYTES,
+) -> bytes:
+    """
+    Default fetcher: download an image with urllib.
+
+    Only http(s) URLs on the allowed hosts are fetched, redirects included
+    (see check_image_url), and at most max_bytes are read.
+
+    Raises:
+        ImageURLError: If the URL, or a redirect, may not be fetched
+        ValueError: If the image is larger than max_bytes
+    """
+    import urllib.request
+
+    class CheckedRedirects(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, req, fp, code, msg, headers, newurl):
+            check_image_url(newurl, allowed_hosts)
+            return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+    check_image_url(url, allowed_hosts)
+    # Only the HTTP(S) handlers and redirects, so no other scheme can be reached
+    opener = urllib.request.OpenerDirector()
+    for handler in (
+        urllib.request.ProxyHandler(),
+        urllib.request.HTTPHandler(),
+        urllib.request.HTTPSHandler(),
+        urllib.request.HTTPDefaultErrorHandler(),
+        urllib.request.HTTPErrorProcessor(),
+        CheckedRedirects(),
+    ):
+        opener.add_handler(handler)
+
+    request = urllib.request.Request(url, headers={"User-Agent": "grocery-splitter"})
+    with opener.open(request, timeout=timeout) as response:
+        length = response.headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > max_bytes:
+            raise ValueError(f"Image is larger than {max_bytes} bytes")
+        data = response.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ValueError(f"Image is larger than {max_bytes} bytes")
+    return data
+
+
+def make_thumbnail(data: bytes, size: int) -> bytes:
+    """
+    Downscale an image to fit a size x size box and encode it as JPEG.
+
+    Transparent areas are flattened onto white, matching the background the
+    item rows draw behind the image.
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.thumbnail((size, size))
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        out = io.BytesIO()
+        image.save(out, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+        return out.getvalue()
+
+
+class ThumbnailCache:
+    """
+    On-disk cache of downscaled product images with size-bounded LRU eviction.
+
+    Each image URL is fetched once, shrunk to the thumbnail size shown in the
+    item rows and stored as a small JPEG. Rows then embed the thumbnail inline
+    as a data URI, so reruns make no remote requests at all. File modification
+    times record recency, so the LRU order survives restarts.
+
+    Args:
+        directory: Folder holding the thumbnails (created if missing)
+        max_bytes: Total size of the thumbnails kept on disk
+        size: Thumbnail width and height in pixels
+        fetcher: Callable returning the bytes of an image URL (http_fetcher
+            limited to allowed_hosts by default)
+        allowed_hosts: Image hosts the default fetcher may download from
+        retry_after: Seconds before a failed URL is tried again. When a fetch
+            fails without a response from the server (offline, DNS, timeout)
+            the whole host is skipped for this long, so an offline machine
+            does not wait on every image in turn.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = 64 * 1024 * 1024,
+        size: int = 70,
+        fetcher: Optional[Fetcher] = None,
+        retry_after: float = 300.0,
+        allowed_hosts: Sequence[str] = IMAGE_HOSTS,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = size
+        self.fetcher = fetcher or (lambda url: http_fetcher(url, allowed_hosts=allowed_hosts))
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._failures: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._load_index()
+
+    def _load_index(self) -> None:
+        """Rebuild the LRU order from the files already on disk (oldest first)."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(THUMBNAIL_SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+
+        for _, name, size in sorted(entries):
+            self._files[name] = size
+            self._total += size
+        self._evict()
+
+    def _filename(self, url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest() + THUMBNAIL_SUFFIX
+
+    def _evict(self) -> None:
+        """Remove least recently used thumbnails until the cache fits max_bytes (lock held)."""
+        while self._total > self.max_bytes and self._files:
+            name, size = self._files.popitem(last=False)
+            self._total -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def _read(self, name: str) -> Optional[bytes]:
+        """Return a stored thumbnail and mark it as recently used."""
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            if name not in self._files:
+                return None
+            self._files.move_to_end(name)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            # Removed behind our back
+            with self._lock:
+                self._total -= self._files.pop(name, 0)
+            return None
+        return data
+
+    def _store(self, name: str, data: bytes) -> None:
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._total += len(data) - self._files.pop(name, 0)
+            self._files[name] = len(data)
+            self._evict()
+
+    def get(self, url: str) -> Optional[bytes]:
+        """
+        Return the JPEG thumbnail for an image URL, fetching it on a miss.
+
+        Args:
+            url: Image URL
+
+        Returns:
+            Thumbnail bytes, or None if the image could not be fetched or decoded
+        """
+        name = self._filename(url)
+        data = self._read(name)
+        if data is not None:
+            with self._lock:
+                self.hits += 1
+            return data
+
+        with self._lock:
+            self.misses += 1
+            host = urlsplit(url).netloc or url
+            for key in (url, host):
+                failed_at = self._failures.get(key)
+                if failed_at is not None and time.monotonic() - failed_at < self.retry_after:
+                    return None
+
+        try:
+            raw = self.fetcher(url)
+        except ImageURLError as e:
+            logger.warning(f"Not fetching image {url}: {e}")
+            self._record_failure(url)
+            return None
+        except Exception as e:
+            logger.warning(f"Could not fetch image {url}: {e}")
+            # HTTP errors carry a status code: the host is up, only this image is missing
+            self._record_failure(url if hasattr(e, "code") else host)
+            return None
+
+        try:
+            data = make_thumbnail(raw, self.size)
+        except Exception as e:
+            logger.warning(f"Could not create thumbnail for {url}: {e}")
+            self._record_failure(url)
+            return None
+
+        self._store(name, data)
+        return data
+
+    def _record_failure(self, key: str) -> None:
+        with self._lock:
+            self.failures += 1
+            self._failures[key] = time.monotonic()
+
+    def data_uri(self, url: str) -> str:
+        """Return the thumbnail as an inline data URI, or PLACEHOLDER_IMAGE if unavailable."""
+        if url.startswith("data:"):
+            return url
+
+        data = self.get(url)
+        if data is None:
+            return PLACEHOLDER_IMAGE
+        return "data:image/jpeg;base64," + base64.b64encode(data).decode("ascii")
+
+    def prefetch(self, urls: Iterable[str], workers: int = 8) -> None:
+        """Fetch the thumbnails of several images in parallel."""
+        missing = [url for url in dict.fromkeys(urls) if self._filename(url) not in self._files]
+        if not missing:
+            return
+
+        with ThreadPoolExecutor(max_workers=min(workers, len(missing))) as pool:
+            list(pool.map(self.get, missing))
+
+    def clear(self) -> None:
+        """Delete every stored thumbnail (counters are kept)."""
+        with self._lock:
+            for name in self._files:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+            self._files.clear()
+            self._failures.clear()
+            self._total = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return the hit/miss/failure/eviction counters and current size."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "failures": self.failures,
+                "evictions": self.evictions,
+                "files": len(self._files),
+                "bytes": self._total,
+            }
@@ -0,0 +1,78 @@
+import json
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+# Spans are emitted as one JSON object per line on this logger
+timing_logger = logging.getLogger("grocery_splitter.timing")
+
+
+class Timeline:
+    """
+    Timing spans recorded during one script run
+
+    Args:
+        run_id: Identifier included in every logged span (e.g. a rerun counter)
+    """
+
+    def __init__(self, run_id: Any = None):
+        self.run_id = run_id
+        self.spans: List[Dict[str, Any]] = []
+        self.started = time.perf_counter()
+
+    def total_ms(self) -> float:
+        """Milliseconds since the timeline was started"""
+        return (time.perf_counter() - self.started) * 1000
+
+
+_current_timeline: ContextVar[Optional[Timeline]] = ContextVar("current_timeline", default=None)
+_current_span: ContextVar[Optional[Dict[str, Any]]] = ContextVar("current_span", default=None)
+
+
+def start_timeline(run_id: Any = None) -> Timeline:
+    """Start collecting spans for the current run (thread / context)"""
+    timeline = Timeline(run_id)
+    _current_timeline.set(timeline)
+    return timeline
+
+
+def current_timeline() -> Optional[Timeline]:
+    """Return the timeline spans are currently recorded into, if any"""
+    return _current_timeline.get()
+
+
+@contextmanager
+def span(stage: str, **fields: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Time a stage and log it as structured JSON
+
+    The yielded dict is the span record; add fields to it (e.g. item counts)
+    inside the block. Spans nested inside another span record their parent.
+
+    Args:
+        stage: Stage name, e.g. "soup" or "render_order"
+        **fields: Extra fields stored with the span
+
+    Yields:
+        The span record
+    """
+    timeline = _current_timeline.get()
+    parent = _current_span.get()
+    record: Dict[str, Any] = {"stage": stage, **fields}
+    if parent is not None:
+        record["parent"] = parent["stage"]
+
+    token = _current_span.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["ms"] = round((time.perf_counter() - start) * 1000, 3)
+        _current_span.reset(token)
+
+        if timeline is not None:
+            record["run"] = timeline.run_id
+            timeline.spans.append(record)
+        timing_logger.info(json.dumps(record, default=str))
@@ -0,0 +1,151 @@
+import mmap
+import plistlib
+import struct
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple, Union
+
+Buffer = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+BINARY_PLIST_MAGIC = b"bplist00"
+TRAILER_SIZE = 32
+
+# Object type markers (high nibble of the object's first byte)
+MARKER_INT = 0x1
+MARKER_DATA = 0x4
+MARKER_ASCII = 0x5
+MARKER_UTF16 = 0x6
+MARKER_DICT = 0xD
+
+
+class WebArchiveError(ValueError):
+    """Raised when an upload is not a readable Safari web archive."""
+
+
+class _BinaryPlist:
+    """
+    Lazy reader over a binary property list.
+
+    Only the objects that are actually visited are decoded; data objects are
+    returned as memoryview slices of the original buffer, so large
+    subresources (images, scripts) are never copied.
+    """
+
+    def __init__(self, buffer: Buffer):
+        self.view = memoryview(buffer).cast("B")
+        if len(self.view) < len(BINARY_PLIST_MAGIC) + TRAILER_SIZE:
+            raise WebArchiveError("File is too small to be a web archive")
+
+        trailer = self.view[-TRAILER_SIZE:]
+        self.offset_size, self.ref_size = trailer[6], trailer[7]
+        self.num_objects, self.top_object, self.offset_table = struct.unpack(">QQQ", trailer[8:])
+
+    def _uint(self, start: int, size: int) -> int:
+        return int.from_bytes(self.view[start:start + size], "big")
+
+    def _object_offset(self, ref: int) -> int:
+        if ref >= self.num_objects:
+            raise WebArchiveError(f"Object reference {ref} out of range")
+        return self._uint(self.offset_table + ref * self.offset_size, self.offset_size)
+
+    def _length(self, offset: int) -> Tuple[int, int]:
+        """Return (length, start of payload) for the object at offset."""
+        info = self.view[offset] & 0x0F
+        if info != 0x0F:
+            return info, offset + 1
+
+        # Long objects store their length as a following int object
+        marker = self.view[offset + 1]
+        if marker >> 4 != MARKER_INT:
+            raise WebArchiveError("Malformed object length")
+        size = 1 << (marker & 0x0F)
+        return self._uint(offset + 2, size), offset + 2 + size
+
+    def _string(self, ref: int) -> Optional[str]:
+        offset = self._object_offset(ref)
+        kind = self.view[offset] >> 4
+        length, start = self._length(offset)
+        if kind == MARKER_ASCII:
+            return bytes(self.view[start:start + length]).decode("ascii", errors="replace")
+        if kind == MARKER_UTF16:
+            return bytes(self.view[start:start + length * 2]).decode("utf-16-be", errors="replace")
+        return None
+
+    def dict_lookup(self, ref: int, key: str) -> Optional[int]:
+        """Return the object reference stored under key in the dict at ref."""
+        offset = self._object_offset(ref)
+        if self.view[offset] >> 4 != MARKER_DICT:
+            return None
+
+        count, start = self._length(offset)
+        values = start + count * self.ref_size
+        for i in range(count):
+            if self._string(self._uint(start + i * self.ref_size, self.ref_size)) == key:
+                return self._uint(values + i * self.ref_size, self.ref_size)
+        return None
+
+    def data(self, ref: int) -> Optional[memoryview]:
+        """Return the bytes of a data object as a zero-copy slice."""
+        offset = self._object_offset(ref)
+        if self.view[offset] >> 4 != MARKER_DATA:
+            return None
+        length, start = self._length(offset)
+        return self.view[start:start + length]
+
+
+def read_main_resource(buffer: Buffer) -> Tuple[Optional[memoryview], Optional[str]]:
+    """
+    Extract the main HTML document from a Safari .webarchive
+
+    Binary archives are navigated in place and the HTML is returned as a view
+    into buffer, so neither the subresources nor the page itself are copied.
+    XML archives fall back to plistlib.
+
+    Args:
+        buffer: The archive contents (bytes, memoryview or mmap)
+
+    Returns:
+        Tuple of (HTML bytes view or None if missing, declared text encoding or None)
+    """
+    view = memoryview(buffer)
+    if bytes(view[: len(BINARY_PLIST_MAGIC)]) != BINARY_PLIST_MAGIC:
+        try:
+            archive = plistlib.loads(bytes(view))
+        except Exception as e:
+            raise WebArchiveError(f"Could not read web archive: {e}") from e
+        resource = archive.get("WebMainResource", {})
+        data = resource.get("WebResourceData")
+        return (memoryview(data) if data is not None else None), resource.get("WebResourceTextEncodingName")
+
+    try:
+        plist = _BinaryPlist(view)
+        resource = plist.dict_lookup(plist.top_object, "WebMainResource")
+        if resource is None:
+            return None, None
+
+        data_ref = plist.dict_lookup(resource, "WebResourceData")
+        encoding_ref = plist.dict_lookup(resource, "WebResourceTextEncodingName")
+        data = plist.data(data_ref) if data_ref is not None else None
+        encoding = plist._string(encoding_ref) if encoding_ref is not None else None
+        return data, encoding
+
+    except (IndexError, struct.error) as e:
+        raise WebArchiveError(f"Truncated or corrupt web archive: {e}") from e
+
+
+@contextmanager
+def mapped_file(path: str) -> Iterator[memoryview]:
+    """Memory-map a file read-only for the duration of the block."""
+    with open(path, "rb") as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            yield memoryview(b"")
+            return
+
+        with mapped:
+            view = memoryview(mapped)
+            try:
+                yield view
+            finally:
+                view.release()
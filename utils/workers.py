@@ -0,0 +1,322 @@
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from .items import OrderItem
+from .metrics import collecting, merge_metrics
+from .progress import ParseCancelled, reporting
+from .webarchive import Buffer, WebArchiveError, read_main_resource
+
+logger = logging.getLogger(__name__)
+
+# Progress is written back at most this often (seconds), besides stage changes
+PROGRESS_INTERVAL = 0.1
+
+QUEUED = "queued"
+
+
+def _quiet_worker() -> None:
+    """Worker initializer: keep per-parse info logging out of the server log"""
+    logging.getLogger("utils").setLevel(logging.WARNING)
+    logging.getLogger("grocery_splitter").setLevel(logging.WARNING)
+
+
+def _run_parse(
+    job_id: str,
+    data: bytes,
+    is_webarchive: bool,
+    store: Optional[str],
+    encoding: Optional[str],
+    status: Any,
+    cancelled: Any,
+) -> Tuple[Optional[List[OrderItem]], Dict[str, List[Any]]]:
+    """
+    Parse a receipt inside a worker process, streaming progress to status
+
+    Returns:
+        Tuple of (the items, or None if the job was cancelled; snapshot of the
+        parse metrics, merged by the server process)
+    """
+    from .parsers import parse_receipt
+
+    last = {"stage": None, "time": 0.0}
+
+    def callback(stage: str, done: int, total: int) -> None:
+        now = time.monotonic()
+        if stage == last["stage"] and done != total and now - last["time"] < PROGRESS_INTERVAL:
+            return
+        last.update(stage=stage, time=now)
+
+        if job_id in cancelled:
+            raise ParseCancelled(job_id)
+        status[job_id] = (stage, done, total)
+
+    with collecting() as metrics:
+        try:
+            if job_id in cancelled:
+                items = None
+            else:
+                with reporting(callback):
+                    items = parse_receipt(data, is_webarchive, store, encoding=encoding)
+        except ParseCancelled:
+            items = None
+    return items, metrics.snapshot()
+
+
+def _main_document(data: Buffer, is_webarchive: bool) -> Tuple[Buffer, bool, Optional[str]]:
+    """
+    Pull the main HTML document out of a web archive, as a view into data
+
+    Returns:
+        Tuple of (the HTML, whether it is still a web archive, its declared
+        text encoding); an archive that cannot be read is returned unchanged,
+        so the worker reports it like any other invalid receipt
+    """
+    if not is_webarchive:
+        return data, False, None
+    try:
+        html, encoding = read_main_resource(data)
+    except WebArchiveError:
+        return data, True, None
+    if html is None:
+        return data, True, None
+    return html, False, encoding
+
+
+class ParseJob:
+    """
+    A receipt being parsed by a ParsePool
+
+    Args:
+        key: Identifies the receipt (usually its content hash)
+        future: Future of the worker call
+        pool: Pool running the job
+        executor: Workers the job was submitted to
+    """
+
+    def __init__(
+        self,
+        key: Hashable,
+        future: Future,
+        pool: "ParsePool",
+        executor: Optional[ProcessPoolExecutor] = None,
+    ):
+        self.key = key
+        self.job_id = str(key)
+        self.future = future
+        self.pool = pool
+        self.executor = executor
+        self.submitted = time.monotonic()
+        # Sessions waiting for the result; the job is only cancelled once all of them gave up
+        self.waiters = set()
+        self.cancelled = False
+        # Set when the parse failed or its worker process died (see result)
+        self.error: Optional[str] = None
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def result(self) -> Optional[List[OrderItem]]:
+        """
+        Return the parsed items (None if cancelled); blocks until the job is done
+
+        A worker process dying (killed for memory, or crashing in the parser)
+        or the parse raising is a parse error like any other: it is logged,
+        error is set and no items are returned. After a worker died, the pool
+        starts new workers for later jobs.
+        """
+        if self.future.cancelled():
+            return None
+        try:
+            items, _ = self.future.result()
+        except BrokenProcessPool as e:
+            logger.error(f"Worker process died while parsing receipt {self.job_id}: {e}")
+            self.error = "The parser stopped unexpectedly while reading this receipt"
+            self.pool.discard(self.executor)
+            return []
+        except Exception as e:
+            # Raised by the parse itself; the workers are fine
+            logger.error(f"Error parsing receipt {self.job_id}: {type(e).__name__}: {e}")
+            self.error = "The parser could not read this receipt"
+            return []
+        return items
+
+    def progress(self) -> Tuple[str, int, int]:
+        """Return (stage, rows done, rows total); the stage is "queued" before a worker picks the job up"""
+        return self.pool.status(self)
+
+    def cancel(self, waiter: Hashable = None) -> None:
+        self.pool.cancel(self, waiter)
+
+
+class ParsePool:
+    """
+    Bounded pool of worker processes parsing receipts for every session.
+
+    Parsing runs outside the Streamlit server process, so a large receipt
+    neither blocks the script thread nor competes for the GIL with other
+    sessions. At most max_workers receipts are parsed at once; further
+    uploads wait in the queue. Uploading a receipt that is already being
+    parsed joins the running job, which is only cancelled once every session
+    waiting for it cancelled.
+
+    Args:
+        max_workers: Number of worker processes
+    """
+
+    def __init__(self, max_workers: int = 2):
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._jobs: Dict[Hashable, ParseJob] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self._status = None
+        self._cancelled = None
+
+    def _start(self) -> None:
+        """Start the workers, and the shared progress state on first use (lock held)"""
+        # spawn: forking the multi-threaded server process is unsafe
+        context = multiprocessing.get_context("spawn")
+        if self._manager is None:
+            self._manager = context.Manager()
+            self._status = self._manager.dict()
+            self._cancelled = self._manager.dict()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers, mp_context=context, initializer=_quiet_worker
+        )
+
+    def discard(self, executor: Optional[ProcessPoolExecutor]) -> None:
+        """
+        Drop workers that broke (a worker process died), so the next job starts new ones
+
+        Every job still running on them fails, which their sessions show as a
+        parse error; jobs submitted afterwards run on the new workers.
+        """
+        with self._lock:
+            if executor is None or self._executor is not executor:
+                return
+            self._executor = None
+        logger.warning("A parse worker process died, starting new workers for the next receipts")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(
+        self,
+        key: Hashable,
+        data: Buffer,
+        is_webarchive: bool,
+        store: Optional[str] = None,
+        waiter: Hashable = None,
+    ) -> ParseJob:
+        """
+        Queue a receipt for parsing, or return the job already parsing it
+
+        Only the main HTML document of a web archive is sent to the worker: the
+        archive is read here, in place, and its images and scripts are neither
+        copied nor pickled.
+
+        Args:
+            key: Identifies the receipt (usually its content hash)
+            data: Raw receipt contents (bytes, memoryview or mmap)
+            is_webarchive: Whether the bytes are a Safari .webarchive plist
+            store: Restrict detection to one store key (None to auto-detect)
+            waiter: Identifies the session waiting for the result
+        """
+        data, is_webarchive, encoding = _main_document(data, is_webarchive)
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and not job.cancelled and (not job.done() or job.future.exception() is None):
+                job.waiters.add(waiter)
+                return job
+
+            if self._executor is None:
+                self._start()
+
+            job_id = str(key)
+            self._cancelled.pop(job_id, None)
+            args = (_run_parse, job_id, bytes(data), is_webarchive, store, encoding, self._status, self._cancelled)
+            try:
+                future = self._executor.submit(*args)
+            except BrokenProcessPool:
+                # A worker died since the last job; nobody collected a result to notice
+                logger.warning("A parse worker process died, starting new workers")
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._start()
+                future = self._executor.submit(*args)
+            job = ParseJob(key, future, self, self._executor)
+            job.waiters.add(waiter)
+            self._jobs[key] = job
+            future.add_done_callback(lambda _: self._forget(job))
+            return job
+
+    def _forget(self, job: ParseJob) -> None:
+        """Drop a finished job once its result has had time to be collected"""
+        # The worker's parse metrics join this process's, whoever collects the result
+        if not job.future.cancelled() and job.future.exception() is None:
+            merge_metrics(job.future.result()[1])
+
+        try:
+            self._status.pop(job.job_id, None)
+        except (OSError, EOFError):
+            # The manager is already shut down
+            pass
+
+        def drop() -> None:
+            with self._lock:
+                if self._jobs.get(job.key) is job:
+                    del self._jobs[job.key]
+
+        # Sessions polling the job pick the result up well within a minute
+        timer = threading.Timer(60, drop)
+        timer.daemon = True
+        timer.start()
+
+    def get(self, key: Hashable) -> Optional[ParseJob]:
+        """Return the job for a receipt, if one is queued, running or recently finished"""
+        with self._lock:
+            return self._jobs.get(key)
+
+    def status(self, job: ParseJob) -> Tuple[str, int, int]:
+        if job.done():
+            return ("done", 1, 1)
+        try:
+            return tuple(self._status.get(job.job_id, (QUEUED, 0, 0)))
+        except (OSError, EOFError):
+            return (QUEUED, 0, 0)
+
+    def queued_ahead(self, job: ParseJob) -> int:
+        """Number of jobs waiting or running that were submitted before this one, beyond the free workers"""
+        with self._lock:
+            ahead = sum(
+                1 for other in self._jobs.values()
+                if other is not job and not other.done() and other.submitted < job.submitted
+            )
+        return max(0, ahead - self.max_workers + 1)
+
+    def cancel(self, job: ParseJob, waiter: Hashable = None) -> None:
+        """
+        Stop waiting for a job, cancelling it when no other session waits for it
+
+        A queued job is dropped from the queue; a running one stops at its next
+        progress report.
+        """
+        with self._lock:
+            job.waiters.discard(waiter)
+            if job.waiters or job.done():
+                return
+            job.cancelled = True
+
+        if not job.future.cancel():
+            self._cancelled[job.job_id] = True
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            if self._manager is not None:
+                self._manager.shutdown()
+                self._manager = None